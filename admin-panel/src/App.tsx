@@ -1,11 +1,20 @@
 import { useEffect, useMemo, useState } from 'react';
 import { useMutation, useQuery, useQueryClient } from '@tanstack/react-query';
-import { adminLogin, fetchStats, fetchUsers, sendPushNotification } from './api';
-import { AdminSession, Stats, UserProfile } from './types';
+import {
+  adminLogin,
+  cancelNotificationJob,
+  fetchNotificationJob,
+  fetchStats,
+  fetchUsers,
+  isNotificationJobActive,
+  sendPushNotification
+} from './api';
+import { AdminSession, NotificationJob, Stats, UserProfile } from './types';
 import Dashboard from './components/Dashboard';
 import LoginView from './components/LoginView';
 
 const STORAGE_KEY = 'modli_admin_session_v1';
+const NOTIFICATION_JOB_POLL_MS = 1500;
 
 function loadSession(): AdminSession | null {
   try {
@@ -29,6 +38,7 @@ export default function App() {
   const [session, setSession] = useState<AdminSession | null>(() => loadSession());
   const [page, setPage] = useState(1);
   const [search, setSearch] = useState('');
+  const [notificationJobId, setNotificationJobId] = useState<string | null>(null);
 
   const {
     data: usersResponse,
@@ -59,8 +69,24 @@ export default function App() {
   const notificationMutation = useMutation({
     mutationFn: (payload: { title: string; body: string; userId?: string | null }) =>
       sendPushNotification({ token: session!.token, ...payload }),
-    onSuccess: () => {
-      // no-op, backend is async placeholder
+    onSuccess: (job) => {
+      queryClient.setQueryData(['notification-job', session?.token, job.job_id], job);
+      setNotificationJobId(job.job_id);
+    }
+  });
+
+  // Gönderim arka plan işidir: bitene kadar ilerleme sorgulanır
+  const { data: notificationJob } = useQuery<NotificationJob>({
+    queryKey: ['notification-job', session?.token, notificationJobId],
+    queryFn: () => fetchNotificationJob(session!.token, notificationJobId!),
+    enabled: Boolean(session?.token && notificationJobId),
+    refetchInterval: (query) => (isNotificationJobActive(query.state.data) ? NOTIFICATION_JOB_POLL_MS : false)
+  });
+
+  const cancelNotificationMutation = useMutation({
+    mutationFn: (jobId: string) => cancelNotificationJob(session!.token, jobId),
+    onSuccess: (job) => {
+      queryClient.setQueryData(['notification-job', session?.token, job.job_id], job);
     }
   });
 
@@ -75,6 +101,10 @@ export default function App() {
   const handleSendNotification = (title: string, body: string, userId?: string | null) =>
     notificationMutation.mutate({ title, body, userId });
 
+  const handleCancelNotification = () => {
+    if (notificationJobId) cancelNotificationMutation.mutate(notificationJobId);
+  };
+
   const handlePageChange = (nextPage: number) => {
     setPage(nextPage);
   };
@@ -115,6 +145,10 @@ export default function App() {
         onPageChange={handlePageChange}
         notificationSending={notificationMutation.isPending}
         notificationError={notificationMutation.error as Error | null}
+        notificationJob={notificationJob}
+        onCancelNotification={handleCancelNotification}
+        notificationCancelling={cancelNotificationMutation.isPending}
+        notificationCancelError={cancelNotificationMutation.error as Error | null}
       />
     </div>
   );
@@ -1,5 +1,5 @@
 import axios, { AxiosError } from 'axios';
-import { AdminSession, Stats, UserProfile } from './types';
+import { AdminSession, NotificationJob, Stats, UserProfile } from './types';
 
 const baseURL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8000';
 
@@ -113,16 +113,44 @@ export async function sendPushNotification(params: {
   body: string;
   userId?: string | null;
   data?: Record<string, string | number>;
-}): Promise<void> {
+}): Promise<NotificationJob> {
   const { token, title, body, userId, data } = params;
   try {
-    await api.post(
+    const { data: job } = await api.post<NotificationJob>(
       '/api/admin/notifications/send',
       { title, body, user_id: userId || null, data },
       { headers: buildHeaders(token) }
     );
+    return job;
   } catch (error) {
     handleError(error);
   }
 }
 
+export async function fetchNotificationJob(token: string, jobId: string): Promise<NotificationJob> {
+  try {
+    const { data } = await api.get<NotificationJob>(`/api/admin/notifications/jobs/${jobId}`, {
+      headers: buildHeaders(token)
+    });
+    return data;
+  } catch (error) {
+    handleError(error);
+  }
+}
+
+export async function cancelNotificationJob(token: string, jobId: string): Promise<NotificationJob> {
+  try {
+    const { data } = await api.post<NotificationJob>(
+      `/api/admin/notifications/jobs/${jobId}/cancel`,
+      {},
+      { headers: buildHeaders(token) }
+    );
+    return data;
+  } catch (error) {
+    handleError(error);
+  }
+}
+
+export function isNotificationJobActive(job?: NotificationJob | null): boolean {
+  return job?.status === 'queued' || job?.status === 'running';
+}
@@ -1,5 +1,5 @@
 import NotificationForm from './NotificationForm';
-import { Stats, UserProfile } from '../types';
+import { NotificationJob, Stats, UserProfile } from '../types';
 
 type Props = {
   adminEmail: string;
@@ -17,6 +17,10 @@ type Props = {
   onPageChange: (page: number) => void;
   notificationSending: boolean;
   notificationError: Error | null;
+  notificationJob?: NotificationJob | null;
+  onCancelNotification: () => void;
+  notificationCancelling: boolean;
+  notificationCancelError: Error | null;
 };
 
 export default function Dashboard({
@@ -34,7 +38,11 @@ export default function Dashboard({
   onSearchChange,
   onPageChange,
   notificationSending,
-  notificationError
+  notificationError,
+  notificationJob,
+  onCancelNotification,
+  notificationCancelling,
+  notificationCancelError
 }: Props) {
   return (
     <div className="grid" style={{ gap: 'var(--space-3)' }}>
@@ -89,6 +97,10 @@ export default function Dashboard({
             loading={notificationSending}
             onSend={onSendNotification}
             error={notificationError}
+            job={notificationJob}
+            onCancel={onCancelNotification}
+            cancelling={notificationCancelling}
+            cancelError={notificationCancelError}
           />
         </div>
       </section>
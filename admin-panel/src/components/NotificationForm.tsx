@@ -1,14 +1,29 @@
 import { FormEvent, useMemo, useState } from 'react';
-import { UserProfile } from '../types';
+import { NotificationJob, UserProfile } from '../types';
+import { isNotificationJobActive } from '../api';
+import NotificationJobStatus from './NotificationJobStatus';
 
 type Props = {
   users: UserProfile[];
   onSend: (title: string, body: string, userId?: string | null) => void;
   loading: boolean;
   error: Error | null;
+  job?: NotificationJob | null;
+  onCancel: () => void;
+  cancelling: boolean;
+  cancelError: Error | null;
 };
 
-export default function NotificationForm({ users, onSend, loading, error }: Props) {
+export default function NotificationForm({
+  users,
+  onSend,
+  loading,
+  error,
+  job,
+  onCancel,
+  cancelling,
+  cancelError
+}: Props) {
   const [title, setTitle] = useState('');
   const [body, setBody] = useState('');
   const [targetUser, setTargetUser] = useState<string>('all');
@@ -18,6 +33,7 @@ export default function NotificationForm({ users, onSend, loading, error }: Prop
       [...users].sort((a, b) => (a.email || '').localeCompare(b.email || '', 'tr', { sensitivity: 'base' })),
     [users]
   );
+  const jobActive = isNotificationJobActive(job);
 
   const handleSubmit = (e: FormEvent<HTMLFormElement>) => {
     e.preventDefault();
@@ -67,13 +83,16 @@ export default function NotificationForm({ users, onSend, loading, error }: Prop
           </select>
         </div>
         {error ? <div className="pill danger">{error.message}</div> : null}
-        <button type="submit" className="btn" disabled={loading}>
-          {loading ? 'Gönderiliyor…' : 'Gönder'}
+        <button type="submit" className="btn" disabled={loading || jobActive}>
+          {loading ? 'Kuyruğa alınıyor…' : jobActive ? 'Gönderim sürüyor…' : 'Gönder'}
         </button>
         <p className="muted" style={{ margin: 0, fontSize: 12 }}>
-          Not: Bildirimler kayıtlı push token’lara Expo Push ile gönderilir.
+          Not: Bildirimler kayıtlı push token’lara Expo Push ile arka planda gönderilir.
         </p>
       </form>
+      {job ? (
+        <NotificationJobStatus job={job} onCancel={onCancel} cancelling={cancelling} error={cancelError} />
+      ) : null}
     </div>
   );
 }
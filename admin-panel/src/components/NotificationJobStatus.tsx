@@ -0,0 +1,62 @@
+import { isNotificationJobActive } from '../api';
+import { NotificationJob } from '../types';
+
+type Props = {
+  job: NotificationJob;
+  onCancel: () => void;
+  cancelling: boolean;
+  error: Error | null;
+};
+
+const STATUS_LABELS: Record<NotificationJob['status'], string> = {
+  queued: 'Kuyrukta',
+  running: 'Gönderiliyor',
+  succeeded: 'Tamamlandı',
+  failed: 'Başarısız',
+  cancelled: 'İptal edildi'
+};
+
+const STATUS_TONES: Record<NotificationJob['status'], string> = {
+  queued: 'neutral',
+  running: 'neutral',
+  succeeded: 'success',
+  failed: 'danger',
+  cancelled: 'danger'
+};
+
+export default function NotificationJobStatus({ job, onCancel, cancelling, error }: Props) {
+  const active = isNotificationJobActive(job);
+  const processed = job.sent + job.failed;
+
+  return (
+    <div className="stack">
+      <div className="card-header">
+        <span className={`pill ${STATUS_TONES[job.status]}`}>
+          {job.cancel_requested && active ? 'İptal ediliyor…' : STATUS_LABELS[job.status]}
+        </span>
+        {active ? (
+          <button
+            type="button"
+            className="btn danger"
+            onClick={onCancel}
+            disabled={cancelling || job.cancel_requested}
+          >
+            {cancelling ? 'İptal ediliyor…' : 'İptal Et'}
+          </button>
+        ) : null}
+      </div>
+      <p className="muted" style={{ margin: 0 }}>
+        {job.total === null ? 'Alıcılar hesaplanıyor…' : `${processed} / ${job.total} işlendi`} • Gönderilen:{' '}
+        {job.sent} • Başarısız: {job.failed}
+        {job.remaining ? ` • Kalan: ${job.remaining}` : ''}
+      </p>
+      {job.error ? <div className="pill danger">{job.error}</div> : null}
+      {job.errors.length ? (
+        <p className="muted" style={{ margin: 0, fontSize: 12 }}>
+          Son hata: {job.errors[job.errors.length - 1]}
+        </p>
+      ) : null}
+      {error ? <div className="pill danger">{error.message}</div> : null}
+    </div>
+  );
+}
@@ -32,6 +32,24 @@ export type Stats = {
   };
 };
 
+export type NotificationJob = {
+  job_id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  title?: string;
+  body?: string;
+  target_user_id?: string | null;
+  total: number | null;
+  sent: number;
+  failed: number;
+  remaining: number | null;
+  cancel_requested: boolean;
+  errors: string[];
+  error?: string | null;
+  created_at?: string;
+  started_at?: string | null;
+  finished_at?: string | null;
+};
+
 export type AdminSession = {
   token: string;
   email: string;
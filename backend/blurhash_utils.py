@@ -0,0 +1,83 @@
+"""
+BlurHash (https://blurha.sh) kodlayıcısı.
+server.py'den bağımsızdır; backfill script'leri ortam değişkeni (MONGO_URL, DB_NAME, ...) gerektirmeden
+import edebilir.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+BLURHASH_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _encode_base83(value: int, length: int) -> str:
+    return "".join(BLURHASH_CHARACTERS[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def compute_blurhash(image: Image.Image, components: int = 4) -> str:
+    """
+    RGB görselden BlurHash üretir (https://blurha.sh). Kosinüs katsayıları NumPy ile tek seferde hesaplanır.
+    Uzun kenar `components`, kısa kenar bir eksik bileşen alır; hesap 64px'e küçültülmüş kopya üzerinde yapılır.
+    """
+    small = image.convert('RGB') if image.mode != 'RGB' else image.copy()
+    small.thumbnail((64, 64), Image.Resampling.BILINEAR)
+    width, height = small.size
+    components_x, components_y = (components, components - 1) if width >= height else (components - 1, components)
+
+    srgb = np.asarray(small, dtype=np.float64) / 255.0
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+    basis_x = np.cos(np.pi * np.arange(components_x)[:, None] * np.arange(width)[None, :] / width)
+    basis_y = np.cos(np.pi * np.arange(components_y)[:, None] * np.arange(height)[None, :] / height)
+    # factors[j, i, c] = sum_y sum_x basis_y[j, y] * basis_x[i, x] * linear[y, x, c]
+    factors = np.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+    factors[1:, :, :] *= 2
+    factors[:, 1:, :] *= 2
+    factors[1:, 1:, :] /= 2  # (0,0) dışındaki her bileşen için normalizasyon 2
+    factors = factors.reshape(components_x * components_y, 3)
+
+    dc, ac = factors[0], factors[1:]
+
+    def linear_to_srgb(value: float) -> int:
+        value = min(max(value, 0.0), 1.0)
+        if value <= 0.0031308:
+            return int(value * 12.92 * 255 + 0.5)
+        return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+    result = _encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _encode_base83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _encode_base83(0, 1)
+
+    result += _encode_base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+
+    scaled = ac / max_value
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quantised:
+        result += _encode_base83(int(r) * 19 * 19 + int(g) * 19 + int(b), 2)
+    return result
+
+
+def blurhash_from_bytes(image_data: bytes, max_pixels: int = 50_000_000) -> str:
+    """
+    Kodlanmış görselden BlurHash (backfill için). EXIF yönü uygulanır, saydam alanlar beyaz zemine oturtulur;
+    JPEG'ler en küçük DCT ölçeğinde açılır. max_pixels'i aşan görseller decode edilmeden reddedilir (ValueError).
+    """
+    image = Image.open(io.BytesIO(image_data))
+    if image.width * image.height > max_pixels:
+        raise ValueError(f"Image too large: {image.width}x{image.height} exceeds {max_pixels} pixels")
+    if image.format == "JPEG":
+        image.draft("RGB", (64, 64))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    return compute_blurhash(image)
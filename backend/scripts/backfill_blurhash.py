@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from supabase import create_client, Client
+
+# Bu script blurhash alanı boş olan wardrobe_items kayıtları için thumbnail'ı
+# (yoksa tam boy görseli) indirip BlurHash hesaplar ve kayda yazar.
+# Önce database/migrations/add_wardrobe_blurhash.sql çalıştırılmış olmalı.
+# Gerekli ortam: SUPABASE_URL, SUPABASE_KEY (service key); IMAGE_MAX_PIXELS opsiyonel.
+#
+# KULLANIM:
+#   python backend/scripts/backfill_blurhash.py
+#   python backend/scripts/backfill_blurhash.py --dry-run --limit 50
+#
+# Not: Script idempotent; yalnızca blurhash IS NULL olan kayıtlara dokunur.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# server.py yerine yalnızca kodlayıcı modülü: MongoDB/uygulama ayarları gerekmez
+from blurhash_utils import blurhash_from_bytes  # noqa: E402
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+
+def get_supabase() -> Client:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("SUPABASE_URL veya SUPABASE_KEY eksik")
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def compute_for_row(http: httpx.Client, row: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[str]]:
+    url = row.get("thumbnail_url") or row.get("image_url")
+    if not url or str(url).startswith("data:"):
+        return row["id"], None, "no storage url"
+    try:
+        resp = http.get(url)
+        resp.raise_for_status()
+        return row["id"], blurhash_from_bytes(resp.content, IMAGE_MAX_PIXELS), None
+    except Exception as e:
+        return row["id"], None, str(e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill wardrobe_items.blurhash")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=0, help="En fazla işlenecek kayıt (0: hepsi)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    supabase = get_supabase()
+    updated = 0
+    failed = 0
+    last_id = None
+
+    with httpx.Client(timeout=30.0, follow_redirects=True) as http, ThreadPoolExecutor(args.workers) as pool:
+        while True:
+            query = (
+                supabase.table("wardrobe_items")
+                .select("id, thumbnail_url, image_url")
+                .is_("blurhash", "null")
+                .order("id")
+                .limit(args.batch_size)
+            )
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = query.execute().data or []
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            for row_id, blurhash, error in pool.map(lambda row: compute_for_row(http, row), rows):
+                if error:
+                    failed += 1
+                    print(f"{row_id}: skipped ({error})")
+                    continue
+                if not args.dry_run:
+                    supabase.table("wardrobe_items").update({"blurhash": blurhash}).eq("id", row_id).execute()
+                updated += 1
+
+            print(f"processed up to {last_id}: updated={updated}, failed={failed}")
+            if args.limit and updated + failed >= args.limit:
+                break
+
+    print(f"wardrobe_items: updated={updated}, failed={failed}{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+import PIL
+
+# Görsel işleme hattının (create_thumbnail, base64 dönüşümleri, varyant/yeniden kodlama)
+# mikro benchmark'ı. Sentetik bir korpus (ve isteğe bağlı örnek fotoğraflar) üzerinde
+# her işlem için throughput, p50/p99 gecikme ve tepe bellek kullanımını ölçer, sonucu
+# JSON olarak yazar. Ağ, MongoDB veya Supabase gerekmez.
+#
+# KULLANIM:
+#   python backend/scripts/bench_image_pipeline.py --output bench.json
+#   python backend/scripts/bench_image_pipeline.py --samples ~/photos --iterations 20
+#   python backend/scripts/bench_image_pipeline.py --output new.json --compare old.json
+#   python backend/scripts/bench_image_pipeline.py --operations create_thumbnail,create_thumbnail_baseline
+#
+# *_baseline işlemleri, optimizasyon öncesi (a32db39) uygulamanın bu dosyadaki kopyasıdır; ikisi birlikte
+# çalıştırılınca aynı koşuda p50 karşılaştırması yazdırılır (önceki bir JSON gerekmez).
+#
+# Not: tracemalloc yalnızca Python heap'ini (çıktı byte'ları, BytesIO) görür; Pillow'un
+# piksel tamponları için /proc/self/statm örneklenerek RSS artışı ayrıca raporlanır (Linux).
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import server  # noqa: E402
+
+
+def photo_like(width: int, height: int, seed: int) -> Image.Image:
+    """Gradyan + gürültü: JPEG sıkıştırması açısından gerçek fotoğraflara yakın içerik"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, x * 0.5 + y * 0.5, 255 - y + 0 * x], axis=-1)
+    pixels += rng.normal(0, 6, (height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, fmt: str, **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=fmt, **options)
+    return output.getvalue()
+
+
+def build_corpus(samples_dir: Optional[str]) -> Dict[str, bytes]:
+    corpus: Dict[str, bytes] = {}
+
+    corpus["jpeg_12mp"] = encode(photo_like(4032, 3024, 1), "JPEG", quality=92)
+    corpus["jpeg_3mp"] = encode(photo_like(2048, 1536, 2), "JPEG", quality=90)
+    corpus["jpeg_640"] = encode(photo_like(640, 480, 3), "JPEG", quality=85)
+
+    # Yönü EXIF ile belirtilmiş telefon fotoğrafı
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    corpus["jpeg_3mp_exif_rotated"] = encode(photo_like(2048, 1536, 4), "JPEG", quality=90, exif=exif.tobytes())
+
+    # Saydam PNG (kıyafet dekupajı)
+    rgba = photo_like(1500, 1500, 5).convert("RGBA")
+    alpha = np.zeros((1500, 1500), dtype=np.uint8)
+    alpha[200:1300, 300:1200] = 255
+    rgba.putalpha(Image.fromarray(alpha))
+    corpus["png_rgba_1500"] = encode(rgba, "PNG")
+
+    corpus["png_palette_1024"] = encode(photo_like(1024, 1024, 6).quantize(colors=64), "PNG")
+    corpus["webp_1080"] = encode(photo_like(1080, 1440, 7), "WEBP", quality=80)
+
+    if samples_dir:
+        for name in sorted(os.listdir(samples_dir)):
+            path = os.path.join(samples_dir, name)
+            if os.path.isfile(path) and name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+                with open(path, "rb") as fh:
+                    corpus[f"sample_{name}"] = fh.read()
+
+    return corpus
+
+
+def create_thumbnail_baseline(image_data: bytes, size: tuple = (300, 300)) -> bytes:
+    """a32db39'daki create_thumbnail: verify() + ikinci tam decode, draft()/piksel sınırı yok"""
+    if not image_data:
+        raise ValueError("Empty image data")
+    image_stream = io.BytesIO(image_data)
+    try:
+        image = Image.open(image_stream)
+        image.verify()
+    except Exception as img_error:
+        raise ValueError(f"Cannot identify image file: {str(img_error)}")
+    image_stream.seek(0)
+    image = Image.open(image_stream)
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        image = background
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+# Aynı koşuda karşılaştırılan (baseline, güncel) işlem çiftleri
+BASELINE_PAIRS = [("create_thumbnail_baseline", "create_thumbnail")]
+
+
+def variant_formats() -> List[str]:
+    return ["jpeg"] + [f for f in server.supported_variant_formats(server.IMAGE_VARIANT_FORMATS) if f != "jpeg"]
+
+
+def build_operations() -> Dict[str, Callable[[bytes, Any], Any]]:
+    """İşlem adı -> (girdi, hazırlanmış girdi) alan fonksiyon"""
+    sizes = sorted(set(server.IMAGE_VARIANT_SIZES) | {300})
+    formats = variant_formats()
+    return {
+        "create_thumbnail": lambda data, _: server.create_thumbnail(data, (300, 300)),
+        "create_thumbnail_baseline": lambda data, _: create_thumbnail_baseline(data, (300, 300)),
+        "process_upload_variants": lambda data, _: server.process_uploaded_image(data, sizes, formats, False),
+        "process_upload_recompress": lambda data, _: server.process_uploaded_image(data, sizes, formats, True),
+        "normalize_tryon_image": lambda data, _: server.normalize_tryon_image(
+            data, server.TRYON_INPUT_MAX_EDGE, server.TRYON_INPUT_QUALITY
+        ),
+        "bytes_to_base64": lambda data, _: server.bytes_to_base64(data),
+        "base64_to_bytes": lambda _data, prepared: server.base64_to_bytes(prepared),
+    }
+
+
+def prepare_input(operation: str, data: bytes) -> Any:
+    if operation == "base64_to_bytes":
+        return server.bytes_to_base64(data)
+    return None
+
+
+def read_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class RSSSampler:
+    """Bir işlem süresince RSS'i örnekleyip başlangıca göre tepe artışı bulur"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.baseline = read_rss()
+        self.peak = self.baseline
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = read_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        rss = read_rss()
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+
+    @property
+    def delta(self) -> Optional[int]:
+        if self.baseline is None or self.peak is None:
+            return None
+        return self.peak - self.baseline
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """En yakın sıra (nearest-rank) yüzdeliği"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(np.ceil(pct / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def run_case(fn: Callable, data: bytes, prepared: Any, iterations: int, warmup: int) -> Dict[str, Any]:
+    try:
+        for _ in range(warmup):
+            fn(data, prepared)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(data, prepared)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    # Bellek ölçümü ayrı bir çalıştırmada (tracemalloc süreleri bozar)
+    tracemalloc.start()
+    with RSSSampler() as sampler:
+        fn(data, prepared)
+    _current, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "mean_ms": round(total / iterations * 1000, 3),
+        "min_ms": round(timings[0] * 1000, 3),
+        "ops_per_sec": round(iterations / total, 2) if total else None,
+        "input_mb_per_sec": round(len(data) * iterations / total / 1e6, 2) if total else None,
+        "python_peak_bytes": python_peak,
+        "rss_peak_delta_bytes": sampler.delta,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> List[Tuple[str, str, float, float]]:
+    rows = []
+    for operation, cases in current["results"].items():
+        for case, result in cases.items():
+            old = previous.get("results", {}).get(operation, {}).get(case)
+            if old and "p50_ms" in old and "p50_ms" in result:
+                rows.append((operation, case, old["p50_ms"], result["p50_ms"]))
+    return rows
+
+
+def compare_baselines(report: Dict[str, Any]) -> List[Tuple[str, str, float, float]]:
+    """Aynı koşudaki baseline ve güncel işlemlerin p50'leri"""
+    rows = []
+    for baseline, operation in BASELINE_PAIRS:
+        previous = {"results": {operation: report["results"].get(baseline, {})}}
+        rows.extend(compare(previous, {"results": {operation: report["results"].get(operation, {})}}))
+    return rows
+
+
+def print_comparison(title: str, rows: List[Tuple[str, str, float, float]]) -> None:
+    if not rows:
+        return
+    print(f"\n{title}", file=sys.stderr)
+    for operation, case, old_p50, new_p50 in rows:
+        ratio = new_p50 / old_p50 if old_p50 else float("inf")
+        print(f"{operation:28s} {case:24s} {old_p50:9.2f}ms -> {new_p50:9.2f}ms  x{ratio:.2f}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Image pipeline micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--samples", help="Ek örnek fotoğrafların bulunduğu dizin")
+    parser.add_argument("--operations", help="Virgülle ayrılmış işlem adları (varsayılan: hepsi)")
+    parser.add_argument("--output", help="Sonuç JSON dosyası (varsayılan: stdout)")
+    parser.add_argument("--compare", help="Karşılaştırılacak önceki sonuç JSON dosyası")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.samples)
+    operations = build_operations()
+    if args.operations:
+        selected = [name.strip() for name in args.operations.split(",")]
+        operations = {name: fn for name, fn in operations.items() if name in selected}
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "variant_sizes": server.IMAGE_VARIANT_SIZES,
+            "variant_formats": variant_formats(),
+            "full_image_max_edge": server.FULL_IMAGE_MAX_EDGE,
+            "full_image_max_bytes": server.FULL_IMAGE_MAX_BYTES,
+        },
+        "corpus": {},
+        "results": {},
+    }
+
+    for case, data in corpus.items():
+        with Image.open(io.BytesIO(data)) as image:
+            report["corpus"][case] = {"bytes": len(data), "format": image.format, "mode": image.mode, "size": image.size}
+
+    for operation, fn in operations.items():
+        report["results"][operation] = {}
+        for case, data in corpus.items():
+            result = run_case(fn, data, prepare_input(operation, data), args.iterations, args.warmup)
+            report["results"][operation][case] = result
+            if "error" in result:
+                print(f"{operation:28s} {case:24s} error: {result['error']}", file=sys.stderr)
+            else:
+                print(
+                    f"{operation:28s} {case:24s} p50={result['p50_ms']:9.2f}ms p99={result['p99_ms']:9.2f}ms "
+                    f"{result['ops_per_sec']:8.1f} ops/s",
+                    file=sys.stderr,
+                )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output)
+        print(f"Sonuçlar yazıldı: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    print_comparison("p50 karşılaştırması (baseline -> güncel, aynı koşu):", compare_baselines(report))
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)
+        print_comparison("p50 karşılaştırması (önceki -> şimdiki):", compare(previous, report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,40 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, Header
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, JSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import os
 import logging
+import asyncio
+import time
+import hashlib
+import json
+import gzip
+import random
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterable, Union, AsyncIterable
 import uuid
 from datetime import datetime, timedelta
 import httpx
 import base64
-from PIL import Image
+from urllib.parse import quote, urlparse
+from PIL import Image, ImageOps
 import io
 from passlib.context import CryptContext
 import secrets
+import jwt
+
+from blurhash_utils import compute_blurhash
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -35,8 +53,125 @@ SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY', '')
 ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', 'modli-admin-secret-token-change-in-production')
 EXPO_ACCESS_TOKEN = os.environ.get('EXPO_ACCESS_TOKEN', '')
 PUSH_TOKEN_TABLE = os.environ.get('PUSH_TOKEN_TABLE', 'push_tokens')
+PUSH_TOKEN_PAGE_SIZE = int(os.environ.get('PUSH_TOKEN_PAGE_SIZE', '1000'))
+
+# push_tokens'ın MongoDB kopyası (push_tokens_mirror); süreler saniye
+PUSH_MIRROR_ENABLED = os.environ.get('PUSH_MIRROR_ENABLED', 'true').lower() == 'true'
+PUSH_MIRROR_SYNC_INTERVAL = int(os.environ.get('PUSH_MIRROR_SYNC_INTERVAL', '60'))
+PUSH_MIRROR_FULL_SYNC_INTERVAL = int(os.environ.get('PUSH_MIRROR_FULL_SYNC_INTERVAL', '86400'))
+PUSH_MIRROR_SYNC_OVERLAP = int(os.environ.get('PUSH_MIRROR_SYNC_OVERLAP', '120'))
+# Silinen satırlar için satır sayısı karşılaştırması aralığı (saniye); sayılar farklıysa tam senkron çalışır
+PUSH_MIRROR_RECONCILE_INTERVAL = int(os.environ.get('PUSH_MIRROR_RECONCILE_INTERVAL', '900'))
 APP_LOGO_URL = os.environ.get('APP_LOGO_URL', '')  # Modli logo URL'i (Supabase storage veya public URL)
 
+# Supabase Auth doğrulama modu:
+#   remote -> her istekte SUPABASE_URL/auth/v1/user çağrılır (varsayılan)
+#   local  -> access token JWT secret veya JWKS ile yerel olarak doğrulanır
+#   hybrid -> önce yerel doğrulama, anahtar bulunamazsa remote'a düşer
+SUPABASE_AUTH_MODE = os.environ.get('SUPABASE_AUTH_MODE', 'remote').strip().lower()
+SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET', '')
+SUPABASE_JWT_AUDIENCE = os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated')
+SUPABASE_JWT_ISSUER = os.environ.get('SUPABASE_JWT_ISSUER', f"{SUPABASE_URL.rstrip('/')}/auth/v1" if SUPABASE_URL else '')
+SUPABASE_JWKS_CACHE_TTL = int(os.environ.get('SUPABASE_JWKS_CACHE_TTL', '600'))
+
+# Remote doğrulanan token'lar için önbellek (token hash -> user); TTL token'ın exp'i ile sınırlıdır
+AUTH_CACHE_ENABLED = os.environ.get('AUTH_CACHE_ENABLED', 'true').lower() == 'true'
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', '300'))
+AUTH_CACHE_NEGATIVE_TTL = int(os.environ.get('AUTH_CACHE_NEGATIVE_TTL', '10'))
+
+# Arka plan try-on işleri (POST /api/try-on/jobs)
+TRYON_JOB_WORKERS = int(os.environ.get('TRYON_JOB_WORKERS', '4'))
+TRYON_JOB_MAX_PENDING = int(os.environ.get('TRYON_JOB_MAX_PENDING', '200'))
+TRYON_JOB_MAX_ATTEMPTS = int(os.environ.get('TRYON_JOB_MAX_ATTEMPTS', '2'))
+TRYON_JOB_LEASE_SECONDS = int(os.environ.get('TRYON_JOB_LEASE_SECONDS', '600'))
+
+# Arka plan push bildirim gönderimleri (POST /api/admin/notifications/send)
+PUSH_JOB_WORKERS = int(os.environ.get('PUSH_JOB_WORKERS', '1'))
+PUSH_JOB_LEASE_SECONDS = int(os.environ.get('PUSH_JOB_LEASE_SECONDS', '300'))
+PUSH_JOB_MAX_ATTEMPTS = int(os.environ.get('PUSH_JOB_MAX_ATTEMPTS', '5'))
+
+# Try-on sonuç önbelleği (aynı kişi + kıyafet görseli için fal.ai çağrısını atlar)
+TRYON_CACHE_ENABLED = os.environ.get('TRYON_CACHE_ENABLED', 'true').lower() == 'true'
+TRYON_CACHE_TTL_DAYS = int(os.environ.get('TRYON_CACHE_TTL_DAYS', '30'))
+TRYON_FINGERPRINT_TTL = int(os.environ.get('TRYON_FINGERPRINT_TTL', '60'))
+# Sunucunun indirebileceği görsel host'ları (Supabase Storage public URL'lerine ek olarak, virgülle ayrılmış)
+MEDIA_FETCH_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.environ.get('MEDIA_FETCH_ALLOWED_HOSTS', '').split(',') if host.strip()
+}
+
+# fal.ai sonucunun Supabase Storage'a akış halinde aktarımı
+TRYON_RESULT_MAX_BYTES = int(os.environ.get('TRYON_RESULT_MAX_BYTES', str(20 * 1024 * 1024)))
+TRANSFER_CHUNK_SIZE = int(os.environ.get('TRANSFER_CHUNK_SIZE', str(64 * 1024)))
+
+# Try-on kabul kontrolü (fal.ai eşzamanlılık kotasını korur)
+TRYON_MAX_INFLIGHT = int(os.environ.get('TRYON_MAX_INFLIGHT', '16'))
+TRYON_MAX_INFLIGHT_PER_USER = int(os.environ.get('TRYON_MAX_INFLIGHT_PER_USER', '2'))
+TRYON_MAX_QUEUED = int(os.environ.get('TRYON_MAX_QUEUED', '64'))
+TRYON_MAX_QUEUED_PER_USER = int(os.environ.get('TRYON_MAX_QUEUED_PER_USER', '4'))
+TRYON_QUEUE_TIMEOUT = float(os.environ.get('TRYON_QUEUE_TIMEOUT', '30'))
+TRYON_TIER_CACHE_TTL = int(os.environ.get('TRYON_TIER_CACHE_TTL', '60'))  # profiles.subscription_tier önbelleği
+# Okuma başarısız olunca bu süre (sn) boyunca Supabase'e gidilmez; istekler en düşük şeritte kabul edilir
+TRYON_TIER_FAILURE_TTL = float(os.environ.get('TRYON_TIER_FAILURE_TTL', '5'))
+
+# Try-on giriş görsellerinin normalize edilmesi (fal.ai'ye küçültülmüş kopya gönderilir)
+TRYON_INPUT_NORMALIZE = os.environ.get('TRYON_INPUT_NORMALIZE', 'true').lower() == 'true'
+TRYON_INPUT_MAX_EDGE = int(os.environ.get('TRYON_INPUT_MAX_EDGE', '1024'))
+TRYON_INPUT_QUALITY = int(os.environ.get('TRYON_INPUT_QUALITY', '90'))
+TRYON_INPUT_MAX_BYTES = int(os.environ.get('TRYON_INPUT_MAX_BYTES', str(25 * 1024 * 1024)))
+
+# Toplu try-on (tek kişi görseli, birden fazla kıyafet)
+TRYON_BATCH_MAX_ITEMS = int(os.environ.get('TRYON_BATCH_MAX_ITEMS', '12'))
+TRYON_BATCH_CONCURRENCY = int(os.environ.get('TRYON_BATCH_CONCURRENCY', '3'))
+
+# Görsel decode sınırları
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(50_000_000)))
+THUMBNAIL_REDUCING_GAP = float(os.environ.get('THUMBNAIL_REDUCING_GAP', '2.0'))
+# Pillow'un kendi decompression bomb kontrolü de aynı sınırı kullansın
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# Responsive görsel varyantları (uzun kenar px, virgülle ayrılmış)
+IMAGE_VARIANTS_ENABLED = os.environ.get('IMAGE_VARIANTS_ENABLED', 'true').lower() == 'true'
+IMAGE_VARIANT_SIZES = [int(v) for v in os.environ.get('IMAGE_VARIANT_SIZES', '150,300,640,1080').split(',') if v.strip()]
+IMAGE_VARIANT_FORMATS = [v.strip().lower() for v in os.environ.get('IMAGE_VARIANT_FORMATS', 'jpeg,webp').split(',') if v.strip()]
+
+# Upload gövdesi okuma sınırları (byte)
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', str(2 * 1024 * 1024)))
+UPLOAD_SNIFF_BYTES = int(os.environ.get('UPLOAD_SNIFF_BYTES', str(256 * 1024)))
+
+# Tam boy görselin yeniden kodlanması (uzun kenar px, bayt bütçesi, JPEG kalite aralığı)
+FULL_IMAGE_RECOMPRESS = os.environ.get('FULL_IMAGE_RECOMPRESS', 'true').lower() == 'true'
+FULL_IMAGE_MAX_EDGE = int(os.environ.get('FULL_IMAGE_MAX_EDGE', '2048'))
+FULL_IMAGE_MAX_BYTES = int(os.environ.get('FULL_IMAGE_MAX_BYTES', str(600 * 1024)))
+FULL_IMAGE_QUALITY_MIN = int(os.environ.get('FULL_IMAGE_QUALITY_MIN', '60'))
+FULL_IMAGE_QUALITY_MAX = int(os.environ.get('FULL_IMAGE_QUALITY_MAX', '90'))
+
+# İçerik adresli (sha256) yüklemeler; istemci dedupe=true ile seçer
+IMAGE_DEDUPE_ENABLED = os.environ.get('IMAGE_DEDUPE_ENABLED', 'true').lower() == 'true'
+IMMUTABLE_CACHE_CONTROL = "31536000"
+
+# İsteğe bağlı yeniden boyutlandırma (/api/images/resize) ve önbellekleri
+IMAGE_RESIZE_WIDTHS = [int(v) for v in os.environ.get('IMAGE_RESIZE_WIDTHS', '150,300,640,1080,1600').split(',') if v.strip()]
+IMAGE_RESIZE_BUCKETS = [v.strip() for v in os.environ.get('IMAGE_RESIZE_BUCKETS', 'wardrobe,profiles').split(',') if v.strip()]
+IMAGE_RESIZE_MEMORY_BYTES = int(os.environ.get('IMAGE_RESIZE_MEMORY_BYTES', str(64 * 1024 * 1024)))
+IMAGE_RESIZE_DISK_BYTES = int(os.environ.get('IMAGE_RESIZE_DISK_BYTES', str(1024 * 1024 * 1024)))
+IMAGE_RESIZE_DISK_DIR = os.environ.get('IMAGE_RESIZE_DISK_DIR', os.path.join(tempfile.gettempdir(), 'modli-resize-cache'))
+# İçerik adresli olmayan (üzerine yazılabilen) kaynakların çıktıları için tarayıcı önbellek süresi (saniye)
+IMAGE_RESIZE_MUTABLE_MAX_AGE = int(os.environ.get('IMAGE_RESIZE_MUTABLE_MAX_AGE', '300'))
+# Kullanıcı başına önbellekte olmayan (decode gerektiren) küçültme sınırı: saniyede rate, en fazla burst
+IMAGE_RESIZE_USER_RATE = float(os.environ.get('IMAGE_RESIZE_USER_RATE', '2'))
+IMAGE_RESIZE_USER_BURST = int(os.environ.get('IMAGE_RESIZE_USER_BURST', '30'))
+
+# Görsel işleme havuzu (thread | process)
+IMAGE_POOL_MODE = os.environ.get('IMAGE_POOL_MODE', 'thread').lower()
+IMAGE_POOL_WORKERS = int(os.environ.get('IMAGE_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+IMAGE_POOL_MAX_PENDING = int(os.environ.get('IMAGE_POOL_MAX_PENDING', str(IMAGE_POOL_WORKERS * 4)))
+
+# Upstream HTTP client havuzları
+HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', 'false').lower() == 'true'
+HTTP_WARMUP_ENABLED = os.environ.get('HTTP_WARMUP_ENABLED', 'true').lower() == 'true'
+
 # Admin Credentials
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'modli@mekanizma.com')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', '12345678')
@@ -63,41 +198,362 @@ api_router = APIRouter(prefix="/api")
 EXPO_PUSH_API_URL = "https://exp.host/--/api/v2/push/send"
 EXPO_MAX_BATCH = 90
 
+# Expo gönderim hızı: eşzamanlı chunk isteği ve bildirim/sn sınırı (Expo proje başına ~600/sn kabul eder)
+EXPO_MAX_INFLIGHT = int(os.environ.get('EXPO_MAX_INFLIGHT', '6'))
+EXPO_RATE_PER_SECOND = float(os.environ.get('EXPO_RATE_PER_SECOND', '600'))
+EXPO_RATE_BURST = int(os.environ.get('EXPO_RATE_BURST', str(EXPO_MAX_BATCH * 2)))
+EXPO_GZIP_ENABLED = os.environ.get('EXPO_GZIP_ENABLED', 'true').lower() == 'true'
+# Geçici hatalarda (ağ, 429/5xx, MessageRateExceeded) yeniden deneme; tüm denemeler EXPO_SEND_DEADLINE içinde kalır
+EXPO_RETRY_MAX_ATTEMPTS = int(os.environ.get('EXPO_RETRY_MAX_ATTEMPTS', '5'))
+EXPO_RETRY_BASE_DELAY = float(os.environ.get('EXPO_RETRY_BASE_DELAY', '1.0'))
+EXPO_RETRY_MAX_DELAY = float(os.environ.get('EXPO_RETRY_MAX_DELAY', '30'))
+EXPO_SEND_DEADLINE = float(os.environ.get('EXPO_SEND_DEADLINE', '120'))
+# Büyük gönderimlerde yanıtta/logda tutulan ayrıntı sınırları
+EXPO_MAX_REPORTED_FAILURES = 500
+PUSH_LOG_TOKEN_SAMPLE = 100
+
+
+# Upstream HTTP clients
+# Her upstream için uygulama ömrü boyunca tek bir havuzlu httpx.AsyncClient kullanılır.
+# Varsayılanlar HTTP_<UPSTREAM>_TIMEOUT / _CONNECT_TIMEOUT / _MAX_CONNECTIONS / _MAX_KEEPALIVE env'leri ile değiştirilebilir.
+UPSTREAM_CLIENT_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "supabase_rest": {"timeout": 30.0, "connect_timeout": 5.0, "max_connections": 50, "max_keepalive": 20,
+                      "warmup_url": SUPABASE_URL},
+    "supabase_auth": {"timeout": 10.0, "connect_timeout": 3.0, "max_connections": 50, "max_keepalive": 20,
+                      "warmup_url": SUPABASE_URL},
+    "supabase_storage": {"timeout": 60.0, "connect_timeout": 5.0, "max_connections": 40, "max_keepalive": 20,
+                         "warmup_url": SUPABASE_URL},
+    "fal": {"timeout": 300.0, "connect_timeout": 10.0, "max_connections": 20, "max_keepalive": 10,
+            "warmup_url": "https://fal.run" if FAL_KEY else ""},
+    "expo": {"timeout": 20.0, "connect_timeout": 5.0, "max_connections": 20, "max_keepalive": 10,
+             "warmup_url": "https://exp.host"},
+    "openweather": {"timeout": 10.0, "connect_timeout": 3.0, "max_connections": 10, "max_keepalive": 5,
+                    "warmup_url": "https://api.openweathermap.org" if OPENWEATHER_API_KEY else ""},
+    # Kullanıcı/kıyafet görselleri gibi rastgele public URL'ler
+    "media": {"timeout": 30.0, "connect_timeout": 5.0, "max_connections": 40, "max_keepalive": 20,
+              "warmup_url": ""},
+}
+
+
+class UpstreamClients:
+    """
+    Upstream başına paylaşılan httpx.AsyncClient'ları yönetir.
+    Startup'ta oluşturulur ve ısıtılır, shutdown'da kapatılır. Startup dışında (script vb.)
+    ilk get() çağrısında client tembel olarak oluşturulur.
+    """
+
+    def __init__(self, defaults: Dict[str, Dict[str, Any]]):
+        self._defaults = defaults
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _setting(self, name: str, key: str, cast):
+        env_value = os.environ.get(f"HTTP_{name.upper()}_{key.upper()}")
+        return cast(env_value) if env_value else self._defaults[name][key]
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        timeout = httpx.Timeout(
+            self._setting(name, "timeout", float),
+            connect=self._setting(name, "connect_timeout", float),
+        )
+        limits = httpx.Limits(
+            max_connections=self._setting(name, "max_connections", int),
+            max_keepalive_connections=self._setting(name, "max_keepalive", int),
+            keepalive_expiry=30.0,
+        )
+        try:
+            return httpx.AsyncClient(timeout=timeout, limits=limits, http2=HTTP2_ENABLED)
+        except ImportError:
+            logger.warning("HTTP/2 için 'h2' paketi yok, HTTP/1.1 kullanılıyor")
+            return httpx.AsyncClient(timeout=timeout, limits=limits)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        http_client = self._clients.get(name)
+        if http_client is None or http_client.is_closed:
+            http_client = self._build(name)
+            self._clients[name] = http_client
+        return http_client
+
+    async def start(self):
+        for name in self._defaults:
+            self.get(name)
+        if HTTP_WARMUP_ENABLED:
+            await asyncio.gather(*(self._warm_up(name) for name in self._defaults))
+
+    async def _warm_up(self, name: str):
+        """DNS/TCP/TLS kurulumunu ilk kullanıcı isteğinden önce yapar"""
+        url = self._defaults[name].get("warmup_url")
+        if not url:
+            return
+        try:
+            await self.get(name).head(url, timeout=5.0)
+        except Exception as e:
+            logger.warning(f"HTTP warm-up başarısız ({name}): {str(e)}")
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for http_client in clients.values():
+            try:
+                await http_client.aclose()
+            except Exception as e:
+                logger.warning(f"HTTP client kapatılamadı: {str(e)}")
+
+
+http_clients = UpstreamClients(UPSTREAM_CLIENT_DEFAULTS)
+
+
+def upstream_client(name: str):
+    """FastAPI dependency: ilgili upstream'in paylaşılan HTTP client'ı"""
+    def _dependency() -> httpx.AsyncClient:
+        return http_clients.get(name)
+    return _dependency
+
+
+class StorageError(Exception):
+    """Supabase Storage API isteği başarısız oldu"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SupabaseStorage:
+    """
+    Supabase Storage REST API için async istemci.
+    Paylaşılan "supabase_storage" HTTP client'ını kullanır; event loop'u bloklamaz ve
+    istek başına supabase.create_client() maliyeti yoktur.
+    """
+
+    def __init__(self, supabase_url: str, service_key: str):
+        self.supabase_url = supabase_url.rstrip('/')
+        self.service_key = service_key
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.supabase_url and self.service_key)
+
+    def _url(self, *parts: str) -> str:
+        return "/".join([f"{self.supabase_url}/storage/v1", *parts])
+
+    def _headers(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        headers = {
+            "apikey": self.service_key,
+            "Authorization": f"Bearer {self.service_key}",
+        }
+        if extra:
+            headers.update(extra)
+        return headers
+
+    @staticmethod
+    def _raise_for_status(resp: httpx.Response, action: str):
+        if resp.status_code >= 400:
+            error_detail = resp.text[:200] if resp.text else "Unknown error"
+            raise StorageError(f"Storage {action} failed: {resp.status_code} - {error_detail}", resp.status_code)
+
+    async def upload(
+        self,
+        bucket: str,
+        path: str,
+        data: Any,
+        content_type: str = "image/jpeg",
+        upsert: bool = False,
+        cache_control: str = "3600",
+        content_length: Optional[int] = None,
+    ) -> str:
+        """
+        Dosyayı yükler; data bytes veya async byte iterator olabilir.
+        Iterator için content_length biliniyorsa chunked yerine Content-Length ile gönderilir.
+        """
+        headers = self._headers({
+            "Content-Type": content_type,
+            "cache-control": f"max-age={cache_control}",
+            "x-upsert": "true" if upsert else "false",
+        })
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        resp = await http_clients.get("supabase_storage").post(
+            self._url("object", bucket, quote(path)),
+            content=data,
+            headers=headers,
+        )
+        self._raise_for_status(resp, "upload")
+        return path
+
+    async def download(self, bucket: str, path: str, max_bytes: Optional[int] = None, public: bool = False) -> bytes:
+        """
+        Nesneyi indirir; max_bytes aşılırsa StorageError (413).
+        public=True: service key kullanılmadan public URL'den okunur (private bucket'lardaki nesneler 400/404 döner).
+        """
+        if public:
+            url, headers = self.get_public_url(bucket, path), None
+        else:
+            url, headers = self._url("object", bucket, quote(path)), self._headers()
+        async with http_clients.get("supabase_storage").stream("GET", url, headers=headers) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                self._raise_for_status(resp, "download")
+            buffer = bytearray()
+            async for chunk in resp.aiter_bytes(TRANSFER_CHUNK_SIZE):
+                buffer.extend(chunk)
+                if max_bytes is not None and len(buffer) > max_bytes:
+                    raise StorageError(f"Storage download failed: object exceeds {max_bytes} bytes", 413)
+        return bytes(buffer)
+
+    async def list(
+        self, bucket: str, prefix: str = "", limit: int = 100, offset: int = 0, search: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Bucket içindeki dosyaları listeler (storage3 list() ile aynı alanlar); search isim önekine göre süzer"""
+        body = {
+            "prefix": prefix,
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        }
+        if search:
+            body["search"] = search
+        resp = await http_clients.get("supabase_storage").post(
+            self._url("object", "list", bucket),
+            json=body,
+            headers=self._headers(),
+        )
+        self._raise_for_status(resp, "list")
+        return resp.json()
+
+    async def remove(self, bucket: str, paths: List[str]) -> List[Dict[str, Any]]:
+        resp = await http_clients.get("supabase_storage").request(
+            "DELETE",
+            self._url("object", bucket),
+            json={"prefixes": paths},
+            headers=self._headers(),
+        )
+        self._raise_for_status(resp, "remove")
+        return resp.json()
+
+    async def public_version(self, bucket: str, path: str) -> str:
+        """Public nesnenin sürümü (ETag, yoksa Last-Modified); gövde indirilmez"""
+        resp = await http_clients.get("supabase_storage").head(self.get_public_url(bucket, path))
+        self._raise_for_status(resp, "head")
+        return resp.headers.get("etag") or resp.headers.get("last-modified") or ""
+
+    def get_public_url(self, bucket: str, path: str) -> str:
+        """Public bucket URL'i (ağ çağrısı yapmaz)"""
+        return self._url("object", "public", bucket, quote(path))
+
+    def is_public_url(self, url: Optional[str]) -> bool:
+        return bool(self.configured and url and url.startswith(self._url("object", "public", "")))
+
+
+storage = SupabaseStorage(SUPABASE_URL, SUPABASE_KEY)
+
+
+class StorageWriteBatch:
+    """
+    Tek bir işleme ait Storage yazımlarını başlatıldıkları anda eşzamanlı yürütür.
+    Yazımlardan biri başarısız olursa rollback() kalanları iptal eder ve denenen tüm nesneleri siler
+    (iptal edilen bir yükleme sunucu tarafında tamamlanmış olabilir).
+    preserve: işlemden önce zaten var olan isimler; üzerine yazılsalar da rollback'te silinmezler.
+    """
+
+    def __init__(self, bucket: str, preserve: Iterable[str] = ()):
+        self.bucket = bucket
+        self.preserve = set(preserve)
+        self.paths: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, path: str, data: Any, **kwargs) -> asyncio.Task:
+        self.paths.append(path)
+        task = asyncio.create_task(storage.upload(self.bucket, path, data, **kwargs))
+        self._tasks.append(task)
+        return task
+
+    async def wait(self):
+        await asyncio.gather(*self._tasks)
+
+    async def rollback(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        paths = [path for path in self.paths if path not in self.preserve]
+        if not paths:
+            return
+        try:
+            await storage.remove(self.bucket, paths)
+        except Exception as e:
+            logger.warning(f"Yarım kalan yüklemeler silinemedi ({self.bucket}: {paths}): {str(e)}")
+
+
+# fal.ai virtual try-on ayarları (sonuç önbelleği anahtarına da girer)
+FAL_TRYON_URL = "https://fal.run/fal-ai/image-apps-v2/virtual-try-on"
+FAL_TRYON_PARAMS: Dict[str, Any] = {
+    # Preservation settings - keep person and clothing as original as possible
+    "preserve_pose": True,           # Keep body pose unchanged
+    "preserve_face": True,           # Keep face unchanged
+    "preserve_background": True,     # Keep background unchanged
+    # Output ratio - always square for consistent UI crops
+    "ratio": "1:1",
+    # Quality settings - optimized for speed/quality balance
+    "num_images": 1,
+    "num_inference_steps": 30,       # Balanced: 30 steps (was 50, too slow)
+    "guidance_scale": 7.5,           # Higher = more faithful to inputs
+    # Fidelity settings
+    "clothing_fidelity": "high",     # Keep clothing details accurate
+    "body_fidelity": "high"          # Keep body proportions accurate
+}
+
 
 # Utility Functions
-def create_thumbnail(image_data: bytes, size: tuple = (300, 300)) -> bytes:
-    """Create a thumbnail from image data"""
+def open_image_for_resize(image_data: Any, size: tuple) -> Image.Image:
+    """
+    Görseli header üzerinden doğrular ve piksel sınırını uygular; decode tembel kalır.
+    image_data bytes veya (diske taşan upload'lar için) dosya yolu olabilir.
+    JPEG'ler draft() ile hedefin altına düşmeyen en yakın DCT ölçeğinde (1/2, 1/4, 1/8) açılır;
+    draft() öncesi boyutlar image.info["source_size"] içinde kalır.
+    """
+    if not image_data or len(image_data) == 0:
+        raise ValueError("Empty image data")
+    
+    # Open image (only the header is parsed here; pixel data is decoded lazily)
     try:
-        # Validate input
-        if not image_data or len(image_data) == 0:
-            raise ValueError("Empty image data")
-        
-        # Create BytesIO from image data
-        image_stream = io.BytesIO(image_data)
-        
-        # Open and verify image
-        try:
-            image = Image.open(image_stream)
-            # Verify it's a valid image (this will raise an exception if invalid)
-            image.verify()
-        except Exception as img_error:
-            logger.error(f"Cannot identify image file: {str(img_error)}")
-            raise ValueError(f"Cannot identify image file: {str(img_error)}")
-        
-        # Reopen image for processing (verify() consumes the file)
-        image_stream.seek(0)
-        image = Image.open(image_stream)
+        image = Image.open(io.BytesIO(image_data) if isinstance(image_data, (bytes, bytearray)) else image_data)
+    except Exception as img_error:
+        logger.error(f"Cannot identify image file: {str(img_error)}")
+        raise ValueError(f"Cannot identify image file: {str(img_error)}")
+    
+    width, height = image.size
+    if width <= 0 or height <= 0:
+        raise ValueError("Cannot identify image file: invalid dimensions")
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image too large: {width}x{height} exceeds {IMAGE_MAX_PIXELS} pixels")
+    
+    image.info["source_size"] = (width, height)
+    if image.format == "JPEG":
+        image.draft("RGB", size)
+    return image
+
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """Saydam görselleri beyaz zemin üzerine yerleştirip RGB'ye çevirir"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        return background
+    return image
+
+
+def create_thumbnail(image_data: Any, size: tuple = (300, 300)) -> bytes:
+    """
+    Create a thumbnail from image data.
+    Görsel tek kez decode edilir (bkz. open_image_for_resize).
+    """
+    try:
+        image = open_image_for_resize(image_data, size)
         
-        # Create thumbnail
-        image.thumbnail(size, Image.Resampling.LANCZOS)
+        # Create thumbnail (decoding errors of truncated/corrupt files surface here)
+        image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
         
         # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-            image = background
+        image = flatten_to_rgb(image)
         
         # Save to BytesIO
         output = io.BytesIO()
@@ -110,6 +566,420 @@ def create_thumbnail(image_data: bytes, size: tuple = (300, 300)) -> bytes:
         raise ValueError(f"Error creating thumbnail: {str(e)}")
 
 
+IMAGE_VARIANT_ENCODERS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 85, "optimize": True}),
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "avif", "image/avif", {"quality": 60}),
+}
+
+
+def supported_variant_formats(formats: List[str]) -> List[str]:
+    """Pillow kurulumunun kaydedebildiği formatları döndürür (AVIF derlemeye/eklentiye bağlıdır)"""
+    Image.init()
+    return [f for f in formats if f in IMAGE_VARIANT_ENCODERS and IMAGE_VARIANT_ENCODERS[f][0] in Image.SAVE]
+
+
+def encode_jpeg_within_budget(image: Image.Image, max_bytes: int, quality_min: int, quality_max: int) -> tuple:
+    """
+    Bayt bütçesine sığan en yüksek JPEG kalitesini ikili aramayla bulur; (bytes, quality) döner.
+    En düşük kalite bile sığmıyorsa o kaliteyle kodlanmış çıktı döner.
+    Metadata (EXIF/XMP) yazılmaz; renk doğruluğu için ICC profili korunur.
+    """
+    icc_profile = image.info.get("icc_profile")
+
+    def encode(quality: int) -> bytes:
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True, icc_profile=icc_profile)
+        return output.getvalue()
+
+    best = None
+    low, high = quality_min, quality_max
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(quality)
+        if len(data) <= max_bytes:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best or (encode(quality_min), quality_min)
+
+
+# Kaynak JPEG saklanırken atılan segmentler: EXIF/XMP (APP1), IPTC/Photoshop (APP13), diğer uygulama
+# segmentleri ve yorumlar. JFIF (APP0), ICC profili (APP2) ve Adobe (APP14, renk dönüşümü) korunur.
+JPEG_METADATA_MARKERS = frozenset({0xE1, *range(0xE3, 0xEE), 0xEF, 0xFE})
+
+
+def strip_jpeg_metadata(data: bytes) -> bytes:
+    """JPEG'den metadata segmentlerini yeniden kodlamadan çıkarır; sıkıştırılmış tarama verisine dokunulmaz"""
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG stream")
+    output = bytearray(data[:2])
+    pos = 2
+    while pos + 1 < len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Malformed JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Dolgu baytı
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # SOS: buradan sonrası entropi kodlu veri ve EOI
+            output += data[pos:]
+            return bytes(output)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            output += data[pos:pos + 2]
+            pos += 2
+            continue
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+        if end > len(data):
+            raise ValueError("Truncated JPEG segment")
+        if marker not in JPEG_METADATA_MARKERS:
+            output += data[pos:end]
+        pos = end
+    raise ValueError("JPEG stream has no image data")
+
+
+def process_uploaded_image(image_data: Any, sizes: List[int], formats: List[str], recompress_full: bool) -> Dict[str, Any]:
+    """
+    Tek decode'dan saklanacak tam boy görseli ve boyut/format varyantlarını üretir.
+    EXIF yönü uygulanır. Tam boy görsel FULL_IMAGE_MAX_EDGE ile sınırlanıp bayt bütçesine göre yeniden kodlanır;
+    orijinal zaten küçük, düz yönlü bir JPEG ise ve yeniden kodlama kazanç sağlamıyorsa full, metadata'sı
+    (EXIF/GPS dahil) kayıpsız çıkarılmış kaynak baytlarıdır (full_quality=None).
+    Varyantlar en büyükten küçüğe piramit şeklinde küçültülür; her adım bir öncekinin çıktısından türetilir.
+    Görsel bir boyuttan küçükse büyütülmez, o varyant orijinal çözünürlükte kalır.
+    """
+    try:
+        largest = max(list(sizes) + ([FULL_IMAGE_MAX_EDGE] if recompress_full else []))
+        image = open_image_for_resize(image_data, (largest, largest))
+        source_format = image.format
+        oriented = image.getexif().get(0x0112, 1) in (0, 1)
+        original_size = len(image_data) if isinstance(image_data, (bytes, bytearray)) else os.path.getsize(image_data)
+        image.load()
+        current = flatten_to_rgb(ImageOps.exif_transpose(image))
+        if current.mode != 'RGB':
+            current = current.convert('RGB')
+
+        result: Dict[str, Any] = {
+            "full": None, "full_quality": None, "original_bytes": original_size, "variants": {}, "blurhash": None,
+        }
+        if recompress_full:
+            if max(current.size) > FULL_IMAGE_MAX_EDGE:
+                current = current.copy()
+                current.thumbnail((FULL_IMAGE_MAX_EDGE, FULL_IMAGE_MAX_EDGE), Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+            full, quality = encode_jpeg_within_budget(current, FULL_IMAGE_MAX_BYTES, FULL_IMAGE_QUALITY_MIN, FULL_IMAGE_QUALITY_MAX)
+            result["full"], result["full_quality"] = full, quality
+            keep_source = (
+                source_format == "JPEG" and oriented
+                and max(image.info["source_size"]) <= FULL_IMAGE_MAX_EDGE and original_size <= len(full)
+            )
+            if keep_source:
+                if isinstance(image_data, (bytes, bytearray)):
+                    source = bytes(image_data)
+                else:
+                    with open(image_data, "rb") as fh:
+                        source = fh.read()
+                try:
+                    result["full"], result["full_quality"] = strip_jpeg_metadata(source), None
+                except ValueError as e:
+                    logger.warning(f"Kaynak JPEG metadata'sı çıkarılamadı, yeniden kodlanmış sürüm kullanılıyor: {str(e)}")
+
+        for size in sorted(set(sizes), reverse=True):
+            if max(current.size) > size:
+                current = current.copy()
+                current.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+
+            encoded: Dict[str, bytes] = {}
+            for fmt in formats:
+                pil_format, _ext, _content_type, options = IMAGE_VARIANT_ENCODERS[fmt]
+                output = io.BytesIO()
+                current.save(output, format=pil_format, **options)
+                encoded[fmt] = output.getvalue()
+            result["variants"][size] = encoded
+
+        # En küçük varyant zaten bellekte: yer tutucu için ek decode gerekmez
+        result["blurhash"] = compute_blurhash(current)
+        return result
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}")
+        raise ValueError(f"Error processing image: {str(e)}")
+
+
+def resize_image(image_data: bytes, width: int, fmt: str) -> bytes:
+    """
+    Görseli verilen genişliğe küçültür (en-boy oranı korunur, büyütme yapılmaz) ve fmt ile kodlar.
+    EXIF yönü uygulanır; çıktı RGB'dir.
+    """
+    try:
+        image = open_image_for_resize(image_data, (width, width))
+        image.load()
+        image = flatten_to_rgb(ImageOps.exif_transpose(image))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+
+        pil_format, _ext, _content_type, options = IMAGE_VARIANT_ENCODERS[fmt]
+        output = io.BytesIO()
+        image.save(output, format=pil_format, **options)
+        return output.getvalue()
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error resizing image: {str(e)}")
+        raise ValueError(f"Error resizing image: {str(e)}")
+
+
+class TTLCache:
+    """
+    Boyut sınırlı, giriş bazında TTL'li LRU önbellek (tek process, event loop içinde kullanılır).
+    Hit/miss sayaçları stats() ile okunabilir.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> tuple:
+        """(bulundu_mu, değer) döndürür; süresi dolan girişler silinir"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: Any, ttl: float):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str):
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LatencyHistogram:
+    """Sabit bucket'lı süre histogramı (saniye); stats() kümülatif bucket sayılarını döndürür"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+    def __init__(self, buckets: Optional[tuple] = None):
+        self.buckets = buckets or self.DEFAULT_BUCKETS
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self._counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        cumulative = {}
+        running = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self._counts):
+            running += count
+            cumulative[f"le_{bound}"] = running
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+            "buckets": cumulative,
+        }
+
+
+class SingleFlight:
+    """
+    Aynı anahtar için eşzamanlı çağrıları tek bir işte birleştirir.
+    İş ayrı bir task olarak çalışır; ilk çağıran iptal edilse bile bekleyenler sonucu alır.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class TokenBucket:
+    """
+    Asenkron token bucket: saniyede `rate` token dolar, en fazla `capacity` birikir.
+    acquire() yeterli token birikene kadar bekler; bekleyenler sırayla geçer. rate <= 0 ise sınır yok.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Token harcar; beklenen süreyi (saniye) döndürür"""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(float(amount), self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+        return time.monotonic() - started
+
+    def try_acquire(self, amount: float = 1.0) -> bool:
+        """Beklemeden token harcamayı dener; yetmiyorsa False döner"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self._tokens < amount:
+            return False
+        self._tokens -= amount
+        return True
+
+
+def _timed_image_call(fn, *args):
+    """Havuz içinde çalışır; sonucu ve saf işlem süresini döndürür (process modunda pickle edilebilir olmalı)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class ImageProcessingPool:
+    """
+    CPU-yoğun Pillow işlerini event loop dışında çalıştırır.
+    IMAGE_POOL_MODE=thread: Pillow decode/resize/encode sırasında GIL'i bırakır, ek maliyet yok.
+    IMAGE_POOL_MODE=process: GIL'e takılmayan tam paralellik; fonksiyon ve argümanlar pickle edilebilir olmalı.
+    Bekleyen iş sayısı sınırlıdır; havuz doluysa 503 döner. Aşama başına bekleme/çalışma süreleri tutulur.
+    """
+
+    def __init__(self, mode: str, workers: int, max_pending: int):
+        self.mode = mode if mode in ("thread", "process") else "thread"
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor = None
+        self.pending = 0
+        self.rejected = 0
+        self.failed = 0
+        self._wait_timings: Dict[str, LatencyHistogram] = {}
+        self._run_timings: Dict[str, LatencyHistogram] = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == "process":
+                # fork, event loop ve açık soketlerle birlikte güvenli değil
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        return self._executor
+
+    async def run(self, stage: str, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Image processing is busy. Please try again.",
+                                headers={"Retry-After": "2"})
+
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, run_seconds = await loop.run_in_executor(self._get_executor(), _timed_image_call, fn, *args)
+        except BrokenProcessPool:
+            # Bir worker öldüyse havuzu yeniden oluştur; bu istek başarısız sayılır
+            self.failed += 1
+            self._executor = None
+            raise RuntimeError("Image worker crashed")
+        finally:
+            self.pending -= 1
+
+        total = time.perf_counter() - started
+        self._run_timings.setdefault(stage, LatencyHistogram()).observe(run_seconds)
+        self._wait_timings.setdefault(stage, LatencyHistogram()).observe(max(0.0, total - run_seconds))
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "stages": {
+                stage: {
+                    "wait": self._wait_timings[stage].stats(),
+                    "run": self._run_timings[stage].stats(),
+                }
+                for stage in self._run_timings
+            },
+        }
+
+
+image_pool = ImageProcessingPool(IMAGE_POOL_MODE, IMAGE_POOL_WORKERS, IMAGE_POOL_MAX_PENDING)
+
+
 def base64_to_bytes(base64_string: str) -> bytes:
     """Convert base64 string to bytes"""
     if ',' in base64_string:
@@ -127,6 +997,25 @@ def chunk_list(items: List[Any], size: int) -> List[List[Any]]:
     return [items[i:i + size] for i in range(0, len(items), size)]
 
 
+async def iter_chunks_async(items: Union[Iterable[Any], AsyncIterable[Any]], size: int) -> AsyncIterator[List[Any]]:
+    """Senkron ya da asenkron kaynaktan en fazla `size` elemanlı listeler üretir (kaynağı tek seferde belleğe almaz)"""
+    chunk: List[Any] = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
 def is_expo_push_token(token: str) -> bool:
     """Basic validation for Expo push tokens"""
     return isinstance(token, str) and (
@@ -141,70 +1030,366 @@ def is_fcm_token(token: str) -> bool:
     return isinstance(token, str) and len(token) > 20 and not token.startswith("ExponentPushToken") and not token.startswith("ExpoPushToken")
 
 
-async def fetch_push_tokens_from_supabase(target_user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def _postgrest_quote(value: str) -> str:
+    """or=(...) filtresi içindeki değeri PostgREST için çift tırnakla"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _push_token_rest() -> tuple:
+    """push_tokens tablosunun REST URL'i ve service key başlıkları"""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise HTTPException(status_code=500, detail="Supabase push token erişimi için yapılandırma eksik")
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json",
+    }
+    return f"{SUPABASE_URL.rstrip('/')}/rest/v1/{PUSH_TOKEN_TABLE}", headers
+
+
+async def count_push_token_rows() -> int:
+    """push_tokens satır sayısı (PostgREST exact count; satırlar okunmaz)"""
+    rest_url, headers = _push_token_rest()
+    resp = await http_clients.get("supabase_rest").get(
+        rest_url,
+        params={"select": "push_token", "push_token": "not.is.null", "limit": "1"},
+        headers={**headers, "Prefer": "count=exact"},
+    )
+    total = resp.headers.get("content-range", "").rpartition("/")[2]
+    if resp.status_code not in (200, 206) or not total.isdigit():
+        logger.error(f"Push token count failed: {resp.status_code} - {resp.headers.get('content-range')}")
+        raise HTTPException(status_code=500, detail="Push token sayısı okunamadı")
+    return int(total)
+
+
+async def iter_push_token_rows(
+    target_user_id: Optional[str] = None,
+    after: Optional[tuple] = None,
+    page_size: int = PUSH_TOKEN_PAGE_SIZE,
+    updated_at_null: bool = False,
+) -> AsyncIterator[List[Dict[str, Any]]]:
     """
-    Supabase REST üzerinden push token listesini döndürür.
-    Token'ları platform bilgisiyle birlikte döndürür.
+    Supabase REST üzerinden push_tokens satırlarını sayfa sayfa döndürür (async generator, sayfa = liste).
+    Sayfalama (updated_at, push_token) üzerinde keyset ile yapılır; PostgREST max-rows sınırına takılmaz.
+    after=(updated_at, push_token) verilirse yalnızca bu çiftten sonraki satırlar okunur.
+    updated_at_null=True: yalnızca updated_at'i NULL olan satırlar (watermark'la izlenemeyenler).
     Varsayılan tablo adı: push_tokens (PUSH_TOKEN_TABLE env ile değiştirilebilir)
     """
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise HTTPException(status_code=500, detail="Supabase push token erişimi için yapılandırma eksik")
+    rest_url, headers = _push_token_rest()
+    page_size = max(1, page_size)
+    http_client = http_clients.get("supabase_rest")
+    cursor = after  # son satırın (updated_at, push_token) değeri
 
-    rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/{PUSH_TOKEN_TABLE}"
+    while True:
+        params = {
+            "select": "user_id,push_token,platform,updated_at",
+            "push_token": "not.is.null",
+            "order": "updated_at.asc.nullsfirst,push_token.asc",
+            "limit": str(page_size),
+        }
+        if target_user_id:
+            params["user_id"] = f"eq.{target_user_id}"
+        if updated_at_null:
+            params["updated_at"] = "is.null"
+        if cursor is not None:
+            last_updated_at, last_token = cursor
+            if last_updated_at is None:
+                # NULL updated_at'ler önce gelir; sonra tüm NULL olmayanlar
+                params["or"] = f"(and(updated_at.is.null,push_token.gt.{_postgrest_quote(last_token)}),updated_at.not.is.null)"
+            else:
+                params["or"] = (
+                    f"(updated_at.gt.{_postgrest_quote(last_updated_at)},"
+                    f"and(updated_at.eq.{_postgrest_quote(last_updated_at)},push_token.gt.{_postgrest_quote(last_token)}))"
+                )
 
-    params = {
-        "select": "user_id,push_token,platform,updated_at",
-        "push_token": "not.is.null",
-    }
+        resp = await http_client.get(rest_url, params=params, headers=headers)
+        if resp.status_code != 200:
+            error_detail = resp.text[:200] if resp.text else "Unknown error"
+            logger.error(f"Push token fetch failed: {resp.status_code} - {error_detail}")
+            raise HTTPException(status_code=500, detail="Push tokenları okunamadı")
 
-    if target_user_id:
-        params["user_id"] = f"eq.{target_user_id}"
+        rows = resp.json()
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1].get("updated_at"), rows[-1].get("push_token"))
 
-    async with httpx.AsyncClient(timeout=20.0) as http_client:
-        resp = await http_client.get(
-            rest_url,
-            params=params,
-            headers={
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "application/json",
-            },
-        )
 
-    if resp.status_code != 200:
-        error_detail = resp.text[:200] if resp.text else "Unknown error"
-        logger.error(f"Push token fetch failed: {resp.status_code} - {error_detail}")
-        raise HTTPException(status_code=500, detail="Push tokenları okunamadı")
-
-    data = resp.json()
-    tokens = []
-    for row in data:
-        token = row.get("push_token")
-        platform = row.get("platform", "unknown")
-        user_id = row.get("user_id")
-        
-        if token:
-            # Hem Expo hem FCM token'larını kabul et
-            # Expo Push API, her iki formatı da destekler
-            tokens.append({
-                "token": token,
-                "platform": platform,
-                "user_id": user_id,
-                "is_expo": is_expo_push_token(token),
-                "is_fcm": is_fcm_token(token)
-            })
-        else:
-            logger.warning(f"Boş push token atlandı: {row}")
-
-    # Benzersiz tut (token bazında)
-    seen = set()
-    unique_tokens = []
-    for item in tokens:
-        if item["token"] not in seen:
-            seen.add(item["token"])
-            unique_tokens.append(item)
-    
-    return unique_tokens
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class PushTokenMirror:
+    """
+    Supabase push_tokens tablosunun MongoDB kopyası (push_tokens_mirror); alıcılar buradan milisaniyede çözülür.
+    - Arka plan döngüsü updated_at watermark'ından itibaren artımlı senkronize eder; watermark
+      push_token_sync_state'te sayfa sayfa kaydedilir. Geç commit edilen satırları kaçırmamak için
+      her turda watermark'tan PUSH_MIRROR_SYNC_OVERLAP saniye geriden başlanır (upsert idempotent).
+    - updated_at'i NULL olan satırlar watermark'la izlenemez; her artımlı turda ayrıca okunur.
+    - Silinen token'lar artımlı senkronda görünmez; tam senkron her satıra sync_id yazar, bitince görülmeyenleri
+      siler (PUSH_MIRROR_FULL_SYNC_INTERVAL'de bir ya da admin isteğiyle). Arada PUSH_MIRROR_RECONCILE_INTERVAL'de
+      bir Supabase satır sayısı mirror'la karşılaştırılır; artımlı senkron eklemeleri zaten aldığı için fark
+      silinen (ya da kaçırılan) satır demektir ve tam senkron hemen çalıştırılır. Mirror (user_id, push_token)
+      başına tek belge tuttuğundan, son tam senkronda mirror'a ayrı belge olarak girmeyen satırlar (tekrarlanan
+      çiftler, boş token'lar) surplus_rows olarak saklanır ve karşılaştırmada mirror tarafına eklenir.
+    - Alıcılar yalnızca mirror'dan okunur; Supabase'e geri düşülmez. İlk tam senkron tamamlanmadan (ready=False)
+      başlayan push işi alıcıları okumadan önce tam senkronu bekler (PushBroadcastJobs._run). Tek kullanıcıya
+      gönderimde de son artımlı senkrondan sonra eklenen token'lar bir sonraki tura kadar görünmez.
+    """
+
+    STATE_ID = "push_tokens"
+
+    def __init__(self, interval: int, full_interval: int, overlap: int):
+        self.interval = max(1, interval)
+        self.full_interval = full_interval
+        self.overlap = overlap
+        self.ready = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._resync_task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self.full_syncs = 0
+        self.rows_synced = 0
+        self.removed = 0
+        self.reconciles = 0
+        self.drift_detected = 0
+        self._reconciled_at = 0.0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_sync: Optional[Dict[str, Any]] = None
+        self.local_resolutions = 0
+
+    @property
+    def collection(self):
+        return db.push_tokens_mirror
+
+    @property
+    def state_collection(self):
+        return db.push_token_sync_state
+
+    async def start(self):
+        await self.collection.create_index([("user_id", 1), ("push_token", 1)], unique=True)
+        await self.collection.create_index("push_token")
+        await self.collection.create_index("platform")
+        state = await self.get_state()
+        self.ready = bool(state and state.get("last_full_sync_at"))
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, self._resync_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._resync_task = None
+
+    async def get_state(self) -> Optional[Dict[str, Any]]:
+        return await self.state_collection.find_one({"_id": self.STATE_ID})
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                state = await self.get_state() or {}
+                last_full = state.get("last_full_sync_at")
+                full = last_full is None or (datetime.utcnow() - last_full).total_seconds() >= self.full_interval
+                await self.sync(full=full)
+                if not full and time.monotonic() - self._reconciled_at >= PUSH_MIRROR_RECONCILE_INTERVAL:
+                    await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Push token mirror senkron hatası: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def _start_cursor(self, watermark: Optional[List[Any]]) -> Optional[tuple]:
+        if not watermark or not watermark[0]:
+            return None
+        parsed = _parse_timestamp(watermark[0])
+        if parsed is None:
+            return tuple(watermark)
+        return ((parsed - timedelta(seconds=self.overlap)).isoformat(), "")
+
+    async def reconcile(self) -> bool:
+        """Satır sayıları farklıysa (silinen token'lar) tam senkron çalıştırır; çalıştıysa True"""
+        self._reconciled_at = time.monotonic()
+        self.reconciles += 1
+        remote = await count_push_token_rows()
+        state = await self.get_state() or {}
+        local = await self.collection.count_documents({}) + state.get("surplus_rows", 0)
+        if remote == local:
+            return False
+        self.drift_detected += 1
+        logger.info(f"Push token mirror sapması: supabase={remote}, mirror+surplus={local}; tam senkron")
+        await self.sync(full=True)
+        return True
+
+    async def _apply_rows(self, rows: List[Dict[str, Any]], sync_id: str):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"user_id": row.get("user_id"), "push_token": row["push_token"]},
+                {"$set": {
+                    "platform": row.get("platform") or "unknown",
+                    "updated_at": row.get("updated_at"),
+                    "sync_id": sync_id,
+                    "synced_at": now,
+                }},
+                upsert=True,
+            )
+            for row in rows if row.get("push_token")
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def sync(self, full: bool = False, skip_if_ready: bool = False) -> Dict[str, Any]:
+        """
+        Artımlı (watermark'tan) ya da tam senkron; aynı anda tek senkron çalışır.
+        skip_if_ready: kilit beklenirken başka bir senkron mirror'ı hazır ettiyse tekrar çalıştırma.
+        """
+        async with self._lock:
+            if skip_if_ready and self.ready:
+                return self.last_sync
+            started = time.perf_counter()
+            state = await self.get_state() or {}
+            watermark = state.get("watermark")
+            after = None if full else self._start_cursor(watermark)
+            sync_id = uuid.uuid4().hex
+            rows_count = 0
+
+            async for rows in iter_push_token_rows(after=after):
+                await self._apply_rows(rows, sync_id)
+                rows_count += len(rows)
+
+                last = rows[-1]
+                last_updated_at = _parse_timestamp(last.get("updated_at"))
+                current = _parse_timestamp(watermark[0]) if watermark else None
+                if last_updated_at and (current is None or last_updated_at >= current):
+                    watermark = [last["updated_at"], last["push_token"]]
+                    if not full:
+                        # Yarıda kesilen artımlı senkron bir sonraki turda buradan devam eder
+                        await self.state_collection.update_one(
+                            {"_id": self.STATE_ID}, {"$set": {"watermark": watermark}}, upsert=True
+                        )
+
+            null_rows = 0
+            if after is not None:
+                # Watermark sorgusu NULL updated_at'leri kapsamaz; tam senkronda ilk sayfalarda zaten okunurlar
+                async for rows in iter_push_token_rows(updated_at_null=True):
+                    await self._apply_rows(rows, sync_id)
+                    null_rows += len(rows)
+
+            now = datetime.utcnow()
+            update: Dict[str, Any] = {"watermark": watermark, "last_sync_at": now}
+            removed = 0
+            if full:
+                # Bu turda görülmeyen satırlar Supabase'den silinmiş ya da değişmiştir
+                result = await self.collection.delete_many({"sync_id": {"$ne": sync_id}})
+                removed = result.deleted_count
+                update["last_full_sync_at"] = now
+                # Tam senkron tüm satırları okur: mirror'da ayrı belgeye dönüşmeyenler reconcile'da hesaba katılır
+                update["surplus_rows"] = max(0, rows_count - await self.collection.count_documents({}))
+                self.full_syncs += 1
+                self.removed += removed
+                self.ready = True
+            await self.state_collection.update_one({"_id": self.STATE_ID}, {"$set": update}, upsert=True)
+
+            self.syncs += 1
+            self.rows_synced += rows_count + null_rows
+            self.last_sync = {
+                "mode": "full" if full else "incremental",
+                "rows": rows_count,
+                "null_updated_at_rows": null_rows,
+                "removed": removed,
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "finished_at": now.isoformat(),
+            }
+            if full or rows_count:
+                logger.info(f"Push token mirror senkronu: {self.last_sync}")
+            return self.last_sync
+
+    def request_full_resync(self) -> bool:
+        """Arka planda tam senkron başlatır; zaten çalışıyorsa False döner"""
+        if self._resync_task and not self._resync_task.done():
+            return False
+
+        async def run():
+            try:
+                await self.sync(full=True)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Push token mirror tam senkron hatası: {str(e)}")
+
+        self._resync_task = asyncio.create_task(run())
+        return True
+
+    def _query(self, target_user_id: Optional[str] = None) -> Dict[str, Any]:
+        return {"user_id": target_user_id} if target_user_id else {}
+
+    async def iter_tokens(
+        self, target_user_id: Optional[str] = None, after: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Mirror'dan token'ları push_token sırasıyla döndürür; after verilirse bu token'dan sonrakiler.
+        Aynı token farklı kullanıcılarda olabilir; sıralı okunduğu için ardışık tekrarlar atlanır.
+        """
+        self.local_resolutions += 1
+        query = self._query(target_user_id)
+        if after is not None:
+            query["push_token"] = {"$gt": after}
+        previous = None
+        cursor = self.collection.find(query, {"_id": 0, "push_token": 1, "platform": 1, "user_id": 1})
+        async for doc in cursor.sort("push_token", 1).batch_size(PUSH_TOKEN_PAGE_SIZE):
+            if doc["push_token"] == previous:
+                continue
+            previous = doc["push_token"]
+            yield {"token": doc["push_token"], "platform": doc.get("platform", "unknown"), "user_id": doc.get("user_id")}
+
+    async def count_tokens(self, target_user_id: Optional[str] = None) -> int:
+        """Benzersiz token sayısı"""
+        pipeline = [
+            {"$match": self._query(target_user_id)},
+            {"$group": {"_id": "$push_token"}},
+            {"$count": "count"},
+        ]
+        result = await self.collection.aggregate(pipeline).to_list(length=1)
+        return result[0]["count"] if result else 0
+
+    async def has_tokens(self, target_user_id: Optional[str] = None) -> bool:
+        return await self.collection.find_one(self._query(target_user_id), {"_id": 1}) is not None
+
+    async def stats(self) -> Dict[str, Any]:
+        state = await self.get_state() or {}
+        return {
+            "enabled": PUSH_MIRROR_ENABLED,
+            "ready": self.ready,
+            "syncing": self._lock.locked(),
+            "tokens": await self.collection.estimated_document_count(),
+            "watermark": state.get("watermark"),
+            "last_sync_at": state.get("last_sync_at"),
+            "last_full_sync_at": state.get("last_full_sync_at"),
+            "last_sync": self.last_sync,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "rows_synced": self.rows_synced,
+            "removed": self.removed,
+            "reconciles": self.reconciles,
+            "drift_detected": self.drift_detected,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "local_resolutions": self.local_resolutions,
+        }
+
+
+push_token_mirror = PushTokenMirror(PUSH_MIRROR_SYNC_INTERVAL, PUSH_MIRROR_FULL_SYNC_INTERVAL, PUSH_MIRROR_SYNC_OVERLAP)
 
 
 async def log_push_notification(
@@ -214,9 +1399,10 @@ async def log_push_notification(
     sent_count: int,
     failed_count: int,
     tokens_info: List[Dict[str, Any]],
-    errors: List[str]
+    errors: List[str],
+    total_tokens: Optional[int] = None
 ):
-    """Push notification'ı MongoDB'ye logla"""
+    """Push notification'ı MongoDB'ye logla (tokens_info büyük gönderimlerde yalnızca bir örnektir)"""
     try:
         log_entry = {
             "id": str(uuid.uuid4()),
@@ -225,7 +1411,7 @@ async def log_push_notification(
             "target_user_id": target_user_id,
             "sent_count": sent_count,
             "failed_count": failed_count,
-            "total_tokens": len(tokens_info),
+            "total_tokens": total_tokens if total_tokens is not None else len(tokens_info),
             "tokens_info": tokens_info,
             "errors": errors,
             "created_at": datetime.utcnow(),
@@ -243,133 +1429,777 @@ async def get_app_logo_url() -> Optional[str]:
     if APP_LOGO_URL:
         return APP_LOGO_URL
     
-    # Supabase storage'dan logo URL'ini al (eğer varsa)
-    if SUPABASE_URL and SUPABASE_KEY:
-        try:
-            from supabase import create_client, Client
-            supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-            
-            # Logo dosyasını storage'dan al (public/logo.png veya benzeri)
-            logo_paths = ["public/modli-logo.png", "public/logo.png", "modli-logo.png"]
-            for path in logo_paths:
-                try:
-                    public_url = supabase.storage.from_("wardrobe").get_public_url(path)
-                    # URL'in geçerli olup olmadığını kontrol et
-                    if public_url and "supabase.co" in public_url:
-                        return public_url
-                except:
-                    continue
-        except Exception as e:
-            logger.warning(f"Logo URL alınamadı: {str(e)}")
+    # Supabase storage'daki logo URL'i (public/modli-logo.png)
+    if storage.configured:
+        return storage.get_public_url("wardrobe", "public/modli-logo.png")
     
     return None
 
 
+class ExpoPushSender:
+    """
+    Expo Push API'ye chunk gönderimi.
+    Chunk'lar en fazla EXPO_MAX_INFLIGHT eşzamanlı istekle gider; proje genelindeki bildirim/sn sınırı
+    tüm gönderimlerin paylaştığı bir token bucket ile korunur. Gövdeler gzip'lenir.
+    """
+
+    GZIP_MIN_BYTES = 1024
+    # Ticket details.error değerlerinden yalnızca bunlar yeniden denenir (DeviceNotRegistered vb. kalıcıdır)
+    RETRYABLE_TICKET_ERRORS = {"MessageRateExceeded"}
+
+    def __init__(self, max_inflight: int, rate_per_second: float, burst: int, gzip_enabled: bool):
+        self.max_inflight = max(1, max_inflight)
+        # Bir chunk tek seferde token alabilmeli
+        self.limiter = TokenBucket(rate_per_second, max(burst, EXPO_MAX_BATCH))
+        self.gzip_enabled = gzip_enabled
+        self.inflight = 0
+        self.requests = 0
+        self.request_errors = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.bytes_raw = 0
+        self.bytes_sent = 0
+        self.throttled_seconds = 0.0
+        self.retries = 0
+        self.requeued_messages = 0
+        self.deadline_exceeded = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._request_timings = LatencyHistogram()
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+        if EXPO_ACCESS_TOKEN:
+            headers["Authorization"] = f"Bearer {EXPO_ACCESS_TOKEN}"
+        return headers
+
+    def _encode(self, chunk: List[Dict[str, Any]], headers: Dict[str, str]) -> bytes:
+        body = json.dumps(chunk, separators=(",", ":")).encode("utf-8")
+        self.bytes_raw += len(body)
+        if self.gzip_enabled and len(body) >= self.GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        self.bytes_sent += len(body)
+        return body
+
+    @staticmethod
+    def _fail_chunk(chunk: List[Dict[str, Any]], error: str) -> List[Dict[str, Any]]:
+        return [{"token": msg.get("to"), "error": error, "details": None} for msg in chunk]
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Retry-After başlığı: saniye ya da HTTP tarihi"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+        """Üstel geri çekilme + full jitter; Retry-After varsa ondan kısa beklenmez"""
+        delay = random.uniform(0, min(EXPO_RETRY_MAX_DELAY, EXPO_RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _post_once(self, chunk: List[Dict[str, Any]]) -> tuple:
+        """
+        Tek deneme. (parça, yeniden denenecek mesajlar, Retry-After, hata) döndürür; istisna fırlatmaz.
+        Ağ hataları ve 429/5xx'te tüm chunk, 200'de yalnızca ticket'ı geçici hata veren mesajlar yeniden denenir.
+        """
+        self.throttled_seconds += await self.limiter.acquire(len(chunk))
+        headers = self._headers()
+        body = self._encode(chunk, headers)
+
+        self.inflight += 1
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            resp = await http_clients.get("expo").post(EXPO_PUSH_API_URL, content=body, headers=headers)
+        except httpx.HTTPError as exc:
+            logger.warning(f"Expo push gönderim hatası: {str(exc) or type(exc).__name__}")
+            self.request_errors += 1
+            return {"sent": [], "failed": [], "errors": []}, chunk, None, str(exc) or type(exc).__name__
+        except Exception as exc:
+            logger.error(f"Expo push gönderim hatası: {str(exc)}")
+            self.request_errors += 1
+            return {"sent": [], "failed": self._fail_chunk(chunk, str(exc)), "errors": [str(exc)]}, [], None, None
+        finally:
+            self.inflight -= 1
+            self._request_timings.observe(time.perf_counter() - started)
+
+        if resp.status_code != 200:
+            error_detail = resp.text[:200] if resp.text else "Unknown error"
+            self.request_errors += 1
+            error = f"{resp.status_code}: {error_detail}"
+            if resp.status_code == 429 or resp.status_code >= 500:
+                logger.warning(f"Expo push API geçici hata: {error}")
+                return {"sent": [], "failed": [], "errors": []}, chunk, \
+                    self._parse_retry_after(resp.headers.get("Retry-After")), error
+            logger.error(f"Expo push API hatası: {error}")
+            return {"sent": [], "failed": self._fail_chunk(chunk, error_detail), "errors": [error]}, [], None, None
+
+        try:
+            results = resp.json().get("data", [])
+        except ValueError:
+            results = []
+
+        part: Dict[str, List[Any]] = {"sent": [], "failed": [], "errors": []}
+        retry: List[Dict[str, Any]] = []
+        for msg, result in zip(chunk, results):
+            token = msg.get("to")
+            if result.get("status") == "ok":
+                part["sent"].append(token)
+            elif (result.get("details") or {}).get("error") in self.RETRYABLE_TICKET_ERRORS:
+                retry.append(msg)
+            else:
+                part["failed"].append(
+                    {
+                        "token": token,
+                        "error": result.get("message") or "Bilinmeyen hata",
+                        "details": result.get("details"),
+                    }
+                )
+        return part, retry, None, "MessageRateExceeded" if retry else None
+
+    async def post_chunk(self, chunk: List[Dict[str, Any]], deadline: Optional[float] = None) -> Dict[str, List[Any]]:
+        """
+        Chunk'ı gönderir, geçici hata alan mesajları geri çekilerek yeniden dener.
+        Deneme hakkı biterse ya da bir sonraki bekleme deadline'ı (time.monotonic) aşacaksa kalanlar failed olur.
+        """
+        result: Dict[str, List[Any]] = {"sent": [], "failed": [], "errors": []}
+        attempt = 0
+        while chunk:
+            part, retry, retry_after, error = await self._post_once(chunk)
+            for key in ("sent", "failed", "errors"):
+                result[key].extend(part[key])
+            if not retry:
+                break
+
+            attempt += 1
+            delay = self._backoff(attempt, retry_after)
+            out_of_time = deadline is not None and time.monotonic() + delay > deadline
+            if attempt >= EXPO_RETRY_MAX_ATTEMPTS or out_of_time:
+                if out_of_time:
+                    self.deadline_exceeded += 1
+                reason = f"{error} ({attempt} deneme{', süre doldu' if out_of_time else ''})"
+                result["failed"].extend(self._fail_chunk(retry, reason))
+                result["errors"].append(reason)
+                break
+
+            self.retries += 1
+            self.requeued_messages += len(retry)
+            await asyncio.sleep(delay)
+            chunk = retry
+
+        self.messages_sent += len(result["sent"])
+        self.messages_failed += len(result["failed"])
+        return result
+
+    async def dispatch(
+        self,
+        messages: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+        keep_sent: bool = True,
+        max_failed: Optional[int] = None,
+        deadline_seconds: Optional[float] = EXPO_SEND_DEADLINE,
+        on_chunk_start=None,
+        on_chunk_done=None,
+    ) -> Dict[str, Any]:
+        """
+        Mesajları chunk'lar halinde eşzamanlı gönderir. Sonuçlar tamamlanma sırasıyla birleştirilir
+        (sent/failed sırası garanti değildir). Aynı anda en fazla max_inflight chunk task'ı yaşar;
+        geri çekilip bekleyen chunk da slotunu tutar, böylece Expo'ya yük bindirilmez.
+        Kaynak async iterable ise yalnızca boş slot oldukça okunur; keep_sent=False ve max_failed ile
+        sonuç listeleri de sınırlanarak gönderim kitle boyutundan bağımsız bellekle yapılır.
+        on_chunk_start(seq, chunk) her chunk gönderilmeden önce sırayla beklenir; False dönerse okuma durur
+        (uçuştaki chunk'lar tamamlanır). on_chunk_done(seq, chunk, part) chunk sonucu geldiğinde çağrılır.
+        deadline_seconds=None ise yeniden denemeler yalnızca EXPO_RETRY_MAX_ATTEMPTS ile sınırlıdır.
+        """
+        result: Dict[str, Any] = {"sent": [], "failed": [], "errors": [], "sent_count": 0, "failed_count": 0}
+        semaphore = asyncio.Semaphore(self.max_inflight)
+        pending: set = set()
+        chunks = 0
+        total = 0
+        started = time.perf_counter()
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds and deadline_seconds > 0 else None
+        throttled_before = self.throttled_seconds
+        retries_before = self.retries
+
+        async def run(seq: int, chunk: List[Dict[str, Any]]):
+            try:
+                part = await self.post_chunk(chunk, deadline)
+                if on_chunk_done is not None:
+                    await on_chunk_done(seq, chunk, part)
+            finally:
+                semaphore.release()
+            result["sent_count"] += len(part["sent"])
+            result["failed_count"] += len(part["failed"])
+            if keep_sent:
+                result["sent"].extend(part["sent"])
+            room = None if max_failed is None else max(0, max_failed - len(result["failed"]))
+            result["failed"].extend(part["failed"][:room])
+            for error in part["errors"]:
+                if max_failed is None or len(result["errors"]) < max_failed:
+                    result["errors"].append(error)
+
+        try:
+            async for chunk in iter_chunks_async(messages, EXPO_MAX_BATCH):
+                await semaphore.acquire()
+                if on_chunk_start is not None and await on_chunk_start(chunks, chunk) is False:
+                    semaphore.release()
+                    break
+                task = asyncio.ensure_future(run(chunks, chunk))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                chunks += 1
+                total += len(chunk)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        duration = time.perf_counter() - started
+        result["throughput"] = {
+            "messages": total,
+            "chunks": chunks,
+            "duration_seconds": round(duration, 3),
+            "messages_per_second": round(total / duration, 1) if duration > 0 else None,
+            "throttled_seconds": round(self.throttled_seconds - throttled_before, 3),
+            "retries": self.retries - retries_before,
+        }
+        self.last_run = result["throughput"]
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_inflight": self.max_inflight,
+            "rate_per_second": self.limiter.rate,
+            "burst": self.limiter.capacity,
+            "gzip": self.gzip_enabled,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "request_errors": self.request_errors,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+            "bytes_raw": self.bytes_raw,
+            "bytes_sent": self.bytes_sent,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "retries": self.retries,
+            "requeued_messages": self.requeued_messages,
+            "deadline_exceeded": self.deadline_exceeded,
+            "request_latency": self._request_timings.stats(),
+            "last_run": self.last_run,
+        }
+
+
+expo_push_sender = ExpoPushSender(EXPO_MAX_INFLIGHT, EXPO_RATE_PER_SECOND, EXPO_RATE_BURST, EXPO_GZIP_ENABLED)
+
+
 async def send_expo_push_notifications(
-    tokens_info: List[Dict[str, Any]], title: str, body: str, data: Optional[Dict[str, Any]] = None
+    tokens_info: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+    title: str,
+    body: str,
+    data: Optional[Dict[str, Any]] = None,
+    keep_sent: bool = True,
+    max_failed: Optional[int] = None,
+    **dispatch_options,
 ) -> Dict[str, Any]:
     """
     Expo Push API üzerinden bildirim gönderir.
     Hem Expo hem FCM token'larını destekler (Expo Push API her ikisini de handle eder).
     Modli logosu ve ismi ile gönderilir.
+    tokens_info liste ya da async generator (ör. push_token_mirror.iter_tokens) olabilir; mesajlar
+    gönderim ilerledikçe üretilir. dispatch_options ExpoPushSender.dispatch'e aktarılır.
     """
-    if not tokens_info:
-        return {"sent": [], "failed": [], "errors": ["Kayıtlı push token yok"]}
-    
     # Logo URL'ini al
     logo_url = await get_app_logo_url()
 
-    # Tüm token'ları mesaj formatına çevir (Expo Push API hem Expo hem FCM token'larını kabul eder)
     # Modli logo ve isim bilgilerini ekle
     notification_data = {
         "app_name": "Modli",
         **(data or {})
     }
-    
-    messages = []
-    for token_item in tokens_info:
-        if not token_item.get("token"):
-            continue
-            
-        platform = token_item.get("platform", "unknown")
-        message = {
-            "to": token_item["token"],
-            "sound": "default",
-            "title": title,
-            "body": body,
-            "subtitle": "Modli",  # iOS için alt başlık - "Expo" yerine "Modli" görünecek
-            "data": notification_data,
-            "priority": "default",
+    seen_tokens = 0
+
+    async def build_messages() -> AsyncIterator[Dict[str, Any]]:
+        nonlocal seen_tokens
+        async for batch in iter_chunks_async(tokens_info, EXPO_MAX_BATCH):
+            for token_item in batch:
+                seen_tokens += 1
+                if not token_item.get("token"):
+                    continue
+
+                platform = token_item.get("platform", "unknown")
+                message = {
+                    "to": token_item["token"],
+                    "sound": "default",
+                    "title": title,
+                    "body": body,
+                    "subtitle": "Modli",  # iOS için alt başlık - "Expo" yerine "Modli" görünecek
+                    "data": notification_data,
+                    "priority": "default",
+                }
+
+                # Android için icon ekle (logo URL'i varsa)
+                if logo_url and platform == "android":
+                    message["icon"] = logo_url
+
+                # Android için channel ID (opsiyonel, daha iyi kontrol için)
+                if platform == "android":
+                    message["channelId"] = "default"
+
+                yield message
+
+    result = await expo_push_sender.dispatch(
+        build_messages(), keep_sent=keep_sent, max_failed=max_failed, **dispatch_options
+    )
+    if not result["throughput"]["messages"]:
+        result["errors"].append("Geçerli push token yok" if seen_tokens else "Kayıtlı push token yok")
+    return result
+
+
+class JobLeaseLost(Exception):
+    """İşin lease'i kaybedildi (süresi doldu, recover() işi başka bir worker'a verdi); çalıştırma durmalı"""
+
+
+class PushBroadcastJobs:
+    """
+    Push bildirim gönderimlerini kalıcı arka plan işleri olarak çalıştırır (MongoDB: push_broadcast_jobs).
+    - İş durumu: queued -> running -> succeeded | failed | cancelled
+    - Alıcılar push_tokens_mirror'dan push_token sırasıyla okunur. Her chunk gönderilmeden önce token aralığı
+      işe "sending" olarak yazılır, sonucu gelince "done" olur ve sent/failed sayaçları artar; ardışık biten
+      chunk'lar checkpoint'i ilerletir.
+    - Lease'i dolan iş (crash/restart) kaldığı yerden devam eder: checkpoint'ten sonrası okunur, kayıtlı chunk
+      aralıkları atlanır. Sonucu bilinmeyen ("sending") chunk'lar tekrar gönderilmez, failed sayılır.
+    - İptal: kuyruktaki iş hemen iptal olur; çalışan iş yeni chunk almayı bırakır, uçuştakiler tamamlanır.
+    - Çalışan işin lease'i heartbeat ile yenilenir; tüm yazımlar {worker_id, status: running} koşulludur,
+      eşleşmezse (iş başka worker'a geçti) çalıştırma JobLeaseLost ile durur.
+    """
+
+    MAX_ERRORS = 50
+    MAX_FAILED_SAMPLES = 200
+    CANCEL_CHECK_INTERVAL = 2.0
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._enqueued: set = set()
+        self._running: set = set()  # bu process'te çalışan işler
+        self._cancel_requested: set = set()  # _running'in iptal istenen alt kümesi
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.recovered = 0
+        self.interrupted_messages = 0
+
+    @property
+    def collection(self):
+        return db.push_broadcast_jobs
+
+    async def start(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+        await self.collection.create_index("created_at")
+        await self.recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self, title: str, body: str, data: Optional[Dict[str, Any]], target_user_id: Optional[str], created_by: Optional[str]
+    ) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "title": title,
+            "body": body,
+            "data": data,
+            "target_user_id": target_user_id,
+            "created_by": created_by,
+            "total": None,
+            "sent": 0,
+            "failed": 0,
+            "errors": [],
+            "failed_samples": [],
+            "chunks": [],
+            "next_seq": 0,
+            "checkpoint": None,
+            "cancel_requested": False,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
         }
-        
-        # Android için icon ekle (logo URL'i varsa)
-        if logo_url and platform == "android":
-            message["icon"] = logo_url
-        
-        # Android için channel ID (opsiyonel, daha iyi kontrol için)
-        if platform == "android":
-            message["channelId"] = "default"
-        
-        messages.append(message)
+        await self.collection.insert_one(dict(job))
+        self._enqueue(job["id"])
+        return job
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._enqueued:
+            self._enqueued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "cancel_requested": True, "updated_at": now, "finished_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            self.cancelled += 1
+            return job
+        # Çalışan iş: worker bir sonraki chunk'ta görür (başka process'teyse Mongo'dan okur)
+        job = await self.collection.find_one_and_update(
+            {"id": job_id, "status": "running"},
+            {"$set": {"cancel_requested": True, "updated_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None and job_id in self._running:
+            self._cancel_requested.add(job_id)
+        return job or await self.get(job_id)
+
+    async def recover(self):
+        """Lease'i dolmuş running işleri kuyruğa geri alır (checkpoint'ten devam eder), bekleyenleri sıraya koyar"""
+        now = datetime.utcnow()
+        expired = {"status": "running", "lease_expires_at": {"$lt": now}}
+        exhausted = await self.collection.update_many(
+            {**expired, "attempts": {"$gte": PUSH_JOB_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed", "error": "Job interrupted too many times", "updated_at": now, "finished_at": now}},
+        )
+        requeued = await self.collection.update_many(
+            expired,
+            {"$set": {"status": "queued", "updated_at": now}, "$unset": {"worker_id": "", "lease_expires_at": ""}},
+        )
+        if exhausted.modified_count or requeued.modified_count:
+            logger.warning(f"Push jobs recovered: requeued={requeued.modified_count}, failed={exhausted.modified_count}")
+            self.recovered += requeued.modified_count
 
-    if not messages:
-        return {"sent": [], "failed": [], "errors": ["Geçerli push token yok"]}
+        async for job in self.collection.find({"status": "queued"}, {"id": 1}).sort("created_at", 1):
+            self._enqueue(job["id"])
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    if EXPO_ACCESS_TOKEN:
-        headers["Authorization"] = f"Bearer {EXPO_ACCESS_TOKEN}"
+    async def _recovery_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Push job recovery error: {str(e)}")
+
+    def _lease(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=PUSH_JOB_LEASE_SECONDS)
+
+    def _owned(self, job_id: str) -> Dict[str, Any]:
+        return {"id": job_id, "worker_id": self.worker_id, "status": "running"}
 
-    sent_tokens: List[str] = []
-    failed: List[Dict[str, Any]] = []
-    errors: List[str] = []
+    async def _update_owned(self, job_id: str, update: Dict[str, Any], **match):
+        result = await self.collection.update_one({**self._owned(job_id), **match}, update)
+        if result.matched_count == 0:
+            raise JobLeaseLost(job_id)
 
-    async with httpx.AsyncClient(timeout=20.0) as http_client:
-        for chunk in chunk_list(messages, EXPO_MAX_BATCH):
+    async def _heartbeat(self, job_id: str, lease: Dict[str, bool]):
+        """Çalıştırma boyunca (mirror senkronu ve sayım dahil) lease'i yeniler"""
+        while True:
+            await asyncio.sleep(max(1.0, PUSH_JOB_LEASE_SECONDS / 3))
             try:
-                resp = await http_client.post(EXPO_PUSH_API_URL, json=chunk, headers=headers)
-            except Exception as exc:
-                logger.error(f"Expo push gönderim hatası: {str(exc)}")
-                errors.append(str(exc))
-                # Chunk'taki tüm token'ları failed olarak işaretle
-                for msg in chunk:
-                    failed.append({
-                        "token": msg.get("to"),
-                        "error": str(exc),
-                        "details": None
-                    })
-                continue
+                await self._update_owned(job_id, {"$set": {"lease_expires_at": self._lease()}})
+            except JobLeaseLost:
+                lease["lost"] = True
+                logger.warning(f"Push job {job_id}: lease lost, stopping")
+                return
+            except Exception as e:
+                logger.warning(f"Push job {job_id} heartbeat error: {str(e)}")
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "started_at": now,
+                    "updated_at": now,
+                    "lease_expires_at": self._lease(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
 
-            if resp.status_code != 200:
-                error_detail = resp.text[:200] if resp.text else "Unknown error"
-                logger.error(f"Expo push API hatası: {resp.status_code} - {error_detail}")
-                for msg in chunk:
-                    failed.append({
-                        "token": msg.get("to"),
-                        "error": error_detail,
-                        "details": None
-                    })
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._enqueued.discard(job_id)
+            job = None
+            try:
+                job = await self._claim(job_id)
+                if job is None:
+                    # Başka bir worker aldı, iptal edildi veya iş zaten bitti
+                    continue
+                self._running.add(job_id)
+                lease = {"lost": False}
+                heartbeat = asyncio.create_task(self._heartbeat(job_id, lease))
+                try:
+                    await self._run(job, lease)
+                finally:
+                    heartbeat.cancel()
+            except JobLeaseLost:
+                # Yeni sahibi checkpoint'ten devam eder; bu worker işe artık yazmaz
+                logger.warning(f"Push job {job_id}: lease lost, run abandoned")
+            except asyncio.CancelledError:
+                if job is not None:
+                    # Shutdown: iş bir sonraki başlatmada checkpoint'ten devam eder
+                    await self.collection.update_one(
+                        {"id": job_id, "status": "running", "worker_id": self.worker_id},
+                        {"$set": {"status": "queued", "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}},
+                    )
+                raise
+            except Exception as e:
+                logger.error(f"Push job {job_id} error: {str(e)}")
+                if job is not None:
+                    now = datetime.utcnow()
+                    result = await self.collection.update_one(
+                        self._owned(job_id),
+                        {"$set": {"status": "failed", "error": str(e), "updated_at": now, "finished_at": now},
+                         "$unset": {"lease_expires_at": ""}},
+                    )
+                    self.failed += result.modified_count
+            finally:
+                self._running.discard(job_id)
+                self._cancel_requested.discard(job_id)
+                self._queue.task_done()
+
+    async def _interrupt_in_doubt(self, job: Dict[str, Any]):
+        """Önceki çalıştırmada sonucu gelmeden kesilen chunk'lar: tekrar gönderilmez, failed sayılır"""
+        for chunk in job.get("chunks", []):
+            if chunk.get("status") != "sending":
                 continue
+            error = f"Chunk {chunk['seq']} sonucu bilinmiyor (yeniden başlatma), tekrar gönderilmedi"
+            await self._update_owned(
+                job["id"],
+                {
+                    "$set": {"chunks.$.status": "interrupted"},
+                    "$inc": {"failed": chunk["size"]},
+                    "$push": {"errors": {"$each": [error], "$slice": -self.MAX_ERRORS}},
+                },
+                **{"chunks.seq": chunk["seq"]},
+            )
+            self.interrupted_messages += chunk["size"]
+            logger.warning(f"Push job {job['id']}: {error} ({chunk['size']} mesaj)")
+
+    @staticmethod
+    def _check_lease(job_id: str, lease: Dict[str, bool]):
+        if lease["lost"]:
+            raise JobLeaseLost(job_id)
+
+    async def _run(self, job: Dict[str, Any], lease: Dict[str, bool]):
+        job_id = job["id"]
+        target_user_id = job.get("target_user_id")
+        resuming = job.get("checkpoint") is not None or bool(job.get("chunks"))
+
+        # Mirror arka planda senkronlanmıyorsa yeni iş öncesi tazelenir
+        if not PUSH_MIRROR_ENABLED and not resuming:
+            await push_token_mirror.sync(full=True)
+        else:
+            await push_token_mirror.sync(full=True, skip_if_ready=True)
+
+        self._check_lease(job_id, lease)
+        await self._interrupt_in_doubt(job)
+        skip_ranges = [(chunk["first"], chunk["last"]) for chunk in job.get("chunks", [])]
+        total = job.get("total")
+        if total is None:
+            total = await push_token_mirror.count_tokens(target_user_id)
+            await self._update_owned(job_id, {"$set": {"total": total, "lease_expires_at": self._lease()}})
+
+        base_seq = job.get("next_seq", 0)
+        progress = {"next_commit": base_seq, "checkpoint": job.get("checkpoint"), "cancelled": False, "checked_at": 0.0}
+        completed: Dict[int, str] = {}
+        commit_lock = asyncio.Lock()
+        tokens_summary: List[Dict[str, Any]] = []
+
+        async def recipients() -> AsyncIterator[Dict[str, Any]]:
+            async for item in push_token_mirror.iter_tokens(target_user_id, after=job.get("checkpoint")):
+                token = item["token"]
+                if any(first <= token <= last for first, last in skip_ranges):
+                    continue
+                if len(tokens_summary) < PUSH_LOG_TOKEN_SAMPLE:
+                    tokens_summary.append({
+                        "token": token[:20] + "..." if len(token) > 20 else token,
+                        "platform": item.get("platform", "unknown"),
+                        "user_id": item.get("user_id"),
+                        "is_expo": is_expo_push_token(token),
+                        "is_fcm": is_fcm_token(token),
+                    })
+                yield item
+
+        async def cancel_requested() -> bool:
+            if job_id in self._cancel_requested:
+                return True
+            if time.monotonic() - progress["checked_at"] >= self.CANCEL_CHECK_INTERVAL:
+                progress["checked_at"] = time.monotonic()
+                current = await self.collection.find_one({"id": job_id}, {"cancel_requested": 1})
+                return bool(current and current.get("cancel_requested"))
+            return False
+
+        async def on_chunk_start(local_seq: int, chunk: List[Dict[str, Any]]):
+            self._check_lease(job_id, lease)
+            if await cancel_requested():
+                progress["cancelled"] = True
+                return False
+            seq = base_seq + local_seq
+            await self._update_owned(
+                job_id,
+                {
+                    "$push": {"chunks": {
+                        "seq": seq, "first": chunk[0]["to"], "last": chunk[-1]["to"], "size": len(chunk), "status": "sending",
+                    }},
+                    "$set": {"next_seq": seq + 1, "updated_at": datetime.utcnow(), "lease_expires_at": self._lease()},
+                },
+            )
 
-            resp_json = resp.json()
-            results = resp_json.get("data", [])
-
-            for msg, result in zip(chunk, results):
-                token = msg.get("to")
-                if result.get("status") == "ok":
-                    sent_tokens.append(token)
-                else:
-                    failed.append(
+        async def on_chunk_done(local_seq: int, chunk: List[Dict[str, Any]], part: Dict[str, List[Any]]):
+            seq = base_seq + local_seq
+            update: Dict[str, Any] = {
+                "$set": {"chunks.$.status": "done", "updated_at": datetime.utcnow(), "lease_expires_at": self._lease()},
+                "$inc": {"sent": len(part["sent"]), "failed": len(part["failed"])},
+            }
+            push: Dict[str, Any] = {}
+            if part["errors"]:
+                push["errors"] = {"$each": part["errors"], "$slice": -self.MAX_ERRORS}
+            if part["failed"]:
+                push["failed_samples"] = {"$each": part["failed"], "$slice": self.MAX_FAILED_SAMPLES}
+            if push:
+                update["$push"] = push
+            await self._update_owned(job_id, update, **{"chunks.seq": seq})
+
+            # Checkpoint yalnızca ardışık biten chunk'lar üzerinden ilerler
+            async with commit_lock:
+                completed[seq] = chunk[-1]["to"]
+                advanced = False
+                while progress["next_commit"] in completed:
+                    progress["checkpoint"] = completed.pop(progress["next_commit"])
+                    progress["next_commit"] += 1
+                    advanced = True
+                if advanced:
+                    await self._update_owned(
+                        job_id,
                         {
-                            "token": token,
-                            "error": result.get("message") or "Bilinmeyen hata",
-                            "details": result.get("details"),
-                        }
+                            "$set": {"checkpoint": progress["checkpoint"]},
+                            "$pull": {"chunks": {"last": {"$lte": progress["checkpoint"]}}},
+                        },
                     )
 
-    return {"sent": sent_tokens, "failed": failed, "errors": errors}
+        result = await send_expo_push_notifications(
+            recipients(), job["title"], job["body"], job.get("data"),
+            keep_sent=False, max_failed=EXPO_MAX_REPORTED_FAILURES, deadline_seconds=None,
+            on_chunk_start=on_chunk_start, on_chunk_done=on_chunk_done,
+        )
+
+        now = datetime.utcnow()
+        throughput = result.get("throughput") or {}
+        update: Dict[str, Any] = {"status": "succeeded", "throughput": throughput, "updated_at": now, "finished_at": now}
+        if progress["cancelled"]:
+            update["status"] = "cancelled"
+        elif not total and not throughput.get("messages"):
+            # Kuyruğa alınırken token vardı ama gönderim anında alıcı kalmadı
+            update.update(status="failed", error="Alıcı bulunamadı: gönderilecek push token yok")
+        final = await self.collection.find_one_and_update(
+            self._owned(job_id),
+            {"$set": update, "$unset": {"lease_expires_at": ""}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if final is None:
+            raise JobLeaseLost(job_id)
+        status = final["status"]
+        if status == "cancelled":
+            self.cancelled += 1
+        elif status == "failed":
+            self.failed += 1
+        else:
+            self.completed += 1
+        logger.info(
+            f"Push job {job_id} {status}: sent={final['sent']}, failed={final['failed']}, total={final.get('total')}, "
+            f"{throughput.get('messages_per_second')} mesaj/sn"
+        )
+
+        # Push notification'ı logla
+        await log_push_notification(
+            title=job["title"],
+            body=job["body"],
+            target_user_id=target_user_id,
+            sent_count=final["sent"],
+            failed_count=final["failed"],
+            tokens_info=tokens_summary,
+            errors=final.get("errors", []),
+            total_tokens=final.get("total"),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "recovered": self.recovered,
+            "interrupted_messages": self.interrupted_messages,
+        }
+
+
+push_jobs = PushBroadcastJobs(workers=PUSH_JOB_WORKERS)
+
+
+def serialize_push_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Mongo gönderim işini API cevabına çevirir"""
+    total = job.get("total")
+    sent = job.get("sent", 0)
+    failed = job.get("failed", 0)
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "title": job.get("title"),
+        "body": job.get("body"),
+        "target_user_id": job.get("target_user_id"),
+        "total": total,
+        "sent": sent,
+        "failed": failed,
+        "remaining": max(0, total - sent - failed) if total is not None else None,
+        "cancel_requested": job.get("cancel_requested", False),
+        "errors": job.get("errors", []),
+        "failed_samples": job.get("failed_samples", []),
+        "throughput": job.get("throughput"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+    }
+    for key in ("created_at", "updated_at", "started_at", "finished_at"):
+        value = job.get(key)
+        view[key] = value.isoformat() if isinstance(value, datetime) else value
+    return view
 
 
 # Define Models
@@ -387,12 +2217,24 @@ class TryOnRequest(BaseModel):
     clothing_image: str  # public URL for clothing image
     clothing_category: str
     is_free_trial: bool = False  # True if using free trial credit
+    force_refresh: bool = False  # True: sonuç önbelleğini atla, fal.ai'yi tekrar çalıştır
 
 class TryOnResponse(BaseModel):
     success: bool
     result_image_url: Optional[str] = None
     error: Optional[str] = None
 
+class TryOnBatchItem(BaseModel):
+    clothing_image: str  # public URL for clothing image
+    clothing_category: str
+
+class TryOnBatchRequest(BaseModel):
+    user_id: str
+    user_image: str  # public URL for user image
+    items: List[TryOnBatchItem]
+    is_free_trial: bool = False
+    force_refresh: bool = False
+
 class WeatherRequest(BaseModel):
     latitude: float
     longitude: float
@@ -402,6 +2244,9 @@ class ImageUploadResponse(BaseModel):
     success: bool
     full_url: Optional[str] = None
     thumbnail_url: Optional[str] = None
+    variants: Optional[Dict[str, Dict[str, str]]] = None  # {"640": {"jpeg": url, "webp": url}, ...}
+    original_url: Optional[str] = None  # only when keep_original=true
+    blurhash: Optional[str] = None  # placeholder painted before the thumbnail loads
     error: Optional[str] = None
 
 class WardrobeItemCreate(BaseModel):
@@ -412,6 +2257,7 @@ class WardrobeItemCreate(BaseModel):
     category: str
     season: Optional[str] = None
     color: Optional[str] = None
+    blurhash: Optional[str] = None
 
 
 class TryOnResultCreate(BaseModel):
@@ -1584,38 +3430,145 @@ async def get_status_checks():
 
 
 # Authentication Functions
-async def verify_supabase_user(authorization: str = Header(None)):
+class LocalAuthUnavailable(Exception):
+    """Token yerel olarak doğrulanamıyor (secret/JWKS anahtarı yok); remote doğrulama gerekir."""
+
+
+class SupabaseJWKSCache:
     """
-    Verify Supabase JWT token and return user info.
-    Raises HTTPException if token is invalid.
+    Supabase JWKS anahtarlarını bellekte tutar.
+    TTL dolunca veya bilinmeyen bir `kid` gelince anahtarları yeniden çeker (key rotation).
+    Yenileme başarısız olursa eldeki anahtarlar kullanılmaya devam eder.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.replace("Bearer ", "")
-    
+
+    def __init__(self, ttl: int = 600, min_refresh_interval: float = 30.0):
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+
+    async def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        expired = time.monotonic() - self._fetched_at > self.ttl
+        if expired or kid not in self._keys:
+            await self._refresh()
+        return self._keys.get(kid)
+
+    async def _refresh(self):
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Beklerken başka bir istek anahtarları yenilemiş olabilir
+            if self._fetched_at >= requested_at:
+                return
+            # Bilinmeyen kid ile gelen isteklerin JWKS endpoint'ini dövmesini engelle
+            if time.monotonic() - self._last_attempt < self.min_refresh_interval:
+                return
+            self._last_attempt = time.monotonic()
+
+            try:
+                http_client = http_clients.get("supabase_auth")
+                resp = await http_client.get(self.url)
+                resp.raise_for_status()
+                keys: Dict[str, jwt.PyJWK] = {}
+                for jwk in resp.json().get("keys", []):
+                    try:
+                        keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                    except jwt.PyJWTError as e:
+                        logger.warning(f"JWKS key atlandı ({jwk.get('kid')}): {str(e)}")
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+                logger.info(f"Supabase JWKS yenilendi: {len(keys)} key")
+            except Exception as e:
+                logger.warning(f"Supabase JWKS alınamadı: {str(e)}")
+
+
+supabase_jwks = SupabaseJWKSCache(ttl=SUPABASE_JWKS_CACHE_TTL)
+
+
+def supabase_user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """JWT claim'lerini /auth/v1/user cevabıyla aynı şekle çevirir"""
+    return {
+        "id": claims.get("sub"),
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata") or {},
+        "user_metadata": claims.get("user_metadata") or {},
+        "is_anonymous": claims.get("is_anonymous", False),
+    }
+
+
+async def verify_supabase_token_locally(token: str) -> Dict[str, Any]:
+    """
+    Supabase access token'ını ağ çağrısı yapmadan doğrular.
+    HS256 token'lar SUPABASE_JWT_SECRET ile, asimetrik token'lar (RS256/ES256) JWKS ile doğrulanır.
+    Not: Supabase'de logout ile iptal edilen token'lar exp dolana kadar geçerli sayılır.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    alg = header.get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise LocalAuthUnavailable("SUPABASE_JWT_SECRET not configured")
+        key: Any = SUPABASE_JWT_SECRET
+    elif alg in ("RS256", "ES256"):
+        if not SUPABASE_URL:
+            raise LocalAuthUnavailable("SUPABASE_URL not configured")
+        jwk = await supabase_jwks.get_key(header.get("kid"))
+        if jwk is None:
+            raise LocalAuthUnavailable(f"No JWKS key for kid={header.get('kid')}")
+        key = jwk.key
+    else:
+        logger.warning(f"Unsupported Supabase token alg: {alg}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=SUPABASE_JWT_AUDIENCE,
+            issuer=SUPABASE_JWT_ISSUER or None,
+            options={"require": ["exp", "sub"], "verify_iss": bool(SUPABASE_JWT_ISSUER)},
+            leeway=5,
+        )
+    except jwt.PyJWTError as e:
+        logger.warning(f"Invalid Supabase token: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    return supabase_user_from_claims(claims)
+
+
+async def fetch_supabase_user_remote(token: str) -> Dict[str, Any]:
+    """Token'ı Supabase Auth'a (/auth/v1/user) sorarak doğrular"""
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise HTTPException(status_code=500, detail="Supabase authentication not configured")
-    
+
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{SUPABASE_URL.rstrip('/')}/auth/v1/user",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "apikey": SUPABASE_ANON_KEY
-                }
-            )
+        http_client = http_clients.get("supabase_auth")
+        response = await http_client.get(
+            f"{SUPABASE_URL.rstrip('/')}/auth/v1/user",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "apikey": SUPABASE_ANON_KEY
+            }
+        )
             
-            if response.status_code != 200:
-                logger.warning(f"Invalid Supabase token: {response.status_code}")
-                raise HTTPException(status_code=401, detail="Invalid or expired token")
+        if response.status_code != 200:
+            logger.warning(f"Invalid Supabase token: {response.status_code}")
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
             
-            user_data = response.json()
-            return user_data
+        user_data = response.json()
+        return user_data
             
     except httpx.RequestError as e:
         logger.error(f"Supabase auth error: {str(e)}")
@@ -1627,6 +3580,145 @@ async def verify_supabase_user(authorization: str = Header(None)):
         raise HTTPException(status_code=500, detail="Authentication error")
 
 
+auth_token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES)
+auth_singleflight = SingleFlight()
+
+
+def token_expires_in(token: str) -> Optional[float]:
+    """Token'ın exp claim'ine kalan süre (saniye); okunamazsa None"""
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+        return float(claims["exp"]) - time.time()
+    except Exception:
+        return None
+
+
+async def fetch_supabase_user_cached(token: str) -> Dict[str, Any]:
+    """
+    Remote doğrulamayı token hash'i ile önbelleğe alır.
+    Geçerli sonuçlar en fazla token'ın exp anına kadar, 401 sonuçları kısa süre saklanır.
+    Aynı token için eşzamanlı istekler tek bir /auth/v1/user çağrısında birleştirilir.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    found, user = auth_token_cache.get(key)
+    if found:
+        if user is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        return user
+
+    async def _validate() -> Dict[str, Any]:
+        try:
+            user_data = await fetch_supabase_user_remote(token)
+        except HTTPException as e:
+            if e.status_code == 401:
+                auth_token_cache.set(key, None, AUTH_CACHE_NEGATIVE_TTL)
+            raise
+        expires_in = token_expires_in(token)
+        if expires_in is not None:
+            auth_token_cache.set(key, user_data, min(AUTH_CACHE_TTL, expires_in))
+        return user_data
+
+    return await auth_singleflight.do(key, _validate)
+
+
+def auth_cache_stats() -> Dict[str, Any]:
+    return {
+        "enabled": AUTH_CACHE_ENABLED,
+        **auth_token_cache.stats(),
+        "coalesced": auth_singleflight.coalesced,
+        "inflight": len(auth_singleflight),
+    }
+
+
+async def verify_supabase_user(authorization: str = Header(None)):
+    """
+    Verify Supabase JWT token and return user info.
+    SUPABASE_AUTH_MODE ile yerel (local), remote veya hybrid doğrulama seçilir.
+    Raises HTTPException if token is invalid.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization format")
+    
+    token = authorization.replace("Bearer ", "")
+
+    if SUPABASE_AUTH_MODE in ("local", "hybrid"):
+        try:
+            return await verify_supabase_token_locally(token)
+        except LocalAuthUnavailable as e:
+            if SUPABASE_AUTH_MODE == "local":
+                logger.error(f"Local token verification unavailable: {str(e)}")
+                raise HTTPException(status_code=503, detail="Authentication service unavailable")
+            logger.warning(f"Local token verification unavailable, falling back to remote: {str(e)}")
+
+    if AUTH_CACHE_ENABLED:
+        return await fetch_supabase_user_cached(token)
+    return await fetch_supabase_user_remote(token)
+
+
+tryon_transfer_timings: Dict[str, LatencyHistogram] = {
+    "download_ttfb": LatencyHistogram(),
+    "transfer": LatencyHistogram(),
+    "upload": LatencyHistogram(),
+}
+tryon_transfer_bytes = {"total": 0, "max": 0, "rejected_too_large": 0}
+
+
+async def stream_result_to_storage(source_url: str, bucket: str, path: str, http_client: httpx.AsyncClient) -> str:
+    """
+    fal.ai CDN'indeki sonucu belleğe almadan, parça parça Supabase Storage'a aktarır.
+    Upload commit olunca public URL döner. TRYON_RESULT_MAX_BYTES aşılırsa aktarım iptal edilir.
+    Aşama süreleri (download TTFB, transfer, upload) tryon_transfer_timings'e yazılır.
+    """
+    started = time.perf_counter()
+    async with http_client.stream("GET", source_url) as resp:
+        ttfb = time.perf_counter() - started
+        tryon_transfer_timings["download_ttfb"].observe(ttfb)
+        if resp.status_code != 200:
+            raise StorageError(f"Result download failed: {resp.status_code}")
+
+        declared_length = int(resp.headers.get("content-length") or 0) or None
+        if declared_length and declared_length > TRYON_RESULT_MAX_BYTES:
+            # Sıkıştırılmış gövdede de geçerli: açılan gövde en az bu kadar büyüktür
+            tryon_transfer_bytes["rejected_too_large"] += 1
+            raise StorageError(f"Result too large: {declared_length} bytes")
+        # aiter_bytes Content-Encoding'i (gzip/br) açar; o durumda Content-Length açılmış gövdeyle uyuşmaz
+        encoded = resp.headers.get("content-encoding", "identity").strip().lower() not in ("", "identity")
+        upload_length = None if encoded else declared_length
+
+        content_type = resp.headers.get("content-type", "")
+        if not content_type.startswith("image/"):
+            content_type = "image/jpeg"
+
+        transferred = 0
+
+        async def body():
+            nonlocal transferred
+            transfer_started = time.perf_counter()
+            async for chunk in resp.aiter_bytes(TRANSFER_CHUNK_SIZE):
+                transferred += len(chunk)
+                if transferred > TRYON_RESULT_MAX_BYTES:
+                    tryon_transfer_bytes["rejected_too_large"] += 1
+                    raise StorageError(f"Result exceeds {TRYON_RESULT_MAX_BYTES} bytes")
+                yield chunk
+            tryon_transfer_timings["transfer"].observe(time.perf_counter() - transfer_started)
+
+        upload_started = time.perf_counter()
+        await storage.upload(bucket, path, body(), content_type=content_type, content_length=upload_length)
+        upload_seconds = time.perf_counter() - upload_started
+        tryon_transfer_timings["upload"].observe(upload_seconds)
+
+    tryon_transfer_bytes["total"] += transferred
+    tryon_transfer_bytes["max"] = max(tryon_transfer_bytes["max"], transferred)
+    logger.info(
+        f"Try-on result streamed: {transferred} bytes, ttfb={ttfb:.3f}s, upload={upload_seconds:.3f}s"
+    )
+    return storage.get_public_url(bucket, path)
+
+
 async def try_on_with_fal(user_image: str, clothing_image: str, http_client: httpx.AsyncClient, user_id: Optional[str] = None) -> TryOnResponse:
     """Use fal.ai for all users"""
     try:
@@ -1643,23 +3735,11 @@ async def try_on_with_fal(user_image: str, clothing_image: str, http_client: htt
         payload = {
             "person_image_url": user_image,
             "clothing_image_url": clothing_image,
-            # Preservation settings - keep person and clothing as original as possible
-            "preserve_pose": True,           # Keep body pose unchanged
-            "preserve_face": True,           # Keep face unchanged
-            "preserve_background": True,     # Keep background unchanged
-            # Output ratio - always square for consistent UI crops
-            "ratio": "1:1",
-            # Quality settings - optimized for speed/quality balance
-            "num_images": 1,
-            "num_inference_steps": 30,       # Balanced: 30 steps (was 50, too slow)
-            "guidance_scale": 7.5,           # Higher = more faithful to inputs
-            # Fidelity settings
-            "clothing_fidelity": "high",     # Keep clothing details accurate
-            "body_fidelity": "high"          # Keep body proportions accurate
+            **FAL_TRYON_PARAMS,
         }
         
         response = await http_client.post(
-            "https://fal.run/fal-ai/image-apps-v2/virtual-try-on",
+            FAL_TRYON_URL,
             headers=headers,
             json=payload
         )
@@ -1672,40 +3752,28 @@ async def try_on_with_fal(user_image: str, clothing_image: str, http_client: htt
             if images:
                 image_url = images[0].get("url")
                 if image_url:
-                    img_response = await http_client.get(image_url)
-                    if img_response.status_code == 200:
-                        result_url: Optional[str] = None
-
-                        if SUPABASE_URL and SUPABASE_KEY:
-                            try:
-                                from supabase import create_client, Client
-                                supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-                                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_result.jpg"
-                                storage_path = f"{user_id or 'public'}/results/{filename}"
-
-                                upload_res = supabase.storage.from_("wardrobe").upload(
-                                    path=storage_path,
-                                    file=img_response.content,
-                                    file_options={"content-type": "image/jpeg"},
-                                )
-
-                                if getattr(upload_res, "error", None):
-                                    logger.error(f"Supabase storage upload error: {upload_res.error}")
-                                else:
-                                    result_url = supabase.storage.from_("wardrobe").get_public_url(storage_path)
-                            except Exception as e:
-                                logger.error(f"Supabase upload failed for try-on result: {str(e)}")
-
-                        if not result_url:
-                            result_url = image_url
-
-                        logger.info("Successfully generated try-on image via fal.ai!")
-                        return TryOnResponse(
-                            success=True,
-                            result_image_url=result_url
-                        )
+                    result_url: Optional[str] = None
+
+                    if storage.configured:
+                        try:
+                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                            filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_result.jpg"
+                            storage_path = f"{user_id or 'public'}/results/{filename}"
+
+                            result_url = await stream_result_to_storage(
+                                image_url, "wardrobe", storage_path, http_client
+                            )
+                        except Exception as e:
+                            logger.error(f"Supabase upload failed for try-on result: {str(e)}")
+
+                    if not result_url:
+                        result_url = image_url
+
+                    logger.info("Successfully generated try-on image via fal.ai!")
+                    return TryOnResponse(
+                        success=True,
+                        result_image_url=result_url
+                    )
             
             return TryOnResponse(success=False, error="No images returned from API")
         else:
@@ -1718,36 +3786,509 @@ async def try_on_with_fal(user_image: str, clothing_image: str, http_client: htt
         return TryOnResponse(success=False, error=str(e))
 
 
-@api_router.post("/try-on", response_model=TryOnResponse)
-async def virtual_try_on(
-    request: TryOnRequest,
-    user = Depends(verify_supabase_user)
-):
+def is_fetchable_image_url(url: Optional[str]) -> bool:
     """
-    Generate a virtual try-on image using fal.ai
-    - All users (including free trial) use fal.ai for best quality
-    - Generates 1 image per request
-    - Requires valid Supabase JWT token
+    İstemcinin verdiği URL'yi sunucunun indirmesine izin verilir mi (SSRF koruması):
+    yalnızca Supabase Storage public URL'leri ve MEDIA_FETCH_ALLOWED_HOSTS'taki https host'ları.
+    İndirmeler yönlendirme izlemez; böylece izinli bir host başka bir adrese yönlendiremez.
+    """
+    if storage.is_public_url(url):
+        return True
+    if not url or not MEDIA_FETCH_ALLOWED_HOSTS:
+        return False
+    parsed = urlparse(url)
+    return parsed.scheme == "https" and (parsed.hostname or "").lower() in MEDIA_FETCH_ALLOWED_HOSTS
+
+
+async def resolve_image_fingerprint(url: str) -> str:
+    """
+    Görselin içeriğini temsil eden kısa bir parmak izi döndürür.
+    Önce HEAD ile ETag (yoksa Last-Modified + Content-Length) kullanılır; ikisi de yoksa içerik
+    TRYON_INPUT_MAX_BYTES sınırıyla akış halinde hash'lenir. Görsel değiştirildiğinde parmak izi de değişir.
+    İzin verilmeyen URL'ler için ValueError.
+    """
+    found, fingerprint = image_fingerprints.get(url)
+    if found:
+        return fingerprint
+    if not is_fetchable_image_url(url):
+        raise ValueError("Image URL host is not allowed")
+
+    http_client = http_clients.get("media")
+    fingerprint = None
+    resp = await http_client.head(url, follow_redirects=False)
+    if resp.is_success:
+        etag = resp.headers.get("etag")
+        if etag:
+            fingerprint = "etag:" + etag.removeprefix("W/").strip('"')
+        elif resp.headers.get("last-modified") and resp.headers.get("content-length"):
+            fingerprint = f"lm:{resp.headers['last-modified']}:{resp.headers['content-length']}"
+
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        received = 0
+        async with http_client.stream("GET", url, follow_redirects=False) as stream:
+            stream.raise_for_status()
+            async for chunk in stream.aiter_bytes(TRANSFER_CHUNK_SIZE):
+                received += len(chunk)
+                if received > TRYON_INPUT_MAX_BYTES:
+                    raise ValueError(f"Image exceeds {TRYON_INPUT_MAX_BYTES} bytes")
+                digest.update(chunk)
+        fingerprint = "sha256:" + digest.hexdigest()
+
+    image_fingerprints.set(url, fingerprint, TRYON_FINGERPRINT_TTL)
+    return fingerprint
+
+
+image_fingerprints = TTLCache(maxsize=5000)
+
+
+class TryOnResultCache:
+    """
+    İçerik adresli try-on sonuç önbelleği (MongoDB: tryon_result_cache).
+    Anahtar: kişi ve kıyafet URL'leri + parmak izleri + fal.ai parametrelerinin SHA-256 özeti.
+    Sadece Supabase Storage'a kaydedilmiş (kalıcı) sonuç URL'leri saklanır.
     """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def collection(self):
+        return db.tryon_result_cache
+
+    async def start(self):
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("created_at", expireAfterSeconds=TRYON_CACHE_TTL_DAYS * 86400)
+
+    async def key_for(self, request: TryOnRequest) -> Optional[str]:
+        try:
+            user_fp, clothing_fp = await asyncio.gather(
+                resolve_image_fingerprint(request.user_image),
+                resolve_image_fingerprint(request.clothing_image),
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Try-on cache key çözülemedi: {str(e)}")
+            return None
+        material = {
+            "model": FAL_TRYON_URL,
+            "params": FAL_TRYON_PARAMS,
+            "user_image": request.user_image,
+            "user_image_fingerprint": user_fp,
+            "clothing_image": request.clothing_image,
+            "clothing_image_fingerprint": clothing_fp,
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            entry = await self.collection.find_one_and_update(
+                {"key": key},
+                {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}},
+                projection={"_id": 0, "result_image_url": 1},
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Try-on cache okunamadı: {str(e)}")
+            entry = None
+        if entry:
+            self.hits += 1
+            return entry["result_image_url"]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, request: TryOnRequest, result_image_url: str):
+        try:
+            await self.collection.update_one(
+                {"key": key},
+                {
+                    "$set": {"result_image_url": result_image_url, "created_at": datetime.utcnow()},
+                    "$setOnInsert": {"user_id": request.user_id, "hits": 0},
+                },
+                upsert=True,
+            )
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Try-on cache yazılamadı: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": TRYON_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+tryon_result_cache = TryOnResultCache()
+
+
+def normalize_tryon_image(image_data: bytes, max_edge: int, quality: int) -> Optional[bytes]:
+    """
+    Try-on giriş görselini modelin çalışma çözünürlüğüne indirir (EXIF yönü uygulanır, RGB JPEG).
+    Görsel zaten küçük bir JPEG ise None döner (orijinal kullanılabilir).
+    Açılış open_image_for_resize ile yapılır (piksel sınırı; JPEG'ler hedefin iki katında DCT ölçekli decode).
+    """
+    image = open_image_for_resize(image_data, (max_edge * 2, max_edge * 2))
+    already_small = max(image.size) <= max_edge
+    has_rotation = image.getexif().get(0x0112, 1) != 1
+    if already_small and image.format == "JPEG" and not has_rotation:
+        return None
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    image = flatten_to_rgb(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class TryOnInputNormalizer:
+    """
+    Try-on kaynak görsellerini bir kez indirip küçültür ve Storage'a içerik adresli olarak kaydeder.
+    Eşleme (kaynak URL + parmak izi -> normalize URL) MongoDB'de (tryon_input_cache) ve bellekte tutulur;
+    aynı profil fotoğrafı sonraki try-on'larda tekrar işlenmez.
+    """
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=2000)
+        self._singleflight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.normalized = 0
+        self.passthrough = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def collection(self):
+        return db.tryon_input_cache
+
+    async def start(self):
+        await self.collection.create_index("key", unique=True)
+
+    async def normalize(self, url: str) -> str:
+        """fal.ai'ye gönderilecek URL'i döndürür; hata olursa orijinal URL"""
+        if not TRYON_INPUT_NORMALIZE or not storage.configured:
+            return url
+        try:
+            fingerprint = await resolve_image_fingerprint(url)
+            material = f"{url}|{fingerprint}|{TRYON_INPUT_MAX_EDGE}|{TRYON_INPUT_QUALITY}"
+            key = hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+            found, normalized_url = self._memory.get(key)
+            if found:
+                self.hits += 1
+                return normalized_url
+
+            entry = await self.collection.find_one({"key": key}, {"_id": 0, "normalized_url": 1})
+            if entry:
+                self.hits += 1
+                self._memory.set(key, entry["normalized_url"], 3600)
+                return entry["normalized_url"]
+
+            self.misses += 1
+            return await self._singleflight.do(key, lambda: self._normalize_and_store(key, url, fingerprint))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Try-on girdisi normalize edilemedi ({url}): {str(e)}")
+            return url
+
+    async def _normalize_and_store(self, key: str, url: str, fingerprint: str) -> str:
+        # Parmak izi de aynı kontrolden geçer; indirme ayrıca korunur (SSRF, yönlendirme izlenmez)
+        if not is_fetchable_image_url(url):
+            raise ValueError("Image URL host is not allowed")
+        async with http_clients.get("media").stream("GET", url, follow_redirects=False) as resp:
+            resp.raise_for_status()
+            buffer = bytearray()
+            async for chunk in resp.aiter_bytes(TRANSFER_CHUNK_SIZE):
+                buffer.extend(chunk)
+                if len(buffer) > TRYON_INPUT_MAX_BYTES:
+                    raise ValueError(f"Source image exceeds {TRYON_INPUT_MAX_BYTES} bytes")
+        source = bytes(buffer)
+
+        normalized = await image_pool.run(
+            "tryon_normalize", normalize_tryon_image, source, TRYON_INPUT_MAX_EDGE, TRYON_INPUT_QUALITY
+        )
+        if normalized is None or len(normalized) >= len(source):
+            normalized_url = url
+            self.passthrough += 1
+        else:
+            digest = hashlib.sha256(normalized).hexdigest()
+            path = f"normalized/{digest[:2]}/{digest}.jpg"
+            await storage.upload("wardrobe", path, normalized, upsert=True, cache_control=IMMUTABLE_CACHE_CONTROL)
+            normalized_url = storage.get_public_url("wardrobe", path)
+            self.normalized += 1
+            self.bytes_in += len(source)
+            self.bytes_out += len(normalized)
+
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "source_url": url,
+                "fingerprint": fingerprint,
+                "normalized_url": normalized_url,
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+        self._memory.set(key, normalized_url, 3600)
+        return normalized_url
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": TRYON_INPUT_NORMALIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "normalized": self.normalized,
+            "passthrough": self.passthrough,
+            "errors": self.errors,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+tryon_input_normalizer = TryOnInputNormalizer()
+
+
+TRYON_LANE_PRIORITY = {"premium": 0, "free": 1, "trial": 2}
+TRYON_LOWEST_LANE = max(TRYON_LANE_PRIORITY, key=TRYON_LANE_PRIORITY.get)
+
+subscription_tiers = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES)
+subscription_tier_lookups = {"failures": 0, "skipped": 0, "backoff_until": 0.0}
+
+
+async def fetch_subscription_tier(user_id: str) -> Optional[str]:
+    """
+    Kullanıcının profiles.subscription_tier değeri (istemcinin beyanına güvenilmez).
+    Profil yoksa veya okunamazsa None döner; başarılı okumalar kısa süre önbelleğe alınır.
+    Okuma başarısız olursa TRYON_TIER_FAILURE_TTL boyunca (tüm kullanıcılar için) Supabase'e gidilmez ve None döner:
+    kesinti sırasında her try-on isteği kabulden önce bir REST çağrısı daha yapmaz.
+    """
+    found, tier = subscription_tiers.get(user_id)
+    if found:
+        return tier
+    if time.monotonic() < subscription_tier_lookups["backoff_until"]:
+        subscription_tier_lookups["skipped"] += 1
+        return None
+    try:
+        resp = await http_clients.get("supabase_rest").get(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1/profiles",
+            params={"id": f"eq.{user_id}", "select": "subscription_tier"},
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        )
+        failure = None if resp.status_code == 200 else str(resp.status_code)
+    except httpx.HTTPError as e:
+        failure = str(e)
+    if failure is not None:
+        logger.warning(f"Subscription tier lookup failed for {user_id}: {failure}")
+        subscription_tier_lookups["failures"] += 1
+        subscription_tier_lookups["backoff_until"] = time.monotonic() + TRYON_TIER_FAILURE_TTL
+        return None
+    rows = resp.json()
+    tier = rows[0].get("subscription_tier") if rows else None
+    subscription_tiers.set(user_id, tier, TRYON_TIER_CACHE_TTL)
+    return tier
+
+
+def tryon_priority_lane(is_free_trial: bool, subscription_tier: Optional[str]) -> str:
+    """Ücretli abonelik > ücretsiz > ücretsiz deneme; bilinmeyen veya eksik abonelik en düşük şeride düşer"""
+    if is_free_trial:
+        return "trial"
+    tier = (subscription_tier or "").lower()
+    return tier if tier in ("premium", "free") else TRYON_LOWEST_LANE
+
+
+class AdmissionController:
+    """
+    try_on_with_fal çağrıları için kabul kontrolü:
+    - global ve kullanıcı başına eşzamanlı çağrı sınırı
+    - sınırlı, süreli bekleme kuyruğu (dolunca/süre aşılınca 503, kullanıcı kuyruğu dolunca 429)
+    - öncelik şeritleri (TRYON_LANE_PRIORITY); aynı şeritte FIFO
+    """
+
+    def __init__(self, max_inflight: int, max_per_user: int, max_queued: int, max_queued_per_user: int):
+        self.max_inflight = max_inflight
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.inflight = 0
+        self._inflight_by_user: Dict[str, int] = {}
+        self._waiters: List[Dict[str, Any]] = []
+        self._seq = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_user_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.wait_times = {lane: LatencyHistogram() for lane in TRYON_LANE_PRIORITY}
+
+    def _has_capacity(self, user_id: str) -> bool:
+        return (
+            self.inflight < self.max_inflight
+            and self._inflight_by_user.get(user_id, 0) < self.max_per_user
+        )
+
+    def _grant(self, user_id: str):
+        self.inflight += 1
+        self._inflight_by_user[user_id] = self._inflight_by_user.get(user_id, 0) + 1
+        self.admitted += 1
+
+    def _release(self, user_id: str):
+        self.inflight -= 1
+        remaining = self._inflight_by_user.get(user_id, 1) - 1
+        if remaining > 0:
+            self._inflight_by_user[user_id] = remaining
+        else:
+            self._inflight_by_user.pop(user_id, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Boşalan kapasiteyi öncelik sırasına göre, kullanıcı sınırı uygun olan ilk bekleyene verir"""
+        for waiter in sorted(self._waiters, key=lambda w: (w["priority"], w["seq"])):
+            if self.inflight >= self.max_inflight:
+                return
+            if waiter["future"].done() or not self._has_capacity(waiter["user_id"]):
+                continue
+            self._waiters.remove(waiter)
+            self._grant(waiter["user_id"])
+            waiter["future"].set_result(True)
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, lane: str, timeout: float, enforce_queue_limit: bool = True):
+        started = time.monotonic()
+        if not self._waiters and self._has_capacity(user_id):
+            self._grant(user_id)
+        else:
+            await self._wait(user_id, lane, timeout, enforce_queue_limit)
+        self.wait_times[lane].observe(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    async def _wait(self, user_id: str, lane: str, timeout: float, enforce_queue_limit: bool):
+        if enforce_queue_limit:
+            if len(self._waiters) >= self.max_queued:
+                self.rejected_queue_full += 1
+                raise HTTPException(status_code=503, detail="Try-on service is busy. Please try again.",
+                                    headers={"Retry-After": "5"})
+            if sum(1 for w in self._waiters if w["user_id"] == user_id) >= self.max_queued_per_user:
+                self.rejected_user_queue_full += 1
+                raise HTTPException(status_code=429, detail="Too many try-on requests in progress.")
+
+        self._seq += 1
+        waiter = {
+            "user_id": user_id,
+            "priority": TRYON_LANE_PRIORITY.get(lane, len(TRYON_LANE_PRIORITY)),
+            "seq": self._seq,
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter["future"]), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter["future"].done() and not waiter["future"].cancelled():
+                # Kapasite tam bu sırada verildi; kullanmayacağımız için geri bırak
+                self._release(user_id)
+            else:
+                waiter["future"].cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise HTTPException(status_code=503, detail="Try-on queue timeout. Please try again.",
+                                headers={"Retry-After": "5"})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queue_depth": len(self._waiters),
+            "queue_depth_by_lane": {
+                lane: sum(1 for w in self._waiters if w["priority"] == priority)
+                for lane, priority in TRYON_LANE_PRIORITY.items()
+            },
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_user_queue_full": self.rejected_user_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds": {lane: histogram.stats() for lane, histogram in self.wait_times.items()},
+        }
+
+
+tryon_admission = AdmissionController(
+    max_inflight=TRYON_MAX_INFLIGHT,
+    max_per_user=TRYON_MAX_INFLIGHT_PER_USER,
+    max_queued=TRYON_MAX_QUEUED,
+    max_queued_per_user=TRYON_MAX_QUEUED_PER_USER,
+)
+
+
+async def run_try_on(request: TryOnRequest, http_client: httpx.AsyncClient, background: bool = False) -> TryOnResponse:
+    """Senkron endpoint ve arka plan işlerinin ortak try-on akışı"""
     try:
-        # Get authenticated user ID from token
-        authenticated_user_id = user.get("id")
-        
-        # Security check: request.user_id must match token user_id
-        if request.user_id != authenticated_user_id:
-            logger.warning(f"User ID mismatch: token={authenticated_user_id}, request={request.user_id}")
-            raise HTTPException(status_code=403, detail="Forbidden")
-        
         logger.info(f"Try-on request - user: {request.user_id}, category: {request.clothing_category}")
+
+        cache_key = None
+        if TRYON_CACHE_ENABLED:
+            cache_key = await tryon_result_cache.key_for(request)
+            if cache_key and request.force_refresh:
+                tryon_result_cache.bypassed += 1
+            elif cache_key:
+                cached_url = await tryon_result_cache.get(cache_key)
+                if cached_url:
+                    logger.info(f"Try-on cache hit - user: {request.user_id}")
+                    return TryOnResponse(success=True, result_image_url=cached_url)
         
-        async with httpx.AsyncClient(timeout=300.0) as http_client:
+        # fal.ai'ye tam çözünürlüklü telefon fotoğrafları yerine normalize edilmiş kopyalar gönderilir
+        user_image, clothing_image = await asyncio.gather(
+            tryon_input_normalizer.normalize(request.user_image),
+            tryon_input_normalizer.normalize(request.clothing_image),
+        )
+
+        # Arka plan işleri zaten sınırlı worker'larla çalışır; kuyruk sınırına takılmaz, daha uzun bekleyebilir
+        # Öncelik şeridi sunucudaki profilden belirlenir
+        lane = tryon_priority_lane(request.is_free_trial, await fetch_subscription_tier(request.user_id))
+        async with tryon_admission.admit(
+            request.user_id,
+            lane,
+            timeout=TRYON_JOB_LEASE_SECONDS / 2 if background else TRYON_QUEUE_TIMEOUT,
+            enforce_queue_limit=not background,
+        ):
             # All users use fal.ai for consistent high quality
-            return await try_on_with_fal(
-                request.user_image,
-                request.clothing_image,
+            response = await try_on_with_fal(
+                user_image,
+                clothing_image,
                 http_client,
                 request.user_id
             )
+
+        if cache_key and response.success and storage.is_public_url(response.result_image_url):
+            await tryon_result_cache.put(cache_key, request, response.result_image_url)
+
+        return response
             
     except httpx.TimeoutException:
         logger.error("Request timed out")
@@ -1759,54 +4300,950 @@ async def virtual_try_on(
         return TryOnResponse(success=False, error=str(e))
 
 
+def ensure_same_user(user: Dict[str, Any], user_id: str):
+    """Token'daki kullanıcı ile istekteki user_id eşleşmiyorsa 403"""
+    authenticated_user_id = user.get("id")
+    if user_id != authenticated_user_id:
+        logger.warning(f"User ID mismatch: token={authenticated_user_id}, request={user_id}")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@api_router.post("/try-on", response_model=TryOnResponse)
+async def virtual_try_on(
+    request: TryOnRequest,
+    user = Depends(verify_supabase_user),
+    http_client: httpx.AsyncClient = Depends(upstream_client("fal")),
+):
+    """
+    Generate a virtual try-on image using fal.ai
+    - All users (including free trial) use fal.ai for best quality
+    - Generates 1 image per request
+    - Requires valid Supabase JWT token
+    """
+    # Security check: request.user_id must match token user_id
+    ensure_same_user(user, request.user_id)
+
+    return await run_try_on(request, http_client)
+
+
+@api_router.post("/try-on/batch")
+async def virtual_try_on_batch(
+    request: TryOnBatchRequest,
+    user = Depends(verify_supabase_user),
+    http_client: httpx.AsyncClient = Depends(upstream_client("fal")),
+):
+    """
+    Tek kişi görselini birden fazla kıyafetle dener.
+    Sonuçlar tamamlandıkça NDJSON satırı olarak akar: {"index", "success", "result_image_url", "error"}.
+    Bir öğenin hatası diğerlerini iptal etmez; son satır özet içerir ({"done": true, ...}).
+    """
+    ensure_same_user(user, request.user_id)
+
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No clothing items provided")
+    if len(request.items) > TRYON_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {TRYON_BATCH_MAX_ITEMS} items per batch")
+
+    # Kullanıcı başına kabul sınırını aşmamak için eşzamanlılık yerelde de sınırlanır
+    semaphore = asyncio.Semaphore(max(1, min(TRYON_BATCH_CONCURRENCY, TRYON_MAX_INFLIGHT_PER_USER + TRYON_MAX_QUEUED_PER_USER)))
+
+    async def run_item(index: int, item: TryOnBatchItem):
+        item_request = TryOnRequest(
+            user_id=request.user_id,
+            user_image=request.user_image,
+            clothing_image=item.clothing_image,
+            clothing_category=item.clothing_category,
+            is_free_trial=request.is_free_trial,
+            force_refresh=request.force_refresh,
+        )
+        async with semaphore:
+            try:
+                response = await run_try_on(item_request, http_client)
+            except HTTPException as e:
+                response = TryOnResponse(success=False, error=str(e.detail))
+            except Exception as e:
+                logger.error(f"Batch try-on item {index} error: {str(e)}")
+                response = TryOnResponse(success=False, error=str(e))
+        return index, response
+
+    async def result_stream():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(request.items)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, response = await next_done
+                succeeded += int(response.success)
+                yield json.dumps({"index": index, **response.model_dump()}) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(tasks),
+                "succeeded": succeeded,
+                "failed": len(tasks) - succeeded,
+            }) + "\n"
+        finally:
+            # İstemci bağlantıyı kapatırsa kalan fal.ai çağrılarını boşuna sürdürme
+            for task in tasks:
+                task.cancel()
+
+    logger.info(f"Batch try-on - user: {request.user_id}, items: {len(request.items)}")
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+TRYON_JOB_TERMINAL_STATES = ("succeeded", "failed")
+
+
+class TryOnJobQueue:
+    """
+    Try-on işlerini MongoDB'de (tryon_jobs) saklayan ve sınırlı sayıda worker ile işleyen kuyruk.
+    - İş durumu: queued -> running -> succeeded | failed
+    - Worker'lar işi atomik olarak (find_one_and_update) sahiplenir; birden fazla uvicorn worker'ı güvenlidir
+    - Lease süresi dolan "running" işler (crash/restart) tekrar kuyruğa alınır; çalışan işin lease'i heartbeat
+      ile yenilenir ve sonuç yalnızca iş hâlâ bu worker'daysa yazılır
+    - Durum geçişleri SSE aboneleri için process içinde yayınlanır
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._enqueued: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+
+    @property
+    def collection(self):
+        return db.tryon_jobs
+
+    async def start(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+        await self.recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, request: TryOnRequest) -> Dict[str, Any]:
+        if self._queue.qsize() >= TRYON_JOB_MAX_PENDING:
+            raise HTTPException(status_code=503, detail="Try-on queue is full. Please try again later.")
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": request.user_id,
+            "status": "queued",
+            "request": request.model_dump(),
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(dict(job))
+        self._enqueue(job["id"])
+        return job
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._enqueued:
+            self._enqueued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def recover(self):
+        """Lease'i dolmuş running işleri kuyruğa geri alır, bekleyen işleri yeniden sıraya koyar"""
+        now = datetime.utcnow()
+        expired = {"status": "running", "lease_expires_at": {"$lt": now}}
+        exhausted = await self.collection.update_many(
+            {**expired, "attempts": {"$gte": TRYON_JOB_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed", "error": "Job interrupted too many times", "updated_at": now, "finished_at": now}},
+        )
+        requeued = await self.collection.update_many(
+            expired,
+            {"$set": {"status": "queued", "updated_at": now}, "$unset": {"worker_id": "", "lease_expires_at": ""}},
+        )
+        if exhausted.modified_count or requeued.modified_count:
+            logger.warning(f"Try-on jobs recovered: requeued={requeued.modified_count}, failed={exhausted.modified_count}")
+            self.recovered += requeued.modified_count
+
+        async for job in self.collection.find({"status": "queued"}, {"id": 1}).sort("created_at", 1):
+            self._enqueue(job["id"])
+
+    async def _recovery_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Try-on job recovery error: {str(e)}")
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "started_at": now,
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=TRYON_JOB_LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, job_id: str) -> Dict[str, Any]:
+        return {"id": job_id, "worker_id": self.worker_id, "status": "running"}
+
+    async def _heartbeat(self, job_id: str):
+        """fal.ai çağrısı sürerken lease'i yeniler; iş başka worker'a geçtiyse durur"""
+        while True:
+            await asyncio.sleep(max(1.0, TRYON_JOB_LEASE_SECONDS / 3))
+            try:
+                result = await self.collection.update_one(
+                    self._owned(job_id),
+                    {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=TRYON_JOB_LEASE_SECONDS)}},
+                )
+            except Exception as e:
+                logger.warning(f"Try-on job {job_id} heartbeat error: {str(e)}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Try-on job {job_id}: lease lost")
+                return
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._enqueued.discard(job_id)
+            job = None
+            try:
+                job = await self._claim(job_id)
+                if job is None:
+                    # Başka bir worker aldı veya iş zaten bitti
+                    continue
+                self._publish(job)
+                heartbeat = asyncio.create_task(self._heartbeat(job_id))
+                try:
+                    response = await run_try_on(TryOnRequest(**job["request"]), http_clients.get("fal"), background=True)
+                finally:
+                    heartbeat.cancel()
+                await self._finish(job, response)
+            except asyncio.CancelledError:
+                if job is not None:
+                    # Shutdown: işi bir sonraki başlatmada tekrar alınmak üzere bırak
+                    await self.collection.update_one(
+                        {"id": job_id, "status": "running", "worker_id": self.worker_id},
+                        {"$set": {"status": "queued", "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}},
+                    )
+                raise
+            except Exception as e:
+                logger.error(f"Try-on job {job_id} error: {str(e)}")
+                if job is not None:
+                    await self._finish(job, TryOnResponse(success=False, error=str(e)))
+            finally:
+                self._queue.task_done()
+
+    async def _finish(self, job: Dict[str, Any], response: TryOnResponse):
+        now = datetime.utcnow()
+        status = "succeeded" if response.success else "failed"
+        update = {
+            "status": status,
+            "result": response.model_dump(),
+            "error": response.error,
+            "updated_at": now,
+            "finished_at": now,
+        }
+        result = await self.collection.update_one(
+            self._owned(job["id"]),
+            {"$set": update, "$unset": {"lease_expires_at": ""}},
+        )
+        if result.matched_count == 0:
+            # Lease dolmuş ve iş yeniden kuyruğa alınmış/başka worker'a geçmiş: sonucu yeni sahibi yazar
+            logger.warning(f"Try-on job {job['id']}: lease lost, result discarded")
+            return
+        if response.success:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self._publish({**job, **update})
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id, [])
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def _publish(self, job: Dict[str, Any]):
+        for queue in self._subscribers.get(job["id"], []):
+            queue.put_nowait(job)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "recovered": self.recovered,
+            "subscribers": sum(len(v) for v in self._subscribers.values()),
+        }
+
+
+tryon_jobs = TryOnJobQueue(workers=TRYON_JOB_WORKERS)
+
+
+def serialize_tryon_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Mongo iş kaydını API cevabına çevirir"""
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+    }
+    for key in ("created_at", "updated_at", "started_at", "finished_at"):
+        value = job.get(key)
+        view[key] = value.isoformat() if isinstance(value, datetime) else value
+    return view
+
+
+async def get_owned_tryon_job(job_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+    job = await tryon_jobs.get(job_id)
+    if not job or job.get("user_id") != user.get("id"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@api_router.post("/try-on/jobs", status_code=202)
+async def submit_try_on_job(
+    request: TryOnRequest,
+    user = Depends(verify_supabase_user),
+):
+    """
+    Try-on işini kuyruğa alır ve hemen job_id döndürür.
+    Sonuç GET /api/try-on/{job_id} ile veya /events SSE akışı ile alınır.
+    """
+    ensure_same_user(user, request.user_id)
+
+    job = await tryon_jobs.submit(request)
+    logger.info(f"Try-on job queued: {job['id']} (user: {request.user_id})")
+    return {"success": True, **serialize_tryon_job(job)}
+
+
+@api_router.get("/try-on/{job_id}")
+async def get_try_on_job(job_id: str, user = Depends(verify_supabase_user)):
+    """Try-on işinin durumunu ve (bittiyse) TryOnResponse sonucunu döndürür"""
+    job = await get_owned_tryon_job(job_id, user)
+    return {"success": True, **serialize_tryon_job(job)}
+
+
+@api_router.get("/try-on/{job_id}/events")
+async def stream_try_on_job(job_id: str, user = Depends(verify_supabase_user)):
+    """
+    Try-on işinin durum geçişlerini Server-Sent Events olarak yayınlar.
+    İş başka bir process'te çalışıyor olabileceği için beklerken Mongo periyodik olarak yoklanır.
+    """
+    job = await get_owned_tryon_job(job_id, user)
+
+    async def event_stream():
+        queue = tryon_jobs.subscribe(job_id)
+        try:
+            # Abone olduktan sonra tekrar oku; arada gerçekleşen geçiş kaçmasın
+            current = await tryon_jobs.get(job_id) or job
+            last_status = None
+            while True:
+                if current["status"] != last_status:
+                    last_status = current["status"]
+                    payload = json.dumps(serialize_tryon_job(current))
+                    yield f"event: {last_status}\ndata: {payload}\n\n"
+                if last_status in TRYON_JOB_TERMINAL_STATES:
+                    return
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    current = await tryon_jobs.get(job_id) or current
+        finally:
+            tryon_jobs.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api_router.post("/weather")
-async def get_weather(request: WeatherRequest):
+async def get_weather(
+    request: WeatherRequest,
+    http_client: httpx.AsyncClient = Depends(upstream_client("openweather")),
+):
     """Get weather data for a location"""
     try:
         if not OPENWEATHER_API_KEY:
             raise HTTPException(status_code=500, detail="Weather API not configured")
         
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                f"https://api.openweathermap.org/data/2.5/weather",
-                params={
-                    "lat": request.latitude,
-                    "lon": request.longitude,
-                    "appid": OPENWEATHER_API_KEY,
-                    "units": "metric",
-                    "lang": request.language
-                }
-            )
+        response = await http_client.get(
+            f"https://api.openweathermap.org/data/2.5/weather",
+            params={
+                "lat": request.latitude,
+                "lon": request.longitude,
+                "appid": OPENWEATHER_API_KEY,
+                "units": "metric",
+                "lang": request.language
+            }
+        )
+            
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                "temp": round(data["main"]["temp"]),
+                "description": data["weather"][0]["description"],
+                "icon": data["weather"][0]["icon"],
+                "city": data["name"],
+                "is_cold": data["main"]["temp"] < 15,
+                "is_rainy": "rain" in data["weather"][0]["main"].lower()
+            }
+        else:
+            raise HTTPException(status_code=response.status_code, detail="Weather API error")
             
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "temp": round(data["main"]["temp"]),
-                    "description": data["weather"][0]["description"],
-                    "icon": data["weather"][0]["icon"],
-                    "city": data["name"],
-                    "is_cold": data["main"]["temp"] < 15,
-                    "is_rainy": "rain" in data["weather"][0]["main"].lower()
-                }
-            else:
-                raise HTTPException(status_code=response.status_code, detail="Weather API error")
-                
     except Exception as e:
         logger.error(f"Weather error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class IngestedUpload:
+    """
+    Parça parça okunmuş upload gövdesi.
+    UPLOAD_SPOOL_THRESHOLD'a kadar bellekte tutulur, aşılırsa geçici dosyaya taşınır.
+    Referans sayılır: isteğin ötesinde yaşayan kullanıcılar (singleflight task'ı) retain() eder,
+    her sahip işi bitince cleanup() çağırır; geçici dosya son sahip bıraktığında silinir.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.format: Optional[str] = None
+        self.dimensions: Optional[tuple] = None
+        self.peak_buffer_bytes = 0
+        self._hasher = hashlib.sha256()
+        self._buffer: Optional[bytearray] = bytearray()
+        self._file = None
+        self.path: Optional[str] = None
+        self._refs = 1
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def source(self) -> Any:
+        """Pillow'a verilecek kaynak: bellekteyse bytes, taşındıysa dosya yolu (process havuzuna ucuz aktarılır)"""
+        return self.path if self.spilled else bytes(self._buffer)
+
+    @property
+    def digest(self) -> str:
+        """Gövdenin sha256 özeti (okuma sırasında artımlı hesaplanır)"""
+        return self._hasher.hexdigest()
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._hasher.update(chunk)
+        if self._file is None and self.size > UPLOAD_SPOOL_THRESHOLD:
+            self._file = tempfile.NamedTemporaryFile(prefix="upload_", delete=False)
+            self.path = self._file.name
+            await asyncio.to_thread(self._file.write, bytes(self._buffer))
+            self._buffer = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.write, chunk)
+        else:
+            self._buffer.extend(chunk)
+            self.peak_buffer_bytes = max(self.peak_buffer_bytes, len(self._buffer))
+
+    async def finish(self):
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+
+    async def iter_chunks(self, chunk_size: int = TRANSFER_CHUNK_SIZE):
+        """Storage'a akış halinde yükleme için"""
+        if not self.spilled:
+            yield bytes(self._buffer)
+            return
+        with open(self.path, "rb") as fh:
+            while True:
+                chunk = await asyncio.to_thread(fh.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def retain(self) -> "IngestedUpload":
+        self._refs += 1
+        return self
+
+    def cleanup(self):
+        self._refs -= 1
+        if self._refs > 0:
+            return
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._buffer = None
+
+
+class UploadIngestor:
+    """
+    UploadFile'ı sabit boyutlu parçalarla okur; boyut sınırını aşan gövdeyi erken reddeder (413).
+    Görsel formatı ve boyutları ilk parçalardan (header) okunur; geçersiz ya da piksel sınırını aşan
+    dosyalar gövdenin geri kalanı okunmadan reddedilir.
+    """
+
+    def __init__(self, max_bytes: int, chunk_size: int, sniff_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.sniff_bytes = sniff_bytes
+        self.uploads = 0
+        self.spilled = 0
+        self.rejected_too_large = 0
+        self.rejected_invalid = 0
+        self.bytes_total = 0
+        self.peak_buffer_bytes = 0
+        self.sizes = LatencyHistogram(buckets=(
+            64 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024, 20 * 1024 * 1024
+        ))
+
+    def _sniff(self, head: bytes, complete: bool) -> Optional[tuple]:
+        """Header yeterliyse (format, (w, h)) döner; yetersizse None, geçersizse 400"""
+        try:
+            with Image.open(io.BytesIO(head)) as image:
+                return image.format, image.size
+        except Exception as e:
+            if complete or len(head) >= self.sniff_bytes:
+                self.rejected_invalid += 1
+                raise HTTPException(status_code=400, detail=f"Cannot identify image file: {str(e)}")
+            return None
+
+    async def ingest(self, file: UploadFile) -> IngestedUpload:
+        upload = IngestedUpload()
+        head = bytearray()
+        try:
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if upload.size + len(chunk) > self.max_bytes:
+                    self.rejected_too_large += 1
+                    raise HTTPException(status_code=413, detail=f"Image exceeds {self.max_bytes} bytes")
+
+                if upload.format is None and (chunk or upload.size):
+                    head.extend(chunk)
+                    sniffed = self._sniff(bytes(head), complete=not chunk)
+                    if sniffed:
+                        upload.format, upload.dimensions = sniffed
+                        width, height = upload.dimensions
+                        if width * height > IMAGE_MAX_PIXELS:
+                            self.rejected_invalid += 1
+                            raise HTTPException(
+                                status_code=400,
+                                detail=f"Image too large: {width}x{height} exceeds {IMAGE_MAX_PIXELS} pixels",
+                            )
+                        head = bytearray()
+
+                if not chunk:
+                    break
+                await upload.write(chunk)
+
+            await upload.finish()
+        except BaseException:
+            upload.cleanup()
+            raise
+
+        if upload.size == 0:
+            upload.cleanup()
+            raise HTTPException(status_code=400, detail="Empty image file")
+
+        self.uploads += 1
+        self.spilled += int(upload.spilled)
+        self.bytes_total += upload.size
+        self.peak_buffer_bytes = max(self.peak_buffer_bytes, upload.peak_buffer_bytes)
+        self.sizes.observe(upload.size)
+        return upload
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = self.sizes.stats()
+        return {
+            "uploads": self.uploads,
+            "spilled": self.spilled,
+            "rejected_too_large": self.rejected_too_large,
+            "rejected_invalid": self.rejected_invalid,
+            "bytes_total": self.bytes_total,
+            "max_bytes": self.max_bytes,
+            "memory_bound_bytes": UPLOAD_SPOOL_THRESHOLD + self.chunk_size,
+            "peak_buffer_bytes": self.peak_buffer_bytes,
+            "size_bytes": {"avg": sizes["avg"], "max": sizes["max"], "buckets": sizes["buckets"]},
+        }
+
+
+upload_ingestor = UploadIngestor(UPLOAD_MAX_BYTES, TRANSFER_CHUNK_SIZE, UPLOAD_SNIFF_BYTES)
+
+
+class FullImageSavings:
+    """Tam boy görsellerin yeniden kodlanmasıyla kazanılan baytları izler (/api/admin/metrics)"""
+
+    def __init__(self):
+        self.uploads = 0
+        self.recompressed = 0
+        self.kept_source = 0
+        self.original_bytes = 0
+        self.stored_bytes = 0
+        self.qualities = LatencyHistogram(buckets=(50, 60, 70, 75, 80, 85, 90, 95))
+
+    def record(self, original_bytes: int, stored_bytes: int, quality: Optional[int]):
+        self.uploads += 1
+        self.original_bytes += original_bytes
+        self.stored_bytes += stored_bytes
+        if quality is None:
+            self.kept_source += 1
+        else:
+            self.recompressed += 1
+            self.qualities.observe(quality)
+
+    def stats(self) -> Dict[str, Any]:
+        qualities = self.qualities.stats()
+        return {
+            "enabled": FULL_IMAGE_RECOMPRESS,
+            "uploads": self.uploads,
+            "recompressed": self.recompressed,
+            "kept_source": self.kept_source,
+            "original_bytes": self.original_bytes,
+            "stored_bytes": self.stored_bytes,
+            "saved_bytes": self.original_bytes - self.stored_bytes,
+            "saved_ratio": round(1 - self.stored_bytes / self.original_bytes, 4) if self.original_bytes else 0.0,
+            "quality": {"avg": qualities["avg"], "buckets": qualities["buckets"]},
+        }
+
+
+full_image_savings = FullImageSavings()
+
+
+ORIGINAL_IMAGE_EXTENSIONS = {"JPEG": ("jpg", "image/jpeg"), "PNG": ("png", "image/png"), "WEBP": ("webp", "image/webp")}
+
+
+def _write_options(immutable: bool) -> Dict[str, Any]:
+    return {"upsert": True, "cache_control": IMMUTABLE_CACHE_CONTROL} if immutable else {}
+
+
+def start_original_write(writes: StorageWriteBatch, upload: IngestedUpload, name_prefix: str, **write_options) -> str:
+    """İstemcinin gönderdiği bayt dizisini _original.<ext> olarak yazmaya başlar; nesne yolunu döndürür"""
+    ext, content_type = ORIGINAL_IMAGE_EXTENSIONS.get(upload.format, ("bin", "application/octet-stream"))
+    original_path = f"{name_prefix}_original.{ext}"
+    writes.start(original_path, upload.iter_chunks(), content_type=content_type,
+                 content_length=upload.size, **write_options)
+    return original_path
+
+
+async def store_original_upload(
+    upload: IngestedUpload,
+    bucket: str,
+    name_prefix: str,
+    immutable: bool = False,
+    preserve: Iterable[str] = (),
+) -> str:
+    """Yalnızca orijinali yazar (varyantları zaten saklanmış kayıtlar için); başarısız olursa geri alınır"""
+    writes = StorageWriteBatch(bucket, preserve)
+    try:
+        original_path = start_original_write(writes, upload, name_prefix, **_write_options(immutable))
+        await writes.wait()
+    except BaseException:
+        await asyncio.shield(writes.rollback())
+        raise
+    return original_path
+
+
+async def store_image_upload(
+    upload: IngestedUpload,
+    bucket: str,
+    name_prefix: str,
+    immutable: bool = False,
+    keep_original: bool = False,
+    preserve: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """
+    Tam boy görseli, thumbnail'ı ve varyantları üretip tüm nesneleri Storage'a yazar; nesne yollarını döndürür.
+    immutable=True: içerik adresli isimler için upsert ve uzun süreli cache-control kullanılır.
+    keep_original=True: istemcinin gönderdiği bayt dizisi ayrıca _original.<ext> olarak saklanır.
+    Herhangi bir adım başarısız olursa yazılan nesneler geri alınır (preserve'deki önceden var olan isimler hariç).
+    """
+    full_path = f"{name_prefix}_full.jpg"
+    thumb_path = f"{name_prefix}_thumb.jpg"
+    original_path = None
+    write_options = _write_options(immutable)
+    
+    # All storage writes run concurrently; byte streams that need no processing start right away
+    writes = StorageWriteBatch(bucket, preserve)
+    
+    try:
+        if keep_original:
+            original_path = start_original_write(writes, upload, name_prefix, **write_options)
+        if not FULL_IMAGE_RECOMPRESS:
+            writes.start(full_path, upload.iter_chunks(), content_length=upload.size, **write_options)
+        
+        # Full image, thumbnail and variants from a single decode (this will validate the image and raise ValueError if invalid)
+        if IMAGE_VARIANTS_ENABLED:
+            # JPEG her zaman üretilir: thumbnail ve eski istemciler için ortak format
+            variant_formats = ["jpeg"] + [f for f in supported_variant_formats(IMAGE_VARIANT_FORMATS) if f != "jpeg"]
+            variant_sizes = sorted(set(IMAGE_VARIANT_SIZES) | {300})
+        else:
+            variant_formats, variant_sizes = ["jpeg"], [300]
+        try:
+            processed = await image_pool.run(
+                "process", process_uploaded_image, upload.source, variant_sizes, variant_formats, FULL_IMAGE_RECOMPRESS
+            )
+        except ValueError as thumb_error:
+            logger.error(f"Thumbnail creation failed: {str(thumb_error)}")
+            raise HTTPException(status_code=400, detail=str(thumb_error))
+        
+        variant_bytes: Dict[int, Dict[str, bytes]] = processed["variants"]
+        thumbnail_bytes = variant_bytes[300]["jpeg"]
+        if not IMAGE_VARIANTS_ENABLED:
+            variant_bytes = {}
+        elif 300 not in IMAGE_VARIANT_SIZES:
+            variant_bytes.pop(300)
+        
+        # Thumbnail is small and goes out first
+        writes.start(thumb_path, thumbnail_bytes, **write_options)
+        
+        if FULL_IMAGE_RECOMPRESS:
+            # Yeniden kodlanmış görsel ya da (kazanç yoksa) metadata'sı çıkarılmış kaynak
+            full_bytes = processed["full"]
+            writes.start(full_path, full_bytes, **write_options)
+            stored_bytes = len(full_bytes)
+            full_image_savings.record(upload.size, stored_bytes, processed["full_quality"])
+            logger.info(f"Full image: {upload.size} -> {stored_bytes} bytes (quality={processed['full_quality']})")
+        
+        # Variants: {name_prefix}_{size}.{ext}
+        variant_paths: Dict[str, Dict[str, str]] = {}
+        for size, encoded in variant_bytes.items():
+            for fmt, data in encoded.items():
+                _pil_format, ext, content_type, _options = IMAGE_VARIANT_ENCODERS[fmt]
+                if size == 300 and fmt == "jpeg":
+                    # Aynı bayt dizisi zaten _thumb.jpg olarak yükleniyor
+                    variant_paths.setdefault(str(size), {})[fmt] = thumb_path
+                    continue
+                variant_path = f"{name_prefix}_{size}.{ext}"
+                writes.start(variant_path, data, content_type=content_type, **write_options)
+                variant_paths.setdefault(str(size), {})[fmt] = variant_path
+        
+        await writes.wait()
+    except BaseException:
+        # İstemci bağlantıyı kopardıysa da (CancelledError) yarım nesne bırakma
+        await asyncio.shield(writes.rollback())
+        raise
+    
+    paths = {
+        "full_path": full_path,
+        "thumb_path": thumb_path,
+        "variant_paths": variant_paths,
+        "blurhash": processed["blurhash"],
+    }
+    if original_path:
+        paths["original_path"] = original_path
+    return paths
+
+
+def image_upload_response(bucket: str, paths: Dict[str, Any]) -> ImageUploadResponse:
+    """Nesne yollarından public URL'li yanıt oluşturur (ağ çağrısı yapmaz)"""
+    variants = {
+        size: {fmt: storage.get_public_url(bucket, path) for fmt, path in formats.items()}
+        for size, formats in (paths.get("variant_paths") or {}).items()
+    }
+    return ImageUploadResponse(
+        success=True,
+        full_url=storage.get_public_url(bucket, paths["full_path"]),
+        thumbnail_url=storage.get_public_url(bucket, paths["thumb_path"]),
+        original_url=storage.get_public_url(bucket, paths["original_path"]) if paths.get("original_path") else None,
+        variants=variants or None,
+        blurhash=paths.get("blurhash")
+    )
+
+
+class ImageDigestIndex:
+    """
+    İçerik adresli yüklemeler için (user_id, bucket, sha256) -> nesne yolları eşlemesi (MongoDB: image_digests).
+    Aynı fotoğraf tekrar yüklendiğinde işleme ve yükleme atlanır.
+    refs, eşlemenin kaç yüklemeye döndürüldüğünü sayar; paylaşılan nesneler zorlanmadan silinmez.
+    """
+
+    def __init__(self):
+        self._singleflight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def collection(self):
+        return db.image_digests
+
+    async def start(self):
+        await self.collection.create_index([("user_id", 1), ("bucket", 1), ("digest", 1)], unique=True)
+
+    async def get(self, user_id: str, bucket: str, digest: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one_and_update(
+            {"user_id": user_id, "bucket": bucket, "digest": digest},
+            {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+            projection={"_id": 0},
+        )
+
+    async def put(self, user_id: str, bucket: str, digest: str, size: int, paths: Dict[str, Any]):
+        await self.collection.update_one(
+            {"user_id": user_id, "bucket": bucket, "digest": digest},
+            {
+                "$set": {**paths, "object_paths": self.object_paths(paths), "size": size, "last_used_at": datetime.utcnow()},
+                "$setOnInsert": {"created_at": datetime.utcnow(), "hits": 0, "refs": 0},
+            },
+            upsert=True,
+        )
+
+    @staticmethod
+    def object_paths(paths: Dict[str, Any]) -> List[str]:
+        """Eşlemenin Storage'daki tüm nesneleri: tam boy, thumbnail, orijinal ve varyantlar"""
+        names = [paths.get("full_path"), paths.get("thumb_path"), paths.get("original_path")]
+        for formats in (paths.get("variant_paths") or {}).values():
+            names.extend(formats.values())
+        return sorted({name for name in names if name})
+
+    @staticmethod
+    def path_key(path: str) -> Optional[tuple]:
+        """İçerik adresli nesne yolu ({user_id}/{sha256}_...) -> (user_id, digest); diğer yollar için None"""
+        user_id, _, name = path.rpartition("/")
+        digest = name.split("_", 1)[0]
+        if not user_id or len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            return None
+        return user_id, digest
+
+    async def find_by_path(self, bucket: str, path: str) -> Optional[Dict[str, Any]]:
+        """Yolun (varyantlar ve orijinal dahil) ait olduğu eşleme"""
+        key = self.path_key(path)
+        if key is None:
+            return None
+        return await self.collection.find_one(
+            {"user_id": key[0], "bucket": bucket, "digest": key[1]}, projection={"_id": 0}
+        )
+
+    async def forget(self, mapping: Dict[str, Any]):
+        """Nesneler Storage'dan silindiğinde eşlemeyi de kaldırır"""
+        await self.collection.delete_one(
+            {"user_id": mapping["user_id"], "bucket": mapping["bucket"], "digest": mapping["digest"]}
+        )
+
+    async def store(self, upload: IngestedUpload, user_id: str, bucket: str, keep_original: bool = False) -> Dict[str, Any]:
+        """
+        Aynı içerik için eşzamanlı yüklemeler tek bir işlemede birleştirilir (anahtar yalnızca özet).
+        Birleşilen işleme orijinali saklamadıysa eksik orijinal ayrı bir adımda, tek başına yüklenir.
+        """
+        key = f"{user_id}:{bucket}:{upload.digest}"
+        paths = await self._singleflight.do(
+            key, lambda: self._owned(upload.retain(), self._store(upload, user_id, bucket, keep_original))
+        )
+        if keep_original and not paths.get("original_path"):
+            paths = await self._singleflight.do(
+                f"{key}:original", lambda: self._owned(upload.retain(), self._store_original(upload, user_id, bucket))
+            )
+        # Birleşilen (coalesced) çağıranlar dahil her yükleme nesneleri paylaşan bir referanstır
+        await self.collection.update_one(
+            {"user_id": user_id, "bucket": bucket, "digest": upload.digest}, {"$inc": {"refs": 1}}
+        )
+        return paths
+
+    @staticmethod
+    async def _owned(upload: IngestedUpload, work) -> Dict[str, Any]:
+        """Singleflight task'ı upload'ın bir sahibidir: isteği başlatan bağlantı kopsa da dosya iş bitene kadar kalır"""
+        try:
+            return await work
+        finally:
+            upload.cleanup()
+
+    async def _existing_names(self, user_id: str, bucket: str, digest: str) -> set:
+        """Bu özet için Storage'da zaten var olan nesneler; rollback bunlara dokunmaz"""
+        entries = await storage.list(bucket, prefix=user_id, limit=1000, search=digest)
+        return {f"{user_id}/{entry['name']}" for entry in entries if entry.get("name")}
+
+    async def _store(self, upload: IngestedUpload, user_id: str, bucket: str, keep_original: bool) -> Dict[str, Any]:
+        existing = await self.get(user_id, bucket, upload.digest)
+        if existing:
+            self.hits += 1
+            return existing
+        self.misses += 1
+        paths = await store_image_upload(
+            upload, bucket, f"{user_id}/{upload.digest}", immutable=True, keep_original=keep_original,
+            preserve=await self._existing_names(user_id, bucket, upload.digest),
+        )
+        await self.put(user_id, bucket, upload.digest, upload.size, paths)
+        return paths
+
+    async def _store_original(self, upload: IngestedUpload, user_id: str, bucket: str) -> Dict[str, Any]:
+        query = {"user_id": user_id, "bucket": bucket, "digest": upload.digest}
+        existing = await self.collection.find_one(query, projection={"_id": 0})
+        if existing is None:
+            # Eşleme bu arada silinmiş: tüm nesneler orijinalle birlikte yeniden üretilir
+            return await self._store(upload, user_id, bucket, keep_original=True)
+        if existing.get("original_path"):
+            return existing
+        original_path = await store_original_upload(
+            upload, bucket, f"{user_id}/{upload.digest}", immutable=True,
+            preserve=await self._existing_names(user_id, bucket, upload.digest),
+        )
+        await self.collection.update_one(
+            query, {"$set": {"original_path": original_path}, "$addToSet": {"object_paths": original_path}}
+        )
+        return {**existing, "original_path": original_path}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced": self._singleflight.coalesced,
+        }
+
+
+image_digests = ImageDigestIndex()
+
+
 @api_router.post("/upload-image", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
     bucket: str = Form("wardrobe"),
     user_id: str = Form(...),
     filename: Optional[str] = Form(None),
+    dedupe: bool = Form(False),
+    keep_original: bool = Form(False),
     user = Depends(verify_supabase_user)
 ):
     """
     Upload image to Supabase Storage and create thumbnail
     Returns URLs for both full and thumbnail images
+    dedupe=true: nesneler içerik özetiyle adlandırılır; aynı fotoğraf tekrar yüklenirse mevcut URL'ler döner
+    keep_original=true: yeniden kodlanmamış orijinal de saklanır (original_url)
     Requires valid Supabase JWT token
     """
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -1820,55 +5257,21 @@ async def upload_image(
         logger.warning(f"User ID mismatch: token={authenticated_user_id}, request={user_id}")
         raise HTTPException(status_code=403, detail="Forbidden")
     
+    # Read image data in chunks (size-bounded, spilled to a temp file when large)
+    upload = await upload_ingestor.ingest(file)
+    
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-        # Read image data once and store it
-        image_bytes = await file.read()
-        
-        # Validate image data
-        if not image_bytes or len(image_bytes) == 0:
-            raise HTTPException(status_code=400, detail="Empty image file")
-        
-        # Create thumbnail (this will validate the image and raise ValueError if invalid)
-        try:
-            thumbnail_bytes = create_thumbnail(image_bytes, size=(300, 300))
-        except ValueError as thumb_error:
-            logger.error(f"Thumbnail creation failed: {str(thumb_error)}")
-            raise HTTPException(status_code=400, detail=str(thumb_error))
-        
-        # Generate unique filenames
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = filename or f"{timestamp}_{uuid.uuid4().hex[:8]}"
-        full_path = f"{user_id}/{safe_name}_full.jpg"
-        thumb_path = f"{user_id}/{safe_name}_thumb.jpg"
-        
-        # Upload full image
-        full_upload = supabase.storage.from_(bucket).upload(
-            path=full_path,
-            file=image_bytes,
-            file_options={"content-type": "image/jpeg"}
-        )
-        
-        # Upload thumbnail
-        thumb_upload = supabase.storage.from_(bucket).upload(
-            path=thumb_path,
-            file=thumbnail_bytes,
-            file_options={"content-type": "image/jpeg"}
-        )
-        
-        # Get public URLs
-        full_url = supabase.storage.from_(bucket).get_public_url(full_path)
-        thumb_url = supabase.storage.from_(bucket).get_public_url(thumb_path)
+        if dedupe and IMAGE_DEDUPE_ENABLED:
+            paths = await image_digests.store(upload, user_id, bucket, keep_original)
+        else:
+            # Generate unique filenames
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_name = filename or f"{timestamp}_{uuid.uuid4().hex[:8]}"
+            paths = await store_image_upload(upload, bucket, f"{user_id}/{safe_name}", keep_original=keep_original)
         
-        logger.info(f"✅ Image uploaded: {full_path}")
+        logger.info(f"✅ Image uploaded: {paths['full_path']}")
         
-        return ImageUploadResponse(
-            success=True,
-            full_url=full_url,
-            thumbnail_url=thumb_url
-        )
+        return image_upload_response(bucket, paths)
         
     except HTTPException:
         raise
@@ -1878,12 +5281,272 @@ async def upload_image(
             success=False,
             error=str(e)
         )
+    finally:
+        upload.cleanup()
+
+
+class ResizedImageCache:
+    """
+    /api/images/resize çıktıları için iki katmanlı LRU: bayt sınırlı bellek + boyut sınırlı disk.
+    İçerik adresli yollar ({user_id}/{sha256}_...) aynı kaynağı gösterdiğinden anahtar (bucket, path, w, fmt)'dir.
+    Üzerine yazılabilen diğer yollarda anahtara kaynağın sürümü (Storage ETag'i) de girer; kaynak değişince
+    eski çıktı kullanılmaz, LRU ile düşer. ETag çıktı baytlarının sha256'sıdır.
+    Disk dizini birden fazla worker arasında paylaşılabilir; her worker kendi indeksine göre temizlik yapar.
+    """
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, disk_dir: str):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_dir = disk_dir
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (data, etag)
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # file name -> size
+        self._disk_size = 0
+        self._singleflight = SingleFlight()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def key_for(bucket: str, path: str, width: int, fmt: str, version: str = "") -> str:
+        return hashlib.sha256(f"{bucket}|{path}|{width}|{fmt}|{version}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+
+    def _scan_disk(self):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _mtime, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    async def start(self):
+        await asyncio.to_thread(self._scan_disk)
+
+    def _remember(self, key: str, data: bytes, etag: str):
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous:
+            self._memory_size -= len(previous[0])
+        self._memory[key] = (data, etag)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _key, (old, _etag) = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+            self.memory_evictions += 1
+
+    def _unlink(self, key: str):
+        try:
+            os.unlink(self._disk_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            name, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.disk_evictions += 1
+            self._unlink(name)
+
+    def _write_disk(self, key: str, data: bytes):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        temp_path = f"{self._disk_path(key)}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(temp_path, self._disk_path(key))
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    async def get(self, key: str) -> Optional[tuple]:
+        """(data, etag) ya da None; disk isabeti belleğe alınır"""
+        entry = self._memory.get(key)
+        if entry:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry
+        if key in self._disk:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self._disk.move_to_end(key)
+                self.disk_hits += 1
+                etag = hashlib.sha256(data).hexdigest()
+                self._remember(key, data, etag)
+                return data, etag
+            self._disk_size -= self._disk.pop(key, 0)
+        return None
+
+    async def put(self, key: str, data: bytes) -> tuple:
+        etag = hashlib.sha256(data).hexdigest()
+        self._remember(key, data, etag)
+        try:
+            await asyncio.to_thread(self._write_disk, key, data)
+            self._disk_size -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Resize disk cache yazılamadı: {str(e)}")
+        return data, etag
+
+    async def get_or_create(self, key: str, produce) -> tuple:
+        cached = await self.get(key)
+        if cached:
+            return cached
+
+        async def create():
+            # Tek uçuşta ikinci kontrol: önceki lider az önce yazmış olabilir
+            existing = await self.get(key)
+            if existing:
+                return existing
+            self.misses += 1
+            return await self.put(key, await produce())
+
+        return await self._singleflight.do(key, create)
+
+    async def invalidate(self, bucket: str, path: str):
+        """Storage'dan silinen içerik adresli bir nesnenin tüm genişlik/format çıktılarını siler"""
+        for width in IMAGE_RESIZE_WIDTHS:
+            for fmt in IMAGE_VARIANT_ENCODERS:
+                key = self.key_for(bucket, path, width, fmt)
+                entry = self._memory.pop(key, None)
+                if entry:
+                    self._memory_size -= len(entry[0])
+                if key in self._disk:
+                    self._disk_size -= self._disk.pop(key)
+                    await asyncio.to_thread(self._unlink, key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "memory_max_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "disk_max_bytes": self.disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "coalesced": self._singleflight.coalesced,
+            "not_modified": self.not_modified,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+resized_images = ResizedImageCache(IMAGE_RESIZE_MEMORY_BYTES, IMAGE_RESIZE_DISK_BYTES, IMAGE_RESIZE_DISK_DIR)
+
+RESIZED_IMAGE_CACHE_CONTROL = f"public, max-age={IMMUTABLE_CACHE_CONTROL}, immutable"
+RESIZED_MUTABLE_IMAGE_CACHE_CONTROL = f"public, max-age={IMAGE_RESIZE_MUTABLE_MAX_AGE}"
+
+# Kullanıcı başına küçültme (decode) token bucket'ları
+resize_render_limits = TTLCache(maxsize=10000)
+
+
+def allow_resize_render(user_id: str) -> bool:
+    found, bucket = resize_render_limits.get(user_id)
+    if not found:
+        bucket = TokenBucket(IMAGE_RESIZE_USER_RATE, IMAGE_RESIZE_USER_BURST)
+    # Bucket dolana kadar geçen süre boyunca tutulur; sonra yeniden oluşturmak aynı sonucu verir
+    ttl = IMAGE_RESIZE_USER_BURST / IMAGE_RESIZE_USER_RATE if IMAGE_RESIZE_USER_RATE > 0 else 0
+    resize_render_limits.set(user_id, bucket, ttl)
+    return bucket.try_acquire()
+
+
+@api_router.get("/images/resize")
+async def resize_stored_image(
+    path: str,
+    w: int,
+    fmt: str = "jpeg",
+    bucket: str = "wardrobe",
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(verify_supabase_user),
+):
+    """
+    Storage'daki public bir görseli istenen genişlikte döndürür (yalnızca izin verilen genişlik/format/bucket).
+    Kaynak service key ile değil public URL'den okunur; private nesneler bu uçtan okunamaz.
+    Çıktılar bellek + disk LRU'da tutulur; eşzamanlı aynı istekler tek bir indirme/küçültmede birleşir.
+    Önbellekte olmayan küçültmeler kullanıcı başına sınırlıdır (429).
+    Yanıtlar güçlü ETag taşır; içerik adresli yollar immutable, diğerleri kısa süreli önbelleklenir.
+    If-None-Match eşleşirse 304 döner.
+    Requires valid Supabase JWT token
+    """
+    if bucket not in IMAGE_RESIZE_BUCKETS:
+        raise HTTPException(status_code=400, detail="Unsupported bucket")
+    if w not in IMAGE_RESIZE_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"Width must be one of {IMAGE_RESIZE_WIDTHS}")
+    fmt = fmt.lower()
+    if fmt not in supported_variant_formats([fmt]):
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    path = path.lstrip("/")
+    if not path or ".." in path.split("/"):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    if not storage.configured:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    content_addressed = ImageDigestIndex.path_key(path) is not None
+    version = ""
+    if not content_addressed:
+        try:
+            version = await storage.public_version(bucket, path)
+        except StorageError as e:
+            if e.status_code in (400, 404):
+                raise HTTPException(status_code=404, detail="Image not found")
+            raise HTTPException(status_code=502, detail="Storage unavailable")
+        except httpx.HTTPError as e:
+            logger.error(f"Resize source version error ({bucket}/{path}): {str(e)}")
+            raise HTTPException(status_code=502, detail="Storage unavailable")
+
+    async def produce() -> bytes:
+        if not allow_resize_render(user.get("id")):
+            raise HTTPException(status_code=429, detail="Too many resize requests. Please try again later.")
+        try:
+            source = await storage.download(bucket, path, max_bytes=UPLOAD_MAX_BYTES, public=True)
+        except StorageError as e:
+            if e.status_code in (400, 404):
+                raise HTTPException(status_code=404, detail="Image not found")
+            if e.status_code == 413:
+                raise HTTPException(status_code=413, detail="Source image too large")
+            raise HTTPException(status_code=502, detail="Storage unavailable")
+        except httpx.HTTPError as e:
+            logger.error(f"Resize source download error ({bucket}/{path}): {str(e)}")
+            raise HTTPException(status_code=502, detail="Storage unavailable")
+        try:
+            return await image_pool.run("resize", resize_image, source, w, fmt)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    data, etag = await resized_images.get_or_create(resized_images.key_for(bucket, path, w, fmt, version), produce)
+
+    cache_control = RESIZED_IMAGE_CACHE_CONTROL if content_addressed else RESIZED_MUTABLE_IMAGE_CACHE_CONTROL
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+    if if_none_match and (if_none_match.strip() == "*" or f'"{etag}"' in [t.strip() for t in if_none_match.split(",")]):
+        resized_images.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=IMAGE_VARIANT_ENCODERS[fmt][2], headers=headers)
 
 
 @api_router.post("/wardrobe-items")
 async def create_wardrobe_item(
     item: WardrobeItemCreate,
-    user = Depends(verify_supabase_user)
+    user = Depends(verify_supabase_user),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
 ):
     """
     Create wardrobe item in Supabase using service role key.
@@ -1914,30 +5577,31 @@ async def create_wardrobe_item(
             payload["season"] = item.season
         if item.color:
             payload["color"] = item.color
+        if item.blurhash:
+            payload["blurhash"] = item.blurhash
 
         # Supabase REST API endpoint
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/wardrobe_items"
 
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.post(
-                rest_url,
-                json=payload,
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                    "Prefer": "return=minimal",
-                },
-            )
+        resp = await http_client.post(
+            rest_url,
+            json=payload,
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal",
+            },
+        )
 
-            if resp.status_code >= 400:
-                logger.error(
-                    f"Supabase REST insert error: {resp.status_code} - {resp.text}"
-                )
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Supabase insert failed: {resp.status_code} - {resp.text}",
-                )
+        if resp.status_code >= 400:
+            logger.error(
+                f"Supabase REST insert error: {resp.status_code} - {resp.text}"
+            )
+            raise HTTPException(
+                status_code=500,
+                detail=f"Supabase insert failed: {resp.status_code} - {resp.text}",
+            )
 
         return {"success": True}
         
@@ -1950,7 +5614,8 @@ async def create_wardrobe_item(
 @api_router.post("/tryon-results")
 async def create_tryon_result(
     payload: TryOnResultCreate,
-    user = Depends(verify_supabase_user)
+    user = Depends(verify_supabase_user),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
 ):
     """
     Save try-on result image to Supabase Storage and record URL in try_on_results table.
@@ -1973,30 +5638,29 @@ async def create_tryon_result(
 
         # Insert DB row via REST
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/try_on_results"
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.post(
-                rest_url,
-                json={
-                    "user_id": payload.user_id,
-                    "wardrobe_item_id": payload.wardrobe_item_id,
-                    "result_image_url": image_url,
-                },
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                    "Prefer": "return=minimal",
-                },
-            )
+        resp = await http_client.post(
+            rest_url,
+            json={
+                "user_id": payload.user_id,
+                "wardrobe_item_id": payload.wardrobe_item_id,
+                "result_image_url": image_url,
+            },
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal",
+            },
+        )
 
-            if resp.status_code >= 400:
-                logger.error(
-                    f"Supabase REST insert (try_on_results) error: {resp.status_code} - {resp.text}"
-                )
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Supabase insert failed: {resp.status_code} - {resp.text}",
-                )
+        if resp.status_code >= 400:
+            logger.error(
+                f"Supabase REST insert (try_on_results) error: {resp.status_code} - {resp.text}"
+            )
+            raise HTTPException(
+                status_code=500,
+                detail=f"Supabase insert failed: {resp.status_code} - {resp.text}",
+            )
 
         return {"success": True, "result_image_url": image_url}
 
@@ -2033,6 +5697,48 @@ async def health_check():
 # Include the router in the main app
 app.include_router(api_router)
 
+class UploadSizeLimitMiddleware:
+    """
+    Upload endpoint'lerinde istek gövdesini multipart ayrıştırmasından önce sınırlar.
+    Content-Length sınırı aşıyorsa gövde hiç okunmadan 413 döner; chunked isteklerde
+    okunan byte'lar sayılır ve sınır aşıldığı anda ayrıştırma 413 ile kesilir.
+    """
+
+    def __init__(self, app, paths: tuple, max_bytes: int):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            upload_ingestor.rejected_too_large += 1
+            response = JSONResponse({"detail": f"Request body exceeds {self.max_bytes} bytes"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    upload_ingestor.rejected_too_large += 1
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {self.max_bytes} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# Multipart form alanları ve sınırlar için gövde sınırına pay bırakılır
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/upload-image",), max_bytes=UPLOAD_MAX_BYTES + 64 * 1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=False,  # Must be False when allow_origins=["*"]
@@ -2090,15 +5796,13 @@ async def get_all_users(
     page_size: int = 10,
     q: Optional[str] = None,
     session: dict = Depends(verify_admin_session),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
 ):
     """Get paginated users from Supabase"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         page = max(page, 1)
         page_size = max(min(page_size, 100), 1)
         offset = (page - 1) * page_size
@@ -2116,76 +5820,75 @@ async def get_all_users(
             term = f"%{q}%"
             params["or"] = f"email.ilike.{term},full_name.ilike.{term},id.ilike.{term}"
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.get(
-                rest_url,
-                params=params,
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                    "Prefer": "count=exact",
-                },
-            )
+        resp = await http_client.get(
+            rest_url,
+            params=params,
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "count=exact",
+            },
+        )
+            
+        if resp.status_code == 200:
+            users = resp.json()
+            content_range = resp.headers.get("content-range", "")
+            total_count = None
+            if "/" in content_range:
+                try:
+                    total_count = int(content_range.split("/")[-1])
+                except ValueError:
+                    total_count = None
+            if total_count is None:
+                total_count = len(users)
+
+            return {
+                "success": True,
+                "users": users,
+                "count": len(users),
+                "total": total_count,
+                "page": page,
+                "page_size": page_size,
+            }
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch users: {resp.text}")
             
-            if resp.status_code == 200:
-                users = resp.json()
-                content_range = resp.headers.get("content-range", "")
-                total_count = None
-                if "/" in content_range:
-                    try:
-                        total_count = int(content_range.split("/")[-1])
-                    except ValueError:
-                        total_count = None
-                if total_count is None:
-                    total_count = len(users)
-
-                return {
-                    "success": True,
-                    "users": users,
-                    "count": len(users),
-                    "total": total_count,
-                    "page": page,
-                    "page_size": page_size,
-                }
-            else:
-                raise HTTPException(status_code=500, detail=f"Failed to fetch users: {resp.text}")
-                
     except Exception as e:
         logger.error(f"Admin get users error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.get("/users/{user_id}")
-async def get_user(user_id: str, session: dict = Depends(verify_admin_session)):
+async def get_user(
+    user_id: str,
+    session: dict = Depends(verify_admin_session),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
+):
     """Get user details by ID"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/profiles?id=eq.{user_id}&select=*"
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.get(
-                rest_url,
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                },
-            )
+        resp = await http_client.get(
+            rest_url,
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+            },
+        )
             
-            if resp.status_code == 200:
-                users = resp.json()
-                if users:
-                    return {"success": True, "user": users[0]}
-                else:
-                    raise HTTPException(status_code=404, detail="User not found")
+        if resp.status_code == 200:
+            users = resp.json()
+            if users:
+                return {"success": True, "user": users[0]}
             else:
-                raise HTTPException(status_code=500, detail=f"Failed to fetch user: {resp.text}")
-                
+                raise HTTPException(status_code=404, detail="User not found")
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch user: {resp.text}")
+            
     except HTTPException:
         raise
     except Exception as e:
@@ -2193,15 +5896,17 @@ async def get_user(user_id: str, session: dict = Depends(verify_admin_session)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.put("/users/{user_id}")
-async def update_user(user_id: str, update_data: UserUpdateRequest, session: dict = Depends(verify_admin_session)):
+async def update_user(
+    user_id: str,
+    update_data: UserUpdateRequest,
+    session: dict = Depends(verify_admin_session),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
+):
     """Update user credits or subscription"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         payload = {}
         if update_data.credits is not None:
             payload["credits"] = update_data.credits
@@ -2215,24 +5920,25 @@ async def update_user(user_id: str, update_data: UserUpdateRequest, session: dic
         
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/profiles?id=eq.{user_id}"
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.patch(
-                rest_url,
-                json=payload,
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                    "Prefer": "return=representation",
-                },
-            )
+        resp = await http_client.patch(
+            rest_url,
+            json=payload,
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "return=representation",
+            },
+        )
+            
+        if resp.status_code in [200, 204]:
+            if "subscription_tier" in payload:
+                subscription_tiers.pop(user_id)
+            updated_users = resp.json() if resp.content else []
+            return {"success": True, "user": updated_users[0] if updated_users else None}
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to update user: {resp.text}")
             
-            if resp.status_code in [200, 204]:
-                updated_users = resp.json() if resp.content else []
-                return {"success": True, "user": updated_users[0] if updated_users else None}
-            else:
-                raise HTTPException(status_code=500, detail=f"Failed to update user: {resp.text}")
-                
     except HTTPException:
         raise
     except Exception as e:
@@ -2240,7 +5946,11 @@ async def update_user(user_id: str, update_data: UserUpdateRequest, session: dic
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.delete("/users/{user_id}")
-async def delete_user(user_id: str, session: dict = Depends(verify_admin_session)):
+async def delete_user(
+    user_id: str,
+    session: dict = Depends(verify_admin_session),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
+):
     """Delete user (soft delete by setting subscription_status to 'deleted')"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
@@ -2248,22 +5958,21 @@ async def delete_user(user_id: str, session: dict = Depends(verify_admin_session
     try:
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/profiles?id=eq.{user_id}"
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.patch(
-                rest_url,
-                json={"subscription_status": "deleted"},
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                },
-            )
+        resp = await http_client.patch(
+            rest_url,
+            json={"subscription_status": "deleted"},
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+            },
+        )
+            
+        if resp.status_code in [200, 204]:
+            return {"success": True, "message": "User marked as deleted"}
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to delete user: {resp.text}")
             
-            if resp.status_code in [200, 204]:
-                return {"success": True, "message": "User marked as deleted"}
-            else:
-                raise HTTPException(status_code=500, detail=f"Failed to delete user: {resp.text}")
-                
     except HTTPException:
         raise
     except Exception as e:
@@ -2277,21 +5986,18 @@ async def get_all_images(session: dict = Depends(verify_admin_session), bucket:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         # List all files in bucket
-        files = supabase.storage.from_(bucket).list()
+        files = await storage.list(bucket)
         
         images = []
         for file in files:
-            if file.name.endswith(('_full.jpg', '_thumb.jpg', '.jpg', '.png', '.jpeg')):
-                public_url = supabase.storage.from_(bucket).get_public_url(file.name)
+            name = file.get("name") or ""
+            if name.endswith(('_full.jpg', '_thumb.jpg', '.jpg', '.png', '.jpeg', '.webp', '.avif')):
                 images.append({
-                    "name": file.name,
-                    "url": public_url,
-                    "size": file.metadata.get("size", 0) if hasattr(file, 'metadata') else 0,
-                    "created_at": file.created_at if hasattr(file, 'created_at') else None,
+                    "name": name,
+                    "url": storage.get_public_url(bucket, name),
+                    "size": (file.get("metadata") or {}).get("size", 0),
+                    "created_at": file.get("created_at"),
                 })
         
         return {"success": True, "images": images, "count": len(images), "bucket": bucket}
@@ -2301,8 +6007,17 @@ async def get_all_images(session: dict = Depends(verify_admin_session), bucket:
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.delete("/images")
-async def delete_image(session: dict = Depends(verify_admin_session), bucket: str = "wardrobe", path: str = None):
-    """Delete an image from storage"""
+async def delete_image(
+    session: dict = Depends(verify_admin_session),
+    bucket: str = "wardrobe",
+    path: str = None,
+    force: bool = False,
+):
+    """
+    Delete an image from storage
+    İçerik adresli (dedupe) bir nesne silinirken eşlemenin tüm nesneleri (varyantlar, orijinal) birlikte silinir.
+    Eşleme birden fazla yüklemeye döndürülmüşse diğer kayıtları bozmamak için force=true olmadan 409 döner.
+    """
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
@@ -2310,13 +6025,24 @@ async def delete_image(session: dict = Depends(verify_admin_session), bucket: st
         raise HTTPException(status_code=400, detail="Path parameter is required")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        result = supabase.storage.from_(bucket).remove([path])
-        
-        if getattr(result, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to delete image: {result.error}")
+        mapping = await image_digests.find_by_path(bucket, path)
+        paths = [path]
+        if mapping:
+            refs = mapping.get("refs", mapping.get("hits", 0) + 1)
+            if refs > 1 and not force:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Image is shared by {refs} uploads; pass force=true to delete it for all of them",
+                )
+            paths = image_digests.object_paths(mapping)
+        try:
+            await storage.remove(bucket, paths)
+            if mapping:
+                await image_digests.forget(mapping)
+            for removed in paths:
+                await resized_images.invalidate(bucket, removed)
+        except StorageError as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete image: {str(e)}")
         
         return {"success": True, "message": f"Image {path} deleted successfully"}
         
@@ -2327,82 +6053,81 @@ async def delete_image(session: dict = Depends(verify_admin_session), bucket: st
         raise HTTPException(status_code=500, detail=str(e))
 
 @admin_router.get("/stats")
-async def get_stats(session: dict = Depends(verify_admin_session)):
+async def get_stats(
+    session: dict = Depends(verify_admin_session),
+    http_client: httpx.AsyncClient = Depends(upstream_client("supabase_rest")),
+):
     """Get admin dashboard statistics"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        from supabase import create_client, Client
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
         # Get user stats
         rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/profiles?select=id,subscription_tier,credits,created_at"
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            resp = await http_client.get(
-                rest_url,
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                },
-            )
+        resp = await http_client.get(
+            rest_url,
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+            },
+        )
+            
+        if resp.status_code == 200:
+            users = resp.json()
+            
+            # Calculate stats
+            total_users = len(users) if isinstance(users, list) else 0
+            # subscription_status kolonu yok; aktif kullanıcıyı toplam olarak raporla
+            active_users = total_users
+            free_users = len([u for u in users if isinstance(u, dict) and u.get("subscription_tier") == "free"]) if isinstance(users, list) else 0
+            premium_users = len([u for u in users if isinstance(u, dict) and u.get("subscription_tier") == "premium"]) if isinstance(users, list) else 0
+            total_credits = sum(u.get("credits", 0) for u in users if isinstance(u, dict)) if isinstance(users, list) else 0
             
-            if resp.status_code == 200:
-                users = resp.json()
-                
-                # Calculate stats
-                total_users = len(users) if isinstance(users, list) else 0
-                # subscription_status kolonu yok; aktif kullanıcıyı toplam olarak raporla
-                active_users = total_users
-                free_users = len([u for u in users if isinstance(u, dict) and u.get("subscription_tier") == "free"]) if isinstance(users, list) else 0
-                premium_users = len([u for u in users if isinstance(u, dict) and u.get("subscription_tier") == "premium"]) if isinstance(users, list) else 0
-                total_credits = sum(u.get("credits", 0) for u in users if isinstance(u, dict)) if isinstance(users, list) else 0
-                
-                # Get image counts - hata durumunda 0 döndür
+            # Get image counts - hata durumunda 0 döndür
+            wardrobe_count = 0
+            profile_count = 0
+            try:
+                wardrobe_files = await storage.list("wardrobe")
+                if wardrobe_files:
+                    wardrobe_count = len([f for f in wardrobe_files if (f.get("name") or "").endswith(('_full.jpg', '.jpg', '.png', '.jpeg'))])
+            except Exception as e:
+                logger.warning(f"Failed to get wardrobe files: {str(e)}")
                 wardrobe_count = 0
+            
+            try:
+                profile_files = await storage.list("profiles")
+                if profile_files:
+                    profile_count = len([f for f in profile_files if (f.get("name") or "").endswith(('.jpg', '.png', '.jpeg'))])
+            except Exception as e:
+                logger.warning(f"Failed to get profile files: {str(e)}")
                 profile_count = 0
-                try:
-                    wardrobe_files = supabase.storage.from_("wardrobe").list()
-                    if wardrobe_files:
-                        wardrobe_count = len([f for f in wardrobe_files if hasattr(f, 'name') and f.name.endswith(('_full.jpg', '.jpg', '.png', '.jpeg'))])
-                except Exception as e:
-                    logger.warning(f"Failed to get wardrobe files: {str(e)}")
-                    wardrobe_count = 0
-                
-                try:
-                    profile_files = supabase.storage.from_("profiles").list()
-                    if profile_files:
-                        profile_count = len([f for f in profile_files if hasattr(f, 'name') and f.name.endswith(('.jpg', '.png', '.jpeg'))])
-                except Exception as e:
-                    logger.warning(f"Failed to get profile files: {str(e)}")
-                    profile_count = 0
-                
-                return {
-                    "success": True,
-                    "stats": {
-                        "users": {
-                            "total": total_users,
-                            "active": active_users,
-                            "free": free_users,
-                            "premium": premium_users,
-                        },
-                        "credits": {
-                            "total": total_credits,
-                            "average": round(total_credits / total_users, 2) if total_users > 0 else 0,
-                        },
-                        "images": {
-                            "wardrobe": wardrobe_count,
-                            "profiles": profile_count,
-                        },
-                    }
+            
+            return {
+                "success": True,
+                "stats": {
+                    "users": {
+                        "total": total_users,
+                        "active": active_users,
+                        "free": free_users,
+                        "premium": premium_users,
+                    },
+                    "credits": {
+                        "total": total_credits,
+                        "average": round(total_credits / total_users, 2) if total_users > 0 else 0,
+                    },
+                    "images": {
+                        "wardrobe": wardrobe_count,
+                        "profiles": profile_count,
+                    },
                 }
-            else:
-                error_detail = resp.text[:200] if resp.text else "Unknown error"
-                logger.error(f"Failed to fetch users: {resp.status_code} - {error_detail}")
-                raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {error_detail}")
-                
+            }
+        else:
+            error_detail = resp.text[:200] if resp.text else "Unknown error"
+            logger.error(f"Failed to fetch users: {resp.status_code} - {error_detail}")
+            raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {error_detail}")
+            
     except HTTPException:
         raise
     except Exception as e:
@@ -2410,67 +6135,96 @@ async def get_stats(session: dict = Depends(verify_admin_session)):
         logger.error(f"Admin get stats error: {error_msg}")
         raise HTTPException(status_code=500, detail=f"Stats error: {error_msg}")
 
-@admin_router.post("/notifications/send")
+@admin_router.post("/notifications/send", status_code=202)
 async def send_notification(request: NotificationRequest, session: dict = Depends(verify_admin_session)):
-    """Send push notification to users"""
+    """
+    Push bildirim gönderimini arka plan işi olarak kuyruğa alır ve hemen job_id döndürür.
+    İlerleme GET /api/admin/notifications/jobs/{job_id} ile izlenir.
+    """
     try:
         logger.info(
             f"Admin notification request from {session.get('email')}: title={request.title}, body={request.body}, user_id={request.user_id}"
         )
 
-        tokens_info = await fetch_push_tokens_from_supabase(request.user_id)
+        # Mirror hazırsa alıcı olup olmadığı hemen bilinir; tek kullanıcıda yeni kayıt için önce artımlı senkron
+        if push_token_mirror.ready and not await push_token_mirror.has_tokens(request.user_id):
+            if request.user_id:
+                await push_token_mirror.sync()
+            if not await push_token_mirror.has_tokens(request.user_id):
+                raise HTTPException(status_code=404, detail="Gönderilecek push token bulunamadı")
 
-        if not tokens_info:
-            raise HTTPException(status_code=404, detail="Gönderilecek push token bulunamadı")
-
-        # Token bilgilerini log için hazırla
-        tokens_summary = [
-            {
-                "token": item["token"][:20] + "..." if len(item["token"]) > 20 else item["token"],
-                "platform": item.get("platform", "unknown"),
-                "user_id": item.get("user_id"),
-                "is_expo": item.get("is_expo", False),
-                "is_fcm": item.get("is_fcm", False)
-            }
-            for item in tokens_info
-        ]
-
-        result = await send_expo_push_notifications(tokens_info, request.title, request.body, request.data)
-
-        sent_count = len(result.get("sent", []))
-        failed = result.get("failed", [])
-        error_msgs = result.get("errors", [])
-
-        # Push notification'ı logla
-        await log_push_notification(
-            title=request.title,
-            body=request.body,
-            target_user_id=request.user_id,
-            sent_count=sent_count,
-            failed_count=len(failed),
-            tokens_info=tokens_summary,
-            errors=error_msgs
+        job = await push_jobs.submit(
+            request.title, request.body, request.data, request.user_id, session.get("email")
         )
-
-        if failed or error_msgs:
-            logger.warning(
-                f"Push notification partial failures - sent: {sent_count}, failed: {len(failed)}, errors: {error_msgs}"
-            )
-
+        logger.info(f"Push job queued: {job['id']}")
         return {
-            "success": len(failed) == 0,
-            "message": f"{sent_count} bildirim gönderildi, {len(failed)} başarısız",
-            "sent": sent_count,
-            "failed": failed,
-            "errors": error_msgs,
+            "success": True,
+            "message": "Bildirim gönderimi kuyruğa alındı",
+            **serialize_push_job(job),
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Admin send notification error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@admin_router.get("/notifications/jobs")
+async def list_notification_jobs(
+    session: dict = Depends(verify_admin_session),
+    page: int = 1,
+    page_size: int = 20,
+):
+    """Push gönderim işlerini (yeniden eskiye) listeler"""
+    page = max(page, 1)
+    page_size = max(min(page_size, 100), 1)
+    cursor = push_jobs.collection.find({}, {"_id": 0, "chunks": 0, "failed_samples": 0})
+    jobs = await cursor.sort("created_at", -1).skip((page - 1) * page_size).limit(page_size).to_list(length=page_size)
+    total_count = await push_jobs.collection.count_documents({})
+    return {
+        "success": True,
+        "jobs": [serialize_push_job(job) for job in jobs],
+        "count": len(jobs),
+        "total": total_count,
+        "page": page,
+        "page_size": page_size,
+    }
+
+@admin_router.get("/notifications/jobs/{job_id}")
+async def get_notification_job(job_id: str, session: dict = Depends(verify_admin_session)):
+    """Push gönderim işinin durumu ve sent/failed/remaining sayaçları"""
+    job = await push_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, **serialize_push_job(job)}
+
+@admin_router.post("/notifications/jobs/{job_id}/cancel")
+async def cancel_notification_job(job_id: str, session: dict = Depends(verify_admin_session)):
+    """Push gönderim işini iptal eder; çalışan iş uçuştaki chunk'ları bitirip durur"""
+    job = await push_jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    logger.info(f"Push job cancel requested by {session.get('email')}: {job_id} ({job['status']})")
+    return {"success": True, **serialize_push_job(job)}
+
+@admin_router.get("/notifications/tokens/sync")
+async def get_push_token_sync_status(session: dict = Depends(verify_admin_session)):
+    """push_tokens mirror senkron durumu"""
+    return {"success": True, "mirror": await push_token_mirror.stats()}
+
+@admin_router.post("/notifications/tokens/resync")
+async def resync_push_tokens(session: dict = Depends(verify_admin_session)):
+    """push_tokens mirror'ını Supabase'den baştan senkronize eder (arka planda)"""
+    if not PUSH_MIRROR_ENABLED:
+        raise HTTPException(status_code=400, detail="Push token mirror devre dışı (PUSH_MIRROR_ENABLED)")
+    started = push_token_mirror.request_full_resync()
+    logger.info(f"Push token full resync requested by {session.get('email')}: started={started}")
+    return {
+        "success": True,
+        "started": started,
+        "message": "Tam senkron başlatıldı" if started else "Tam senkron zaten çalışıyor",
+    }
+
 @admin_router.get("/notifications/logs")
 async def get_notification_logs(
     session: dict = Depends(verify_admin_session),
@@ -2514,6 +6268,33 @@ async def get_notification_logs(
         logger.error(f"Admin get notification logs error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@admin_router.get("/metrics")
+async def get_metrics(session: dict = Depends(verify_admin_session)):
+    """Process içi önbellek ve kuyruk metrikleri"""
+    return {
+        "success": True,
+        "metrics": {
+            "auth_cache": auth_cache_stats(),
+            "tryon_jobs": tryon_jobs.stats(),
+            "tryon_cache": tryon_result_cache.stats(),
+            "tryon_admission": tryon_admission.stats(),
+            "subscription_tiers": {**subscription_tiers.stats(), **subscription_tier_lookups},
+            "tryon_inputs": tryon_input_normalizer.stats(),
+            "image_pool": image_pool.stats(),
+            "uploads": upload_ingestor.stats(),
+            "image_dedupe": image_digests.stats(),
+            "full_images": full_image_savings.stats(),
+            "resized_images": resized_images.stats(),
+            "expo_push": expo_push_sender.stats(),
+            "push_token_mirror": await push_token_mirror.stats(),
+            "push_jobs": push_jobs.stats(),
+            "tryon_transfer": {
+                "bytes": tryon_transfer_bytes,
+                **{stage: histogram.stats() for stage, histogram in tryon_transfer_timings.items()},
+            },
+        },
+    }
+
 @admin_router.post("/logout")
 async def admin_logout(session: dict = Depends(verify_admin_session), x_admin_token: str = Header(..., alias="X-Admin-Token")):
     """Admin logout endpoint"""
@@ -2523,6 +6304,75 @@ async def admin_logout(session: dict = Depends(verify_admin_session), x_admin_to
 # Include admin router
 app.include_router(admin_router)
 
+@app.on_event("startup")
+async def startup_http_clients():
+    await http_clients.start()
+
+@app.on_event("startup")
+async def startup_tryon_jobs():
+    try:
+        await tryon_jobs.start()
+    except Exception as e:
+        logger.error(f"Try-on job queue başlatılamadı: {str(e)}")
+
+@app.on_event("startup")
+async def startup_tryon_cache():
+    try:
+        await tryon_result_cache.start()
+        await tryon_input_normalizer.start()
+    except Exception as e:
+        logger.error(f"Try-on cache index'leri oluşturulamadı: {str(e)}")
+
+@app.on_event("startup")
+async def startup_resized_images():
+    try:
+        await resized_images.start()
+    except Exception as e:
+        logger.error(f"Resize disk cache başlatılamadı: {str(e)}")
+
+@app.on_event("startup")
+async def startup_image_digests():
+    try:
+        await image_digests.start()
+    except Exception as e:
+        logger.error(f"image_digests index'leri oluşturulamadı: {str(e)}")
+
+@app.on_event("startup")
+async def startup_push_token_mirror():
+    if not PUSH_MIRROR_ENABLED:
+        return
+    try:
+        await push_token_mirror.start()
+    except Exception as e:
+        logger.error(f"Push token mirror başlatılamadı: {str(e)}")
+
+@app.on_event("startup")
+async def startup_push_jobs():
+    try:
+        await push_jobs.start()
+    except Exception as e:
+        logger.error(f"Push job kuyruğu başlatılamadı: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_tryon_jobs():
+    await tryon_jobs.stop()
+
+@app.on_event("shutdown")
+async def shutdown_push_jobs():
+    await push_jobs.stop()
+
+@app.on_event("shutdown")
+async def shutdown_push_token_mirror():
+    await push_token_mirror.stop()
+
+@app.on_event("shutdown")
+async def shutdown_image_pool():
+    image_pool.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    await http_clients.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -0,0 +1,8 @@
+-- Migration: Add blurhash placeholder column to wardrobe_items
+-- Date: 2026-10-17
+-- Description: Store a BlurHash string computed at upload time so galleries can paint a placeholder instantly
+
+ALTER TABLE wardrobe_items
+ADD COLUMN IF NOT EXISTS blurhash TEXT;
+
+COMMENT ON COLUMN wardrobe_items.blurhash IS 'Optional: BlurHash placeholder of the item image (backfill: backend/scripts/backfill_blurhash.py)';
@@ -132,7 +132,7 @@ export default function AddItemScreen() {
         throw new Error(uploadResponse.error || 'Upload failed');
       }
 
-      const { fullUrl, thumbnailUrl } = uploadResponse;
+      const { fullUrl, thumbnailUrl, blurhash } = uploadResponse;
       console.log('✅ Image uploaded:', { fullUrl, thumbnailUrl });
 
       // Get Supabase session token
@@ -148,6 +148,7 @@ export default function AddItemScreen() {
         name,
         image_url: fullUrl,
         thumbnail_url: thumbnailUrl,
+        blurhash: blurhash || null,
         category,
         season: season || null,
         color: color || null,
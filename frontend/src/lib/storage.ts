@@ -5,6 +5,9 @@ export interface UploadResult {
   success: boolean;
   fullUrl?: string;
   thumbnailUrl?: string;
+  // Responsive variants keyed by long-edge size, then format: { '640': { jpeg: url, webp: url } }
+  variants?: Record<string, Record<string, string>>;
+  blurhash?: string;
   error?: string;
 }
 
@@ -18,7 +21,8 @@ export async function uploadImageToStorage(
   userId: string,
   bucket: 'wardrobe' | 'profiles' = 'wardrobe',
   filename?: string,
-  mimeType: string = 'image/jpeg'
+  mimeType: string = 'image/jpeg',
+  dedupe: boolean = false // content-addressed: re-uploading the same photo returns the existing URLs
 ): Promise<UploadResult> {
   try {
     const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL as string;
@@ -76,6 +80,9 @@ export async function uploadImageToStorage(
     if (filename) {
       formData.append('filename', filename);
     }
+    if (dedupe) {
+      formData.append('dedupe', 'true');
+    }
 
     const response = await axios.post(
       `${EXPO_PUBLIC_BACKEND_URL}/api/upload-image`,
@@ -93,6 +100,8 @@ export async function uploadImageToStorage(
       success: response.data.success,
       fullUrl: response.data.full_url,
       thumbnailUrl: response.data.thumbnail_url,
+      variants: response.data.variants ?? undefined,
+      blurhash: response.data.blurhash ?? undefined,
       error: response.data.error,
     };
   } catch (error: any) {
@@ -4,6 +4,7 @@ export interface WardrobeItem {
   name: string;
   image_url: string;  // Supabase Storage URL (full size)
   thumbnail_url: string;  // Supabase Storage URL (300x300 thumbnail)
+  blurhash?: string | null;  // BlurHash placeholder computed at upload time
   category: ClothingCategory;
   season: Season;
   color: string;
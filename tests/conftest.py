@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# server.py reads its configuration at import time
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "service-key")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "modli_test")
+
+import server  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+
+async def _find_one_and_update(self, filter, update, projection=None, return_document=False, **kwargs):
+    # mongomock re-applies the filter after the update, so claims that change "status" come back as None
+    doc = await self.find_one(filter, {"_id": 1})
+    if doc is None:
+        return None
+    before = await self.find_one({"_id": doc["_id"]}, projection)
+    await self.update_one({"_id": doc["_id"]}, update)
+    if return_document:
+        return await self.find_one({"_id": doc["_id"]}, projection)
+    return before
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["modli_test"]
+    monkeypatch.setattr(type(database.image_digests), "find_one_and_update", _find_one_and_update)
+    monkeypatch.setattr(server, "db", database)
+    return database
@@ -0,0 +1,26 @@
+import asyncio
+from datetime import datetime, timedelta
+
+
+def expired_running_job(job_id: str, attempts: int, **fields):
+    now = datetime.utcnow()
+    return {
+        "id": job_id,
+        "status": "running",
+        "worker_id": "crashed-worker",
+        "lease_expires_at": now - timedelta(seconds=5),
+        "attempts": attempts,
+        "created_at": now - timedelta(minutes=10),
+        "updated_at": now - timedelta(minutes=5),
+        **fields,
+    }
+
+
+async def drain(queue):
+    """Runs one worker until the queue is empty"""
+    worker = asyncio.create_task(queue._worker())
+    try:
+        await asyncio.wait_for(queue._queue.join(), timeout=10)
+    finally:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
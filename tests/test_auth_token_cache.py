@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def token_for(user_id: str, expires_in: int = 3600) -> str:
+    # Remote validation never checks the signature here; the cache only reads exp
+    return jwt.encode({"sub": user_id, "exp": int(time.time()) + expires_in}, "unused-signing-key-of-length-32!!", algorithm="HS256")
+
+
+@pytest.fixture
+def remote_auth(monkeypatch):
+    """/auth/v1/user with a configurable delay and status; counts calls per token"""
+    state = {"calls": 0, "delay": 0.0, "status": 200}
+
+    async def handler(request):
+        state["calls"] += 1
+        await asyncio.sleep(state["delay"])
+        if state["status"] == "down":
+            raise httpx.ConnectError("auth down", request=request)
+        token = request.headers["authorization"].split(" ", 1)[1]
+        return httpx.Response(state["status"], json={"id": jwt.decode(token, options={"verify_signature": False})["sub"]})
+
+    monkeypatch.setitem(
+        server.http_clients._clients, "supabase_auth", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(server, "SUPABASE_ANON_KEY", "anon-key")
+    monkeypatch.setattr(server, "auth_token_cache", server.TTLCache(maxsize=100))
+    monkeypatch.setattr(server, "auth_singleflight", server.SingleFlight())
+    return state
+
+
+def validate(*tokens):
+    async def run():
+        return await asyncio.gather(*(server.fetch_supabase_user_cached(t) for t in tokens), return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_for_one_token_share_a_single_remote_call(remote_auth):
+    remote_auth["delay"] = 0.05
+    token = token_for("user-1")
+
+    users = validate(*[token] * 5)
+
+    assert [u["id"] for u in users] == ["user-1"] * 5
+    assert remote_auth["calls"] == 1
+    assert server.auth_singleflight.coalesced == 4
+
+
+def test_different_tokens_are_not_coalesced(remote_auth):
+    remote_auth["delay"] = 0.05
+
+    users = validate(token_for("user-1"), token_for("user-2"))
+
+    assert [u["id"] for u in users] == ["user-1", "user-2"]
+    assert remote_auth["calls"] == 2
+
+
+def test_valid_result_is_cached_no_longer_than_token_expiry(remote_auth, monkeypatch):
+    monkeypatch.setattr(server, "AUTH_CACHE_TTL", 300)
+    short_lived = token_for("user-1", expires_in=2)
+
+    validate(short_lived)
+    validate(short_lived)
+
+    assert remote_auth["calls"] == 1
+    (expires_at, _user), = server.auth_token_cache._data.values()
+    assert expires_at - time.monotonic() <= 2
+
+
+def test_rejected_token_is_negatively_cached(remote_auth):
+    remote_auth["status"] = 401
+    token = token_for("user-1")
+
+    first, = validate(token)
+    second, = validate(token)
+
+    assert isinstance(first, HTTPException) and first.status_code == 401
+    assert isinstance(second, HTTPException) and second.status_code == 401
+    assert remote_auth["calls"] == 1
+
+
+def test_outage_is_not_cached(remote_auth):
+    remote_auth["status"] = "down"
+    token = token_for("user-1")
+
+    first, = validate(token)
+    remote_auth["status"] = 200
+    second, = validate(token)
+
+    assert isinstance(first, HTTPException) and first.status_code == 503
+    assert second["id"] == "user-1"
+    assert remote_auth["calls"] == 2
@@ -0,0 +1,262 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+import server
+
+
+def device(i: int) -> str:
+    return f"ExponentPushToken[dev-{i:05d}]"
+
+
+def messages(count: int):
+    return [{"to": device(i), "title": "Yeni koleksiyon", "body": "Göz at"} for i in range(count)]
+
+
+@pytest.fixture
+def expo_api(monkeypatch):
+    """Expo push endpoint that tracks concurrent requests and how each body was encoded"""
+    state = {"requests": [], "inflight": 0, "peak_inflight": 0, "delay": 0.0}
+
+    async def handler(request):
+        encoding = request.headers.get("content-encoding")
+        body = gzip.decompress(request.content) if encoding == "gzip" else request.content
+        batch = json.loads(body)
+        state["requests"].append({
+            "encoding": encoding,
+            "wire_bytes": len(request.content),
+            "tokens": [m["to"] for m in batch],
+            "messages": batch,
+        })
+        state["inflight"] += 1
+        state["peak_inflight"] = max(state["peak_inflight"], state["inflight"])
+        try:
+            await asyncio.sleep(state["delay"])
+        finally:
+            state["inflight"] -= 1
+        return httpx.Response(200, json={"data": [{"status": "ok", "id": m["to"]} for m in batch]})
+
+    monkeypatch.setitem(server.http_clients._clients, "expo", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return state
+
+
+def make_sender(max_inflight=3, rate_per_second=0, gzip_enabled=True) -> server.ExpoPushSender:
+    return server.ExpoPushSender(max_inflight, rate_per_second, server.EXPO_MAX_BATCH, gzip_enabled)
+
+
+def dispatch(sender, items, **options):
+    return asyncio.run(sender.dispatch(items, **options))
+
+
+def test_chunks_are_sent_concurrently_up_to_the_inflight_limit(expo_api):
+    expo_api["delay"] = 0.02
+    sender = make_sender(max_inflight=3)
+
+    result = dispatch(sender, messages(server.EXPO_MAX_BATCH * 10))
+
+    assert expo_api["peak_inflight"] == 3
+    assert len(expo_api["requests"]) == 10
+    assert all(len(r["tokens"]) <= server.EXPO_MAX_BATCH for r in expo_api["requests"])
+    # Completion order is not guaranteed, but every message is accounted for exactly once
+    assert sorted(result["sent"]) == [device(i) for i in range(server.EXPO_MAX_BATCH * 10)]
+    assert result["sent_count"] == server.EXPO_MAX_BATCH * 10 and result["failed"] == []
+    assert result["throughput"]["chunks"] == 10
+    assert result["throughput"]["messages_per_second"] > 0
+
+
+def test_async_iterable_source_is_streamed(expo_api):
+    async def source():
+        for message in messages(200):
+            yield message
+
+    result = dispatch(make_sender(), source(), keep_sent=False)
+
+    assert result["sent"] == [] and result["sent_count"] == 200
+    assert [len(r["tokens"]) for r in expo_api["requests"]] == [90, 90, 20]
+
+
+def test_shared_rate_limit_shapes_the_send(expo_api):
+    # Burst covers the first chunk; the next two wait for 90 tokens each at 1800/s
+    sender = make_sender(max_inflight=6, rate_per_second=1800)
+
+    result = dispatch(sender, messages(server.EXPO_MAX_BATCH * 3))
+
+    assert result["sent_count"] == server.EXPO_MAX_BATCH * 3
+    assert result["throughput"]["throttled_seconds"] >= 0.05
+    assert result["throughput"]["duration_seconds"] >= 0.09
+
+
+def test_large_bodies_are_gzipped(expo_api):
+    sender = make_sender()
+
+    dispatch(sender, messages(server.EXPO_MAX_BATCH))
+
+    request, = expo_api["requests"]
+    assert request["encoding"] == "gzip"
+    assert sender.bytes_sent == request["wire_bytes"] < sender.bytes_raw
+
+
+def test_small_bodies_and_disabled_gzip_are_sent_plain(expo_api):
+    dispatch(make_sender(), messages(1))
+    dispatch(make_sender(gzip_enabled=False), messages(server.EXPO_MAX_BATCH))
+
+    assert [r["encoding"] for r in expo_api["requests"]] == [None, None]
+
+
+def test_send_expo_push_notifications_builds_messages_per_platform(expo_api, monkeypatch):
+    monkeypatch.setattr(server, "expo_push_sender", make_sender())
+    monkeypatch.setattr(server, "APP_LOGO_URL", "https://cdn.test/logo.png")
+    tokens = [
+        {"token": device(1), "platform": "android"},
+        {"token": device(2), "platform": "ios"},
+        {"token": None, "platform": "ios"},
+    ]
+
+    result = asyncio.run(server.send_expo_push_notifications(tokens, "Başlık", "Gövde", {"screen": "home"}))
+
+    android, ios = sorted(expo_api["requests"][0]["messages"], key=lambda m: m["to"])
+    assert android["icon"] == "https://cdn.test/logo.png" and android["channelId"] == "default"
+    assert "icon" not in ios and "channelId" not in ios
+    assert ios["data"] == {"app_name": "Modli", "screen": "home"}
+    assert sorted(result["sent"]) == [device(1), device(2)]
+    assert result["throughput"]["messages"] == 2
+
+
+@pytest.mark.parametrize("tokens, error", [
+    ([], "Kayıtlı push token yok"),
+    ([{"token": None}], "Geçerli push token yok"),
+])
+def test_send_without_deliverable_tokens_reports_why(expo_api, monkeypatch, tokens, error):
+    monkeypatch.setattr(server, "expo_push_sender", make_sender())
+
+    result = asyncio.run(server.send_expo_push_notifications(tokens, "Başlık", "Gövde"))
+
+    assert result["errors"] == [error]
+    assert expo_api["requests"] == []
+
+
+@pytest.fixture
+def flaky_expo(monkeypatch):
+    """Expo endpoint that answers each request with the next scripted reply, then with all-ok tickets"""
+    state = {"script": [], "requests": []}
+
+    def handler(request):
+        body = gzip.decompress(request.content) if request.headers.get("content-encoding") else request.content
+        tokens = [m["to"] for m in json.loads(body)]
+        state["requests"].append(tokens)
+        reply = state["script"].pop(0) if state["script"] else None
+        if reply is None:
+            return httpx.Response(200, json={"data": [{"status": "ok"} for _ in tokens]})
+        return reply(request, tokens)
+
+    monkeypatch.setitem(server.http_clients._clients, "expo", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server, "EXPO_RETRY_BASE_DELAY", 0.001)
+    return state
+
+
+def status(code: int, **headers):
+    return lambda request, tokens: httpx.Response(code, text="busy", headers=headers)
+
+
+def tickets(errors):
+    """errors: token -> details.error for tokens whose ticket is not ok"""
+    def ticket(token):
+        if token not in errors:
+            return {"status": "ok"}
+        return {"status": "error", "message": errors[token], "details": {"error": errors[token]}}
+
+    def reply(request, tokens):
+        return httpx.Response(200, json={"data": [ticket(t) for t in tokens]})
+
+    return reply
+
+
+def connection_reset(request, tokens):
+    raise httpx.ReadError("connection reset", request=request)
+
+
+@pytest.mark.parametrize("reply", [status(429), status(503), connection_reset], ids=["429", "503", "network"])
+def test_transient_failure_retries_the_whole_chunk(flaky_expo, reply):
+    flaky_expo["script"] = [reply]
+    sender = make_sender()
+
+    result = dispatch(sender, messages(5))
+
+    assert flaky_expo["requests"] == [[device(i) for i in range(5)]] * 2
+    assert sorted(result["sent"]) == [device(i) for i in range(5)] and result["failed"] == []
+    assert sender.retries == 1 and sender.requeued_messages == 5
+
+
+def test_only_messages_with_retryable_tickets_are_requeued(flaky_expo):
+    flaky_expo["script"] = [tickets({device(1): "MessageRateExceeded", device(3): "DeviceNotRegistered"})]
+    sender = make_sender()
+
+    result = dispatch(sender, messages(5))
+
+    assert flaky_expo["requests"][1] == [device(1)]
+    assert sorted(result["sent"]) == [device(0), device(1), device(2), device(4)]
+    failed, = result["failed"]
+    assert failed["token"] == device(3) and failed["details"] == {"error": "DeviceNotRegistered"}
+    assert sender.requeued_messages == 1
+
+
+def test_client_errors_are_not_retried(flaky_expo):
+    flaky_expo["script"] = [status(400)]
+
+    result = dispatch(make_sender(), messages(3))
+
+    assert len(flaky_expo["requests"]) == 1
+    assert [f["token"] for f in result["failed"]] == [device(i) for i in range(3)]
+
+
+def test_retries_stop_after_max_attempts(flaky_expo, monkeypatch):
+    monkeypatch.setattr(server, "EXPO_RETRY_MAX_ATTEMPTS", 3)
+    flaky_expo["script"] = [status(503)] * 10
+
+    result = dispatch(make_sender(), messages(2))
+
+    assert len(flaky_expo["requests"]) == 3
+    assert result["sent"] == [] and len(result["failed"]) == 2
+    assert "3 deneme" in result["failed"][0]["error"]
+
+
+def test_retry_after_beyond_the_deadline_fails_without_waiting(flaky_expo):
+    flaky_expo["script"] = [status(429, **{"Retry-After": "60"})]
+    sender = make_sender()
+
+    result = dispatch(sender, messages(2), deadline_seconds=1)
+
+    assert len(flaky_expo["requests"]) == 1
+    assert len(result["failed"]) == 2 and "süre doldu" in result["errors"][-1]
+    assert sender.deadline_exceeded == 1
+    assert result["throughput"]["duration_seconds"] < 1
+
+
+def test_backoff_honours_retry_after_and_caps_growth(monkeypatch):
+    monkeypatch.setattr(server, "EXPO_RETRY_BASE_DELAY", 1.0)
+    monkeypatch.setattr(server, "EXPO_RETRY_MAX_DELAY", 4.0)
+
+    assert all(server.ExpoPushSender._backoff(1, 2.5) >= 2.5 for _ in range(50))
+    assert all(0 <= server.ExpoPushSender._backoff(10, None) <= 4.0 for _ in range(50))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("7", 7.0),
+    ("-3", 0.0),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+    ("soon", None),
+    (None, None),
+])
+def test_retry_after_header_parsing(value, expected):
+    assert server.ExpoPushSender._parse_retry_after(value) == expected
+
+
+def test_retry_after_http_date_in_the_future():
+    value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+
+    assert 25 < server.ExpoPushSender._parse_retry_after(value) <= 30
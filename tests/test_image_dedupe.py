@@ -0,0 +1,179 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import server
+
+
+def jpeg_bytes(size=(64, 48), color=(200, 80, 40)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def make_upload(data: bytes) -> server.IngestedUpload:
+    upload = server.IngestedUpload()
+    await upload.write(data)
+    await upload.finish()
+    upload.format = "JPEG"
+    return upload
+
+
+class FakeStorage:
+    """In-memory stand-in for the Supabase Storage calls used by store_image_upload"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.removed = []
+        self.fail_suffix = None
+        self.gate = None
+
+    async def upload(self, bucket, path, data, **kwargs):
+        if not isinstance(data, (bytes, bytearray)):
+            data = b"".join([chunk async for chunk in data])
+        if self.gate is not None:
+            await self.gate.wait()
+        self.uploads.append(path)
+        if self.fail_suffix and path.endswith(self.fail_suffix):
+            raise server.StorageError(f"Storage upload failed: 500 - {path}", 500)
+        self.objects[path] = bytes(data)
+        return path
+
+    async def remove(self, bucket, paths):
+        self.removed.extend(paths)
+        for path in paths:
+            self.objects.pop(path, None)
+        return [{"name": path} for path in paths]
+
+    async def list(self, bucket, prefix="", limit=100, offset=0, search=None):
+        names = [path[len(prefix) + 1:] for path in sorted(self.objects) if path.startswith(f"{prefix}/")]
+        return [{"name": name} for name in names if not search or name.startswith(search)][offset:offset + limit]
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    fake = FakeStorage()
+    for name in ("upload", "remove", "list"):
+        monkeypatch.setattr(server.storage, name, getattr(fake, name))
+    return fake
+
+
+def test_concurrent_uploads_of_same_digest_are_coalesced(db, fake_storage):
+    index = server.ImageDigestIndex()
+    data = jpeg_bytes()
+
+    async def scenario():
+        fake_storage.gate = asyncio.Event()
+        first, second = await make_upload(data), await make_upload(data)
+        tasks = [asyncio.create_task(index.store(u, "u1", "wardrobe")) for u in (first, second)]
+        await asyncio.sleep(0.05)
+        fake_storage.gate.set()
+        return await asyncio.gather(*tasks), first.digest
+
+    (first_paths, second_paths), digest = asyncio.run(scenario())
+
+    assert first_paths["full_path"] == second_paths["full_path"] == f"u1/{digest}_full.jpg"
+    assert index.stats()["coalesced"] == 1
+    assert index.misses == 1
+    # Every object is written once, not once per upload
+    assert len(fake_storage.uploads) == len(set(fake_storage.uploads))
+    mapping = asyncio.run(db.image_digests.find_one({"digest": digest}))
+    assert mapping["refs"] == 2
+
+
+def test_repeat_upload_is_a_hit_and_counts_a_reference(db, fake_storage):
+    index = server.ImageDigestIndex()
+    data = jpeg_bytes()
+
+    async def scenario():
+        first = await index.store(await make_upload(data), "u1", "wardrobe")
+        written = len(fake_storage.uploads)
+        second = await index.store(await make_upload(data), "u1", "wardrobe")
+        return first, second, written
+
+    first, second, written = asyncio.run(scenario())
+
+    assert second["full_path"] == first["full_path"]
+    assert len(fake_storage.uploads) == written
+    assert (index.hits, index.misses) == (1, 1)
+    mapping = asyncio.run(db.image_digests.find_one({"full_path": first["full_path"]}))
+    assert mapping["refs"] == 2
+
+
+def test_keep_original_joining_a_flight_uploads_only_the_original(db, fake_storage):
+    index = server.ImageDigestIndex()
+    data = jpeg_bytes()
+
+    async def scenario():
+        fake_storage.gate = asyncio.Event()
+        plain, original = await make_upload(data), await make_upload(data)
+        tasks = [
+            asyncio.create_task(index.store(plain, "u1", "wardrobe")),
+            asyncio.create_task(index.store(original, "u1", "wardrobe", keep_original=True)),
+        ]
+        await asyncio.sleep(0.05)
+        fake_storage.gate.set()
+        return await asyncio.gather(*tasks), plain.digest
+
+    (plain_paths, original_paths), digest = asyncio.run(scenario())
+
+    original_path = f"u1/{digest}_original.jpg"
+    assert "original_path" not in plain_paths
+    assert original_paths["original_path"] == original_path
+    assert original_paths["full_path"] == plain_paths["full_path"]
+    assert fake_storage.uploads.count(original_path) == 1
+    assert len(fake_storage.uploads) == len(set(fake_storage.uploads))
+    assert fake_storage.objects[original_path] == data
+    mapping = asyncio.run(db.image_digests.find_one({"digest": digest}))
+    assert mapping["original_path"] == original_path
+    assert original_path in mapping["object_paths"]
+
+
+def test_failed_store_rolls_back_only_objects_it_created(db, fake_storage):
+    index = server.ImageDigestIndex()
+    data = jpeg_bytes()
+
+    async def scenario():
+        upload = await make_upload(data)
+        # A previous, unrecorded store left the thumbnail behind
+        thumb_path = f"u1/{upload.digest}_thumb.jpg"
+        fake_storage.objects[thumb_path] = b"earlier"
+        fake_storage.fail_suffix = "_full.jpg"
+        with pytest.raises(server.StorageError):
+            await index.store(upload, "u1", "wardrobe")
+        return upload.digest, thumb_path
+
+    digest, thumb_path = asyncio.run(scenario())
+
+    assert f"u1/{digest}_full.jpg" in fake_storage.removed
+    assert thumb_path not in fake_storage.removed
+    assert thumb_path in fake_storage.objects
+    assert asyncio.run(db.image_digests.count_documents({})) == 0
+
+
+def test_spooled_upload_outlives_request_cleanup_while_flight_runs(db, fake_storage, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_SPOOL_THRESHOLD", 16)
+    index = server.ImageDigestIndex()
+
+    async def scenario():
+        fake_storage.gate = asyncio.Event()
+        upload = await make_upload(jpeg_bytes())
+        assert upload.spilled
+        task = asyncio.create_task(index.store(upload, "u1", "wardrobe", keep_original=True))
+        await asyncio.sleep(0.05)
+        # The request handler's finally runs (e.g. the client disconnected) while the upload is still in flight
+        upload.cleanup()
+        still_there = os.path.exists(upload.path)
+        fake_storage.gate.set()
+        paths = await task
+        return upload, paths, still_there
+
+    upload, paths, still_there = asyncio.run(scenario())
+
+    assert still_there
+    assert not os.path.exists(upload.path)
+    assert fake_storage.objects[paths["original_path"]] == jpeg_bytes()
@@ -0,0 +1,191 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageCms
+
+import server
+
+APP0, APP1, APP2, APP13, APP14, COM, SOS = 0xE0, 0xE1, 0xE2, 0xED, 0xEE, 0xFE, 0xDA
+
+
+def photo(size=(320, 240), seed=7) -> Image.Image:
+    """Noisy gradient: compresses like a photo, so JPEG size actually depends on quality"""
+    rng = random.Random(seed)
+    width, height = size
+    pixels = bytes(
+        min(255, max(0, (x * 255 // width if c == 0 else y * 255 // height if c == 1 else 128) + rng.randint(-40, 40)))
+        for y in range(height) for x in range(width) for c in range(3)
+    )
+    return Image.frombytes("RGB", size, pixels)
+
+
+def save_jpeg(image: Image.Image, **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="JPEG", **options)
+    return output.getvalue()
+
+
+def segment(marker: int, payload: bytes) -> bytes:
+    return bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def insert_after_soi(data: bytes, *segments: bytes) -> bytes:
+    return data[:2] + b"".join(segments) + data[2:]
+
+
+def markers(data: bytes):
+    """Marker codes of the header segments up to and including SOS"""
+    found, pos = [], 2
+    while True:
+        marker = data[pos + 1]
+        found.append(marker)
+        if marker == SOS:
+            return found
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+
+
+def scan_data(data: bytes) -> bytes:
+    return data[data.index(b"\xff\xda"):]
+
+
+def exif_bytes(orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "Camera"
+    exif[0x8825] = {1: "N", 2: (41.0, 0.0, 0.0)}  # GPS IFD
+    return exif.tobytes()
+
+
+@pytest.fixture
+def srgb_profile() -> bytes:
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+
+def test_budget_search_picks_the_highest_quality_that_fits():
+    image = photo()
+    low, high = len(save_jpeg(image, quality=60, optimize=True)), len(save_jpeg(image, quality=90, optimize=True))
+    budget = (low + high) // 2
+
+    data, quality = server.encode_jpeg_within_budget(image, budget, 60, 90)
+
+    assert 60 <= quality < 90
+    assert len(data) <= budget
+    assert len(save_jpeg(image, quality=quality + 1, optimize=True)) > budget
+    assert data == save_jpeg(image, quality=quality, optimize=True)
+
+
+def test_budget_search_falls_back_to_minimum_quality_when_nothing_fits():
+    data, quality = server.encode_jpeg_within_budget(photo(), 1024, 60, 90)
+
+    assert quality == 60
+    assert len(data) > 1024
+
+
+def test_budget_search_keeps_the_icc_profile(srgb_profile):
+    image = photo((64, 48))
+    image.info["icc_profile"] = srgb_profile
+
+    data, _quality = server.encode_jpeg_within_budget(image, 10 ** 6, 60, 90)
+
+    assert Image.open(io.BytesIO(data)).info.get("icc_profile") == srgb_profile
+
+
+@pytest.fixture
+def full_image_limits(monkeypatch):
+    monkeypatch.setattr(server, "FULL_IMAGE_MAX_EDGE", 256)
+    monkeypatch.setattr(server, "FULL_IMAGE_MAX_BYTES", 40 * 1024)
+    monkeypatch.setattr(server, "FULL_IMAGE_QUALITY_MIN", 60)
+    monkeypatch.setattr(server, "FULL_IMAGE_QUALITY_MAX", 90)
+
+
+def process(data: bytes):
+    return server.process_uploaded_image(data, [64], ["jpeg"], recompress_full=True)
+
+
+def test_large_upload_is_downscaled_and_recompressed_within_budget(full_image_limits):
+    source = save_jpeg(photo((640, 480)), quality=98)
+
+    result = process(source)
+
+    full = Image.open(io.BytesIO(result["full"]))
+    assert full.size == (256, 192)
+    assert 60 <= result["full_quality"] <= 90
+    assert len(result["full"]) <= 40 * 1024
+    assert result["original_bytes"] == len(source)
+
+
+def test_small_well_compressed_jpeg_keeps_its_bytes_without_metadata(full_image_limits, srgb_profile):
+    pixels = save_jpeg(photo((200, 150)), quality=50, icc_profile=srgb_profile)
+    source = insert_after_soi(pixels, segment(APP1, b"Exif\x00\x00" + exif_bytes()[6:]), segment(COM, b"shot on x"))
+
+    result = process(source)
+
+    assert result["full_quality"] is None
+    assert APP1 not in markers(result["full"]) and COM not in markers(result["full"])
+    assert {APP0, APP2} <= set(markers(result["full"]))
+    assert scan_data(result["full"]) == scan_data(source)
+    assert Image.open(io.BytesIO(result["full"])).tobytes() == Image.open(io.BytesIO(source)).tobytes()
+
+
+def test_small_jpeg_is_re_encoded_when_that_saves_bytes(full_image_limits):
+    source = save_jpeg(photo((200, 150)), quality=100)
+
+    result = process(source)
+
+    assert result["full_quality"] is not None
+    assert len(result["full"]) < len(source)
+
+
+def test_rotated_jpeg_is_re_encoded_upright(full_image_limits):
+    source = save_jpeg(photo((200, 150)), quality=50, exif=exif_bytes(orientation=6))
+
+    result = process(source)
+
+    assert result["full_quality"] is not None
+    assert Image.open(io.BytesIO(result["full"])).size == (150, 200)
+
+
+def test_png_upload_is_always_re_encoded(full_image_limits):
+    output = io.BytesIO()
+    photo((120, 90)).save(output, format="PNG")
+
+    result = process(output.getvalue())
+
+    assert result["full_quality"] is not None
+    assert Image.open(io.BytesIO(result["full"])).format == "JPEG"
+
+
+def test_strip_drops_exif_xmp_iptc_and_comments_but_keeps_colour_segments(srgb_profile):
+    cmyk = save_jpeg(Image.new("CMYK", (32, 32), (10, 200, 30, 0)), quality=80, icc_profile=srgb_profile)
+    xmp = segment(APP1, b"http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>")
+    iptc = segment(APP13, b"Photoshop 3.0\x008BIM")
+    source = insert_after_soi(cmyk, segment(APP1, b"Exif\x00\x00" + exif_bytes()[6:]), xmp, iptc, segment(COM, b"hi"))
+    assert {APP1, APP13, COM, APP14} <= set(markers(source))
+
+    stripped = server.strip_jpeg_metadata(source)
+
+    assert not {APP1, APP13, COM} & set(markers(stripped))
+    assert {APP2, APP14} <= set(markers(stripped))
+    assert scan_data(stripped) == scan_data(source)
+    decoded = Image.open(io.BytesIO(stripped))
+    assert decoded.mode == "CMYK" and decoded.info.get("icc_profile") == srgb_profile
+    assert decoded.tobytes() == Image.open(io.BytesIO(source)).tobytes()
+
+
+def test_strip_skips_fill_bytes_between_segments():
+    source = save_jpeg(photo((16, 16)))
+    padded = source[:2] + b"\xff\xff" + segment(COM, b"x") + source[2:]
+
+    assert server.strip_jpeg_metadata(padded) == source
+
+
+@pytest.mark.parametrize("data", [
+    pytest.param(b"\x89PNG\r\n\x1a\n", id="not-jpeg"),
+    pytest.param(b"\xff\xd8" + b"\xff\xe1\x10\x00" + b"short", id="truncated-segment"),
+    pytest.param(b"\xff\xd8" + segment(COM, b"only a comment"), id="no-image-data"),
+    pytest.param(b"\xff\xd8\x00\x00", id="bad-marker"),
+])
+def test_strip_rejects_streams_it_cannot_walk(data):
+    with pytest.raises(ValueError):
+        server.strip_jpeg_metadata(data)
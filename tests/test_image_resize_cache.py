@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import server
+
+DIGEST = hashlib.sha256(b"source").hexdigest()
+CONTENT_PATH = f"u1/{DIGEST}_full.jpg"
+
+
+def blob(tag: str, size: int = 100) -> bytes:
+    return tag.encode() * (size // len(tag))
+
+
+def cache(tmp_path, memory_bytes=1024, disk_bytes=1024) -> server.ResizedImageCache:
+    return server.ResizedImageCache(memory_bytes, disk_bytes, str(tmp_path / "resize"))
+
+
+def test_memory_tier_evicts_least_recently_used_and_falls_back_to_disk(tmp_path):
+    resized = cache(tmp_path, memory_bytes=250)
+
+    async def scenario():
+        for key in ("a", "b"):
+            await resized.put(key, blob(key))
+        await resized.get("a")  # b is now the least recently used
+        await resized.put("c", blob("c"))
+        return set(resized._memory), resized.memory_evictions, await resized.get("b")
+
+    in_memory, evictions, from_disk = asyncio.run(scenario())
+
+    assert in_memory == {"a", "c"} and evictions == 1
+    assert from_disk == (blob("b"), hashlib.sha256(blob("b")).hexdigest())
+    assert resized.disk_hits == 1 and resized.memory_hits == 1
+
+
+def test_entries_larger_than_memory_are_served_from_disk(tmp_path):
+    resized = cache(tmp_path, memory_bytes=50)
+
+    async def scenario():
+        await resized.put("big", blob("big"))
+        return await resized.get("big")
+
+    assert asyncio.run(scenario())[0] == blob("big")
+    assert resized._memory_size == 0 and resized.disk_hits == 1
+
+
+def test_disk_tier_is_bounded_and_deletes_evicted_files(tmp_path):
+    resized = cache(tmp_path, memory_bytes=0, disk_bytes=250)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await resized.put(key, blob(key))
+        return await resized.get("a"), await resized.get("c")
+
+    evicted, kept = asyncio.run(scenario())
+
+    assert evicted is None and kept[0] == blob("c")
+    assert resized.disk_evictions == 1
+    assert sorted(os.listdir(resized.disk_dir)) == ["b", "c"]
+    assert resized.stats()["disk_bytes"] == 200
+
+
+def test_start_adopts_existing_files_oldest_first_and_skips_partial_writes(tmp_path):
+    disk_dir = tmp_path / "resize"
+    disk_dir.mkdir()
+    for age, key in enumerate(("newest", "middle", "oldest")):
+        (disk_dir / key).write_bytes(blob(key))
+        os.utime(disk_dir / key, (1_000_000 - age, 1_000_000 - age))
+    (disk_dir / "half.1234abcd.tmp").write_bytes(b"partial")
+    resized = cache(tmp_path, disk_bytes=250)
+
+    async def scenario():
+        await resized.start()
+        return await resized.get("middle")
+
+    assert asyncio.run(scenario())[0] == blob("middle")
+    assert not (disk_dir / "oldest").exists()
+    assert set(resized._disk) == {"middle", "newest"}
+
+
+def test_concurrent_misses_render_once(tmp_path):
+    resized = cache(tmp_path)
+    renders = []
+
+    async def produce():
+        renders.append(1)
+        await asyncio.sleep(0.02)
+        return blob("rendered")
+
+    async def scenario():
+        return await asyncio.gather(*(resized.get_or_create("k", produce) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(renders) == 1 and resized.misses == 1
+    assert resized.stats()["coalesced"] == 4
+    assert len(set(results)) == 1
+
+
+def test_etag_is_the_content_hash_and_survives_a_restart(tmp_path):
+    first = cache(tmp_path)
+    _data, etag = asyncio.run(first.put("k", blob("x")))
+
+    restarted = cache(tmp_path)
+
+    async def scenario():
+        await restarted.start()
+        return await restarted.get("k")
+
+    assert etag == hashlib.sha256(blob("x")).hexdigest()
+    assert asyncio.run(scenario())[1] == etag
+
+
+def test_invalidate_drops_every_width_and_format_of_a_path(tmp_path):
+    resized = cache(tmp_path, memory_bytes=10 ** 6, disk_bytes=10 ** 6)
+    keys = [resized.key_for("wardrobe", CONTENT_PATH, w, "jpeg") for w in server.IMAGE_RESIZE_WIDTHS[:2]]
+    other = resized.key_for("wardrobe", "u1/other.jpg", server.IMAGE_RESIZE_WIDTHS[0], "jpeg")
+
+    async def scenario():
+        for key in keys + [other]:
+            await resized.put(key, blob(key))
+        await resized.invalidate("wardrobe", CONTENT_PATH)
+        return [await resized.get(key) for key in keys], await resized.get(other)
+
+    gone, kept = asyncio.run(scenario())
+
+    assert gone == [None, None] and kept is not None
+    assert os.listdir(resized.disk_dir) == [other]
+
+
+def jpeg(size=(800, 600), color=(30, 120, 200)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def resize_source(monkeypatch, tmp_path):
+    """Public Storage object behind the resize endpoint; counts downloads and serves a settable version"""
+    state = {"data": jpeg(), "version": '"v1"', "downloads": 0}
+
+    async def download(bucket, path, max_bytes=None, public=False):
+        assert public
+        state["downloads"] += 1
+        return state["data"]
+
+    async def public_version(bucket, path):
+        return state["version"]
+
+    monkeypatch.setattr(server.storage, "download", download)
+    monkeypatch.setattr(server.storage, "public_version", public_version)
+    monkeypatch.setattr(server, "resized_images", cache(tmp_path, 10 ** 7, 10 ** 7))
+    monkeypatch.setattr(server, "resize_render_limits", server.TTLCache(maxsize=100))
+    return state
+
+
+def resize(path=CONTENT_PATH, w=300, if_none_match=None, user_id="u1"):
+    return asyncio.run(server.resize_stored_image(
+        path=path, w=w, fmt="jpeg", bucket="wardrobe", if_none_match=if_none_match, user={"id": user_id}
+    ))
+
+
+def test_content_addressed_path_is_immutable_and_revalidates_with_304(resize_source):
+    first = resize()
+    etag = first.headers["etag"]
+
+    assert first.status_code == 200
+    assert Image.open(io.BytesIO(first.body)).width == 300
+    assert etag == f'"{hashlib.sha256(first.body).hexdigest()}"'
+    assert "immutable" in first.headers["cache-control"]
+
+    again = resize(if_none_match=etag)
+
+    assert again.status_code == 304 and again.body == b""
+    assert again.headers["etag"] == etag
+    assert resize_source["downloads"] == 1
+    assert server.resized_images.not_modified == 1
+
+
+@pytest.mark.parametrize("header, status", [
+    ("*", 304),
+    ('"stale", {etag}', 304),
+    ('W/"stale"', 200),
+])
+def test_if_none_match_forms(resize_source, header, status):
+    etag = resize().headers["etag"]
+
+    response = resize(if_none_match=header.format(etag=etag))
+
+    assert response.status_code == status
+
+
+def test_mutable_path_is_keyed_by_source_version(resize_source):
+    first = resize(path="u1/avatar.jpg")
+    same = resize(path="u1/avatar.jpg")
+    resize_source["version"] = '"v2"'
+    resize_source["data"] = jpeg(color=(200, 40, 40))
+    changed = resize(path="u1/avatar.jpg", if_none_match=first.headers["etag"])
+
+    assert first.headers["cache-control"] == server.RESIZED_MUTABLE_IMAGE_CACHE_CONTROL
+    assert same.headers["etag"] == first.headers["etag"]
+    assert changed.status_code == 200 and changed.headers["etag"] != first.headers["etag"]
+    assert resize_source["downloads"] == 2
+
+
+def test_renders_are_rate_limited_per_user_but_cache_hits_are_not(resize_source, monkeypatch):
+    monkeypatch.setattr(server, "IMAGE_RESIZE_USER_RATE", 0.001)
+    monkeypatch.setattr(server, "IMAGE_RESIZE_USER_BURST", 1)
+    widths = server.IMAGE_RESIZE_WIDTHS
+
+    resize(w=widths[0])
+    with pytest.raises(HTTPException) as error:
+        resize(w=widths[1])
+
+    assert error.value.status_code == 429
+    assert resize(w=widths[0]).status_code == 200
+    assert resize(w=widths[1], user_id="u2").status_code == 200
+    assert resize_source["downloads"] == 2
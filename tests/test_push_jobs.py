@@ -0,0 +1,191 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+import server
+from tests.helpers import drain, expired_running_job
+
+
+def push_token(i: int) -> str:
+    return f"ExponentPushToken[{i:04d}]"
+
+
+@pytest.fixture
+def expo(monkeypatch):
+    """Records every token sent to Expo; delay slows each push request down"""
+    state = {"sent": [], "delay": 0.0}
+
+    async def handler(request):
+        body = request.content
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        messages = json.loads(body)
+        await asyncio.sleep(state["delay"])
+        state["sent"].extend(message["to"] for message in messages)
+        return httpx.Response(200, json={"data": [{"status": "ok"} for _ in messages]})
+
+    monkeypatch.setitem(server.http_clients._clients, "expo", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server.expo_push_sender, "limiter", server.TokenBucket(0, 1))
+    monkeypatch.setattr(server.push_token_mirror, "ready", True)
+    return state
+
+
+async def seed_tokens(db, count: int):
+    if count:
+        await db.push_tokens_mirror.insert_many([
+            {"user_id": f"u{i % 10}", "push_token": push_token(i), "platform": "ios"} for i in range(count)
+        ])
+
+
+def push_job_fields(**fields):
+    return {
+        "title": "Yeni koleksiyon",
+        "body": "Göz at",
+        "data": None,
+        "target_user_id": None,
+        "created_by": "admin",
+        "total": None,
+        "sent": 0,
+        "failed": 0,
+        "errors": [],
+        "failed_samples": [],
+        "chunks": [],
+        "next_seq": 0,
+        "checkpoint": None,
+        "cancel_requested": False,
+        **fields,
+    }
+
+
+def test_expired_push_job_resumes_after_checkpoint_without_resending(db, expo):
+    jobs = server.PushBroadcastJobs(workers=1)
+    in_doubt = {"seq": 1, "first": push_token(100), "last": push_token(199), "size": 100, "status": "sending"}
+
+    async def scenario():
+        await seed_tokens(db, 250)
+        await db.push_broadcast_jobs.insert_one(expired_running_job("job-1", attempts=1, **push_job_fields(
+            total=250, sent=100, checkpoint=push_token(99), chunks=[in_doubt], next_seq=2,
+        )))
+        await jobs.recover()
+        requeued = await jobs.get("job-1")
+        await drain(jobs)
+        return requeued, await jobs.get("job-1")
+
+    requeued, final = asyncio.run(scenario())
+
+    assert requeued["status"] == "queued"
+    assert "worker_id" not in requeued
+    assert jobs.recovered == 1
+    # Tokens up to the checkpoint and the in-doubt chunk are never sent again
+    assert sorted(expo["sent"]) == [push_token(i) for i in range(200, 250)]
+    assert final["status"] == "succeeded"
+    assert (final["sent"], final["failed"]) == (150, 100)
+    assert final["checkpoint"] == push_token(249)
+    assert jobs.interrupted_messages == 100
+
+
+def test_push_job_past_max_attempts_fails_instead_of_requeueing(db):
+    jobs = server.PushBroadcastJobs(workers=1)
+
+    async def scenario():
+        await db.push_broadcast_jobs.insert_one(
+            expired_running_job("job-1", attempts=server.PUSH_JOB_MAX_ATTEMPTS, **push_job_fields())
+        )
+        await jobs.recover()
+        return await jobs.get("job-1")
+
+    job = asyncio.run(scenario())
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Job interrupted too many times"
+    assert jobs._queue.empty()
+
+
+def test_push_job_stops_sending_once_lease_is_lost(db, expo):
+    expo["delay"] = 0.05
+    jobs = server.PushBroadcastJobs(workers=1)
+
+    async def take_over_after_first_chunk(job_id):
+        while not (await jobs.get(job_id))["sent"]:
+            await asyncio.sleep(0.01)
+        await db.push_broadcast_jobs.update_one({"id": job_id}, {"$set": {"worker_id": "other-worker"}})
+
+    async def scenario():
+        await seed_tokens(db, 2000)
+        job = await jobs.submit("Yeni koleksiyon", "Göz at", None, None, "admin")
+        takeover = asyncio.create_task(take_over_after_first_chunk(job["id"]))
+        await drain(jobs)
+        await takeover
+        sent = len(expo["sent"])
+        await asyncio.sleep(0.2)
+        return await jobs.get(job["id"]), sent
+
+    job, sent = asyncio.run(scenario())
+
+    assert sent < 2000
+    assert len(expo["sent"]) == sent
+    assert job["status"] == "running"
+    assert job["worker_id"] == "other-worker"
+    assert jobs.completed == 0 and jobs.failed == 0
+
+
+def test_push_job_without_recipients_fails(db, expo):
+    jobs = server.PushBroadcastJobs(workers=1)
+
+    async def scenario():
+        job = await jobs.submit("Yeni koleksiyon", "Göz at", None, None, "admin")
+        await drain(jobs)
+        return await jobs.get(job["id"])
+
+    job = asyncio.run(scenario())
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Alıcı bulunamadı: gönderilecek push token yok"
+    assert job["total"] == 0
+    assert expo["sent"] == []
+
+
+def test_cancel_of_job_running_elsewhere_leaves_no_local_state(db):
+    jobs = server.PushBroadcastJobs(workers=1)
+
+    async def scenario():
+        await db.push_broadcast_jobs.insert_one({
+            "id": "job-1", "status": "running", "worker_id": "other-worker", **push_job_fields(),
+        })
+        running = await jobs.cancel("job-1")
+        missing = await jobs.cancel("no-such-job")
+        return running, missing
+
+    running, missing = asyncio.run(scenario())
+
+    assert running["cancel_requested"] is True
+    assert missing is None
+    assert jobs._cancel_requested == set()
+
+
+def test_cancel_of_local_running_job_stops_it_and_clears_state(db, expo):
+    expo["delay"] = 0.05
+    jobs = server.PushBroadcastJobs(workers=1)
+
+    async def cancel_after_first_chunk(job_id):
+        while not (await jobs.get(job_id))["sent"]:
+            await asyncio.sleep(0.01)
+        await jobs.cancel(job_id)
+        return set(jobs._cancel_requested)
+
+    async def scenario():
+        await seed_tokens(db, 2000)
+        job = await jobs.submit("Yeni koleksiyon", "Göz at", None, None, "admin")
+        canceller = asyncio.create_task(cancel_after_first_chunk(job["id"]))
+        await drain(jobs)
+        return job["id"], await canceller, await jobs.get(job["id"])
+
+    job_id, pending, job = asyncio.run(scenario())
+
+    assert pending == {job_id}
+    assert job["status"] == "cancelled"
+    assert job["sent"] < 2000
+    assert jobs._cancel_requested == set() and jobs._running == set()
@@ -0,0 +1,202 @@
+import asyncio
+import re
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+import server
+
+KEYSET_AFTER_NULL = re.compile(r'\(and\(updated_at\.is\.null,push_token\.gt\."(.*)"\),updated_at\.not\.is\.null\)')
+KEYSET_AFTER = re.compile(r'\(updated_at\.gt\."(.*?)",and\(updated_at\.eq\."(.*?)",push_token\.gt\."(.*)"\)\)')
+
+
+class FakePushTokenTable:
+    """PostgREST's push_tokens endpoint over a list of rows: the filters, ordering and exact count the mirror uses"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.requests = []
+
+    @staticmethod
+    def order(row):
+        # order=updated_at.asc.nullsfirst,push_token.asc
+        return row["updated_at"] is not None, row["updated_at"] or "", row["push_token"] or ""
+
+    def handler(self, request):
+        query = {key: values[0] for key, values in parse_qs(urlparse(str(request.url)).query).items()}
+        self.requests.append(query)
+        rows = sorted((r for r in self.rows if r["push_token"] is not None), key=self.order)
+        if query.get("updated_at") == "is.null":
+            rows = [r for r in rows if r["updated_at"] is None]
+        if "user_id" in query:
+            rows = [r for r in rows if r["user_id"] == query["user_id"][len("eq."):]]
+        if "or" in query:
+            after_null = KEYSET_AFTER_NULL.fullmatch(query["or"])
+            if after_null:
+                token = after_null.group(1)
+                rows = [r for r in rows if r["updated_at"] is not None or r["push_token"] > token]
+            else:
+                updated_at, _, token = KEYSET_AFTER.fullmatch(query["or"]).groups()
+                rows = [
+                    r for r in rows
+                    if r["updated_at"] is not None
+                    and (r["updated_at"] > updated_at or (r["updated_at"] == updated_at and r["push_token"] > token))
+                ]
+        if request.headers.get("prefer") == "count=exact":
+            return httpx.Response(206, json=rows[:1], headers={"content-range": f"0-0/{len(rows)}"})
+        return httpx.Response(200, json=rows[:int(query["limit"])])
+
+
+def token_row(i: int, updated_at="2026-01-01T00:00:00+00:00", user_id=None):
+    return {
+        "user_id": user_id or f"u{i % 7}",
+        "push_token": f"ExponentPushToken[{i:04d}]",
+        "platform": "ios",
+        "updated_at": updated_at,
+    }
+
+
+@pytest.fixture
+def supabase_tokens(monkeypatch):
+    table = FakePushTokenTable([])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(table.handler))
+    monkeypatch.setitem(server.http_clients._clients, "supabase_rest", client)
+    return table
+
+
+@pytest.fixture
+def mirror(db):
+    return server.PushTokenMirror(interval=60, full_interval=3600, overlap=0)
+
+
+def test_reconcile_ignores_duplicate_and_empty_rows_after_full_sync(db, supabase_tokens, mirror):
+    supabase_tokens.rows = [token_row(i) for i in range(20)]
+    # Same (user_id, push_token) twice and an empty token: one mirror document and none respectively
+    supabase_tokens.rows += [dict(supabase_tokens.rows[0]), {**token_row(99), "push_token": ""}]
+
+    async def scenario():
+        await mirror.sync(full=True)
+        return [await mirror.reconcile() for _ in range(3)], await mirror.get_state()
+
+    results, state = asyncio.run(scenario())
+
+    assert results == [False, False, False]
+    assert state["surplus_rows"] == 2
+    assert mirror.full_syncs == 1
+
+
+def test_reconcile_runs_full_sync_when_rows_are_deleted(db, supabase_tokens, mirror):
+    supabase_tokens.rows = [token_row(i) for i in range(20)] + [dict(token_row(0))]
+
+    async def scenario():
+        await mirror.sync(full=True)
+        del supabase_tokens.rows[5:8]
+        drifted = await mirror.reconcile()
+        return drifted, await mirror.reconcile(), await db.push_tokens_mirror.count_documents({})
+
+    drifted, again, count = asyncio.run(scenario())
+
+    assert (drifted, again) == (True, False)
+    assert count == 17
+    assert mirror.drift_detected == 1
+
+
+def read_rows(**options):
+    async def collect():
+        return [row async for page in server.iter_push_token_rows(**options) for row in page]
+
+    return asyncio.run(collect())
+
+
+def mixed_rows():
+    """NULL updated_at rows first, then several rows sharing one timestamp, then later ones"""
+    rows = [token_row(i, updated_at=None) for i in range(4)]
+    rows += [token_row(i, updated_at="2026-01-01T00:00:00+00:00") for i in range(4, 11)]
+    rows += [token_row(i, updated_at=f"2026-01-0{2 + i % 3}T00:00:00+00:00") for i in range(11, 20)]
+    return rows
+
+
+def test_keyset_paging_reads_every_row_once_across_null_and_tied_timestamps(supabase_tokens):
+    supabase_tokens.rows = mixed_rows()
+
+    rows = read_rows(page_size=3)
+
+    assert rows == sorted(supabase_tokens.rows, key=FakePushTokenTable.order)
+    # 20 rows in pages of 3: six full pages, a short seventh ends the scan
+    assert len(supabase_tokens.requests) == 7
+    assert "or" not in supabase_tokens.requests[0]
+    assert KEYSET_AFTER_NULL.fullmatch(supabase_tokens.requests[1]["or"])
+    assert KEYSET_AFTER.fullmatch(supabase_tokens.requests[-1]["or"])
+
+
+def test_exact_multiple_of_page_size_ends_with_an_empty_page(supabase_tokens):
+    supabase_tokens.rows = [token_row(i) for i in range(6)]
+
+    assert len(read_rows(page_size=3)) == 6
+    assert len(supabase_tokens.requests) == 3
+
+
+def test_paging_resumes_after_a_cursor(supabase_tokens):
+    supabase_tokens.rows = mixed_rows()
+    ordered = sorted(supabase_tokens.rows, key=FakePushTokenTable.order)
+
+    after_null = read_rows(after=(None, ordered[1]["push_token"]), page_size=4)
+    after_tied = read_rows(after=(ordered[6]["updated_at"], ordered[6]["push_token"]), page_size=4)
+
+    assert after_null == ordered[2:]
+    assert after_tied == ordered[7:]
+
+
+def test_null_updated_at_mode_and_user_filter(supabase_tokens):
+    supabase_tokens.rows = mixed_rows()
+
+    null_rows = read_rows(updated_at_null=True, page_size=2)
+    user_rows = read_rows(target_user_id="u3", page_size=2)
+
+    assert [r["push_token"] for r in null_rows] == [token_row(i)["push_token"] for i in range(4)]
+    assert {r["user_id"] for r in user_rows} == {"u3"}
+    assert len(user_rows) == sum(r["user_id"] == "u3" for r in supabase_tokens.rows)
+
+
+def test_failed_page_raises(monkeypatch):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503, text="down")))
+    monkeypatch.setitem(server.http_clients._clients, "supabase_rest", client)
+
+    with pytest.raises(server.HTTPException) as error:
+        read_rows()
+
+    assert error.value.status_code == 500
+
+
+def test_incremental_sync_picks_up_new_and_null_updated_at_rows(db, supabase_tokens, mirror):
+    supabase_tokens.rows = [token_row(i) for i in range(5)]
+
+    async def scenario():
+        await mirror.sync(full=True)
+        supabase_tokens.rows += [token_row(5, updated_at="2026-02-01T00:00:00+00:00"), token_row(6, updated_at=None)]
+        await mirror.sync()
+        return sorted(await db.push_tokens_mirror.distinct("push_token"))
+
+    assert asyncio.run(scenario()) == [token_row(i)["push_token"] for i in range(7)]
+
+
+def test_iter_tokens_skips_a_token_shared_by_several_users(db, mirror):
+    shared = token_row(1)["push_token"]
+
+    async def scenario():
+        await db.push_tokens_mirror.insert_many([
+            {"user_id": "u1", "push_token": shared, "platform": "ios"},
+            {"user_id": "u2", "push_token": shared, "platform": "ios"},
+            {"user_id": "u2", "push_token": token_row(2)["push_token"], "platform": "android"},
+            {"user_id": "u3", "push_token": token_row(0)["push_token"], "platform": "ios"},
+        ])
+        every = [t["token"] async for t in mirror.iter_tokens()]
+        resumed = [t["token"] async for t in mirror.iter_tokens(after=shared)]
+        return every, resumed, await mirror.count_tokens()
+
+    every, resumed, count = asyncio.run(scenario())
+
+    assert every == [token_row(i)["push_token"] for i in range(3)]
+    assert resumed == [token_row(2)["push_token"]]
+    assert count == 3
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import server
+
+SECRET = "test-jwt-secret-with-enough-length-for-hs256"
+ISSUER = "http://supabase.test/auth/v1"
+
+
+def claims(**overrides):
+    now = int(time.time())
+    return {
+        "sub": "user-1",
+        "aud": "authenticated",
+        "iss": ISSUER,
+        "exp": now + 3600,
+        "iat": now,
+        "role": "authenticated",
+        "email": "ayse@example.com",
+        **overrides,
+    }
+
+
+def hs256(**overrides) -> str:
+    return jwt.encode(claims(**overrides), SECRET, algorithm="HS256")
+
+
+@pytest.fixture
+def auth_settings(monkeypatch):
+    monkeypatch.setattr(server, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(server, "SUPABASE_JWT_ISSUER", ISSUER)
+    monkeypatch.setattr(server, "SUPABASE_JWT_AUDIENCE", "authenticated")
+    monkeypatch.setattr(server, "SUPABASE_ANON_KEY", "anon-key")
+
+
+@pytest.fixture
+def supabase_auth(monkeypatch):
+    """Supabase Auth: JWKS document and /auth/v1/user, with request counters"""
+    state = {"jwks": {"keys": []}, "jwks_requests": 0, "user_requests": 0, "user_status": 200}
+
+    def handler(request):
+        if request.url.path.endswith("/.well-known/jwks.json"):
+            state["jwks_requests"] += 1
+            return httpx.Response(200, json=state["jwks"])
+        state["user_requests"] += 1
+        return httpx.Response(state["user_status"], json={"id": "remote-user", "aud": "authenticated"})
+
+    monkeypatch.setitem(
+        server.http_clients._clients, "supabase_auth", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(server, "supabase_jwks", server.SupabaseJWKSCache(ttl=600))
+    return state
+
+
+@pytest.fixture
+def rsa_key(supabase_auth):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    supabase_auth["jwks"] = {"keys": [{**jwk, "kid": "key-1", "alg": "RS256", "use": "sig"}]}
+    return private_key
+
+
+def verify_locally(token: str):
+    return asyncio.run(server.verify_supabase_token_locally(token))
+
+
+def test_hs256_token_is_verified_locally(auth_settings):
+    user = verify_locally(hs256())
+
+    assert user["id"] == "user-1"
+    assert user["email"] == "ayse@example.com"
+    assert user["app_metadata"] == {} and user["user_metadata"] == {}
+
+
+@pytest.mark.parametrize("token", [
+    pytest.param(lambda: hs256(exp=int(time.time()) - 60), id="expired"),
+    pytest.param(lambda: hs256(aud="anon"), id="wrong-audience"),
+    pytest.param(lambda: hs256(iss="https://evil.test/auth/v1"), id="wrong-issuer"),
+    pytest.param(lambda: jwt.encode(claims(), "another-secret-of-sufficient-length!!", algorithm="HS256"), id="bad-signature"),
+    pytest.param(lambda: jwt.encode({k: v for k, v in claims().items() if k != "sub"}, SECRET, algorithm="HS256"),
+                 id="missing-sub"),
+    pytest.param(lambda: jwt.encode(claims(), None, algorithm="none"), id="alg-none"),
+    pytest.param(lambda: "not-a-jwt", id="garbage"),
+])
+def test_invalid_tokens_are_rejected_with_401(auth_settings, token):
+    with pytest.raises(HTTPException) as error:
+        verify_locally(token())
+
+    assert error.value.status_code == 401
+
+
+def test_hs256_without_secret_is_unavailable_locally(auth_settings, monkeypatch):
+    monkeypatch.setattr(server, "SUPABASE_JWT_SECRET", "")
+
+    with pytest.raises(server.LocalAuthUnavailable):
+        verify_locally(hs256())
+
+
+def test_rs256_token_is_verified_with_jwks(auth_settings, supabase_auth, rsa_key):
+    token = jwt.encode(claims(), rsa_key, algorithm="RS256", headers={"kid": "key-1"})
+
+    assert verify_locally(token)["id"] == "user-1"
+    assert verify_locally(token)["id"] == "user-1"
+    assert supabase_auth["jwks_requests"] == 1
+
+
+def test_unknown_kid_refetches_jwks_at_most_once_per_interval(auth_settings, supabase_auth, rsa_key):
+    token = jwt.encode(claims(), rsa_key, algorithm="RS256", headers={"kid": "rotated-away"})
+
+    for _ in range(3):
+        with pytest.raises(server.LocalAuthUnavailable):
+            verify_locally(token)
+
+    # The first call fetches the document, the refresh for the unknown kid is throttled
+    assert supabase_auth["jwks_requests"] == 1
+
+
+def test_rs256_token_signed_by_another_key_is_rejected(auth_settings, supabase_auth, rsa_key):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(claims(), other_key, algorithm="RS256", headers={"kid": "key-1"})
+
+    with pytest.raises(HTTPException) as error:
+        verify_locally(token)
+
+    assert error.value.status_code == 401
+
+
+def verify_header(token: str):
+    return asyncio.run(server.verify_supabase_user(f"Bearer {token}"))
+
+
+def test_hybrid_mode_falls_back_to_remote_when_local_key_is_missing(auth_settings, supabase_auth, monkeypatch):
+    monkeypatch.setattr(server, "SUPABASE_AUTH_MODE", "hybrid")
+    monkeypatch.setattr(server, "SUPABASE_JWT_SECRET", "")
+    monkeypatch.setattr(server, "AUTH_CACHE_ENABLED", False)
+
+    assert verify_header(hs256())["id"] == "remote-user"
+    assert supabase_auth["user_requests"] == 1
+
+
+def test_hybrid_mode_does_not_fall_back_for_invalid_tokens(auth_settings, supabase_auth, monkeypatch):
+    monkeypatch.setattr(server, "SUPABASE_AUTH_MODE", "hybrid")
+
+    with pytest.raises(HTTPException) as error:
+        verify_header(hs256(exp=int(time.time()) - 60))
+
+    assert error.value.status_code == 401
+    assert supabase_auth["user_requests"] == 0
+
+
+def test_local_mode_without_key_is_unavailable_instead_of_remote(auth_settings, supabase_auth, monkeypatch):
+    monkeypatch.setattr(server, "SUPABASE_AUTH_MODE", "local")
+    monkeypatch.setattr(server, "SUPABASE_JWT_SECRET", "")
+
+    with pytest.raises(HTTPException) as error:
+        verify_header(hs256())
+
+    assert error.value.status_code == 503
+    assert supabase_auth["user_requests"] == 0
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import timedelta
+
+import server
+from tests.helpers import drain, expired_running_job
+
+
+TRYON_REQUEST = {
+    "user_id": "u1",
+    "user_image": "http://supabase.test/storage/v1/object/public/wardrobe/u1/person.jpg",
+    "clothing_image": "http://supabase.test/storage/v1/object/public/wardrobe/u1/shirt.jpg",
+    "clothing_category": "tops",
+}
+
+
+def test_expired_tryon_job_is_requeued_and_completed_by_new_worker(db, monkeypatch):
+    calls = []
+
+    async def fake_run_try_on(request, client, background=False):
+        calls.append(request.user_id)
+        return server.TryOnResponse(success=True, result_image_url="http://cdn.test/result.jpg")
+
+    monkeypatch.setattr(server, "run_try_on", fake_run_try_on)
+    queue = server.TryOnJobQueue(workers=1)
+
+    async def scenario():
+        await db.tryon_jobs.insert_one(expired_running_job("job-1", attempts=1, request=TRYON_REQUEST))
+        await queue.recover()
+        requeued = await queue.get("job-1")
+        await drain(queue)
+        return requeued, await queue.get("job-1")
+
+    requeued, final = asyncio.run(scenario())
+
+    assert requeued["status"] == "queued"
+    assert "worker_id" not in requeued and "lease_expires_at" not in requeued
+    assert queue.recovered == 1
+    assert calls == ["u1"]
+    assert final["status"] == "succeeded"
+    assert final["worker_id"] == queue.worker_id
+    assert final["attempts"] == 2
+    assert final["result"]["result_image_url"] == "http://cdn.test/result.jpg"
+
+
+def test_tryon_job_past_max_attempts_fails_instead_of_requeueing(db):
+    queue = server.TryOnJobQueue(workers=1)
+
+    async def scenario():
+        await db.tryon_jobs.insert_one(
+            expired_running_job("job-1", attempts=server.TRYON_JOB_MAX_ATTEMPTS, request=TRYON_REQUEST)
+        )
+        await queue.recover()
+        return await queue.get("job-1")
+
+    job = asyncio.run(scenario())
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Job interrupted too many times"
+    assert queue._queue.empty()
+
+
+def test_tryon_result_is_discarded_after_lease_is_lost(db, monkeypatch):
+    async def slow_run_try_on(request, client, background=False):
+        # Lease expired mid-call and another worker claimed the job
+        await db.tryon_jobs.update_one({"id": "job-1"}, {"$set": {"worker_id": "other-worker"}})
+        return server.TryOnResponse(success=True, result_image_url="http://cdn.test/stale.jpg")
+
+    monkeypatch.setattr(server, "run_try_on", slow_run_try_on)
+    queue = server.TryOnJobQueue(workers=1)
+
+    async def scenario():
+        await db.tryon_jobs.insert_one(expired_running_job("job-1", attempts=0, request=TRYON_REQUEST))
+        await queue.recover()
+        await drain(queue)
+        return await queue.get("job-1")
+
+    job = asyncio.run(scenario())
+
+    assert job["status"] == "running"
+    assert job["worker_id"] == "other-worker"
+    assert job.get("result") is None
+    assert queue.completed == 0
+
+
+def test_tryon_heartbeat_renews_lease_while_running(db, monkeypatch):
+    monkeypatch.setattr(server, "TRYON_JOB_LEASE_SECONDS", 3)
+    leases = []
+
+    async def slow_run_try_on(request, client, background=False):
+        leases.append((await db.tryon_jobs.find_one({"id": "job-1"}))["lease_expires_at"])
+        await asyncio.sleep(1.3)
+        leases.append((await db.tryon_jobs.find_one({"id": "job-1"}))["lease_expires_at"])
+        return server.TryOnResponse(success=True, result_image_url="http://cdn.test/result.jpg")
+
+    monkeypatch.setattr(server, "run_try_on", slow_run_try_on)
+    queue = server.TryOnJobQueue(workers=1)
+
+    async def scenario():
+        await db.tryon_jobs.insert_one(expired_running_job("job-1", attempts=0, request=TRYON_REQUEST))
+        await queue.recover()
+        await drain(queue)
+        return await queue.get("job-1")
+
+    job = asyncio.run(scenario())
+
+    claimed, renewed = leases
+    assert renewed - claimed >= timedelta(seconds=0.9)
+    assert job["status"] == "succeeded"
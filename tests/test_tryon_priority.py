@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+@pytest.fixture
+def profiles(monkeypatch):
+    """profiles REST endpoint; set state["fail"] to simulate an outage"""
+    state = {"requests": 0, "fail": False, "tiers": {}}
+
+    def handler(request):
+        state["requests"] += 1
+        if state["fail"]:
+            raise httpx.ConnectError("supabase down", request=request)
+        user_id = request.url.params["id"][len("eq."):]
+        tier = state["tiers"].get(user_id)
+        return httpx.Response(200, json=[{"subscription_tier": tier}] if tier else [])
+
+    monkeypatch.setitem(
+        server.http_clients._clients, "supabase_rest", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(server, "subscription_tiers", server.TTLCache(maxsize=100))
+    monkeypatch.setattr(server, "subscription_tier_lookups", {"failures": 0, "skipped": 0, "backoff_until": 0.0})
+    return state
+
+
+def lookup(*user_ids):
+    async def run():
+        return [await server.fetch_subscription_tier(user_id) for user_id in user_ids]
+
+    return asyncio.run(run())
+
+
+def test_successful_lookups_are_cached(profiles):
+    profiles["tiers"] = {"u1": "premium"}
+
+    assert lookup("u1", "u1", "u2") == ["premium", "premium", None]
+    assert profiles["requests"] == 2
+
+
+def test_failed_lookup_backs_off_for_every_user(profiles):
+    profiles["fail"] = True
+
+    assert lookup("u1", "u1", "u2", "u3") == [None, None, None, None]
+    assert profiles["requests"] == 1
+    assert server.subscription_tier_lookups["skipped"] == 3
+
+
+def test_lookups_resume_after_backoff(profiles, monkeypatch):
+    monkeypatch.setattr(server, "TRYON_TIER_FAILURE_TTL", 0)
+    profiles["fail"] = True
+    lookup("u1")
+    profiles["fail"] = False
+    profiles["tiers"] = {"u1": "free"}
+
+    assert lookup("u1") == ["free"]
+    assert profiles["requests"] == 2
+
+
+@pytest.mark.parametrize("is_free_trial, tier, lane", [
+    (False, "premium", "premium"),
+    (False, "Free", "free"),
+    (True, "premium", "trial"),
+    (False, None, server.TRYON_LOWEST_LANE),
+    (False, "enterprise", server.TRYON_LOWEST_LANE),
+])
+def test_priority_lane_comes_from_server_side_tier(is_free_trial, tier, lane):
+    assert server.tryon_priority_lane(is_free_trial, tier) == lane
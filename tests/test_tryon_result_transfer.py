@@ -0,0 +1,60 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+
+import server
+
+RESULT = b"\xff\xd8" + bytes(range(256)) * 400 + b"\xff\xd9"
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """Captures what stream_result_to_storage hands to Storage"""
+    captured = []
+
+    async def upload(bucket, path, data, content_type="image/jpeg", content_length=None, **kwargs):
+        body = b"".join([chunk async for chunk in data])
+        captured.append({"path": path, "body": body, "content_length": content_length})
+        return path
+
+    monkeypatch.setattr(server.storage, "upload", upload)
+    return captured
+
+
+def cdn_client(body: bytes, **headers) -> httpx.AsyncClient:
+    def handler(request):
+        return httpx.Response(200, content=body, headers={"content-type": "image/jpeg", **headers})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def transfer(client: httpx.AsyncClient) -> str:
+    return asyncio.run(server.stream_result_to_storage("https://cdn.test/result.jpg", "wardrobe", "u1/r.jpg", client))
+
+
+def test_identity_response_forwards_content_length(uploads):
+    transfer(cdn_client(RESULT))
+
+    assert uploads[0]["body"] == RESULT
+    assert uploads[0]["content_length"] == len(RESULT)
+
+
+def test_encoded_response_is_uploaded_decoded_without_content_length(uploads):
+    compressed = gzip.compress(RESULT)
+    assert len(compressed) != len(RESULT)
+
+    transfer(cdn_client(compressed, **{"content-encoding": "gzip"}))
+
+    assert uploads[0]["body"] == RESULT
+    assert uploads[0]["content_length"] is None
+
+
+def test_declared_length_over_limit_is_rejected_before_upload(uploads, monkeypatch):
+    monkeypatch.setattr(server, "TRYON_RESULT_MAX_BYTES", 1024)
+
+    with pytest.raises(server.StorageError):
+        transfer(cdn_client(RESULT))
+
+    assert uploads == []